@@ -3,6 +3,7 @@ from telegram import Update
 from telegram.constants import ChatType
 from telegram.ext import ContextTypes
 from storage import load_admins, save_admins
+from user_directory import resolve_username
 
 
 def is_owner(user_id: Optional[int]) -> bool:
@@ -35,6 +36,11 @@ def extract_target_user_id_from_message(message) -> Optional[int]:
         for ent in message.entities:
             if ent.type == "text_mention" and ent.user:
                 return ent.user.id
+            if ent.type == "mention":
+                mention = (message.text or "")[ent.offset: ent.offset + ent.length]
+                user_id = resolve_username(mention)
+                if user_id:
+                    return user_id
     parts = (message.text or "").strip().split()
     if len(parts) > 1 and parts[1].isdigit():
         return int(parts[1])
@@ -0,0 +1,100 @@
+"""Предфильтр входящих обновлений: чёрный список чатов и ограничение частоты команд и кнопок."""
+import logging
+import time
+from typing import Dict, Hashable
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from config import BLOCKED_CHAT_IDS
+
+logger = logging.getLogger(__name__)
+
+# Лимиты: (размер всплеска, пополнение в секунду)
+USER_COMMAND_LIMIT = (5, 0.5)
+USER_CALLBACK_LIMIT = (12, 2.0)
+CHAT_LIMIT = (30, 3.0)
+# Когда корзин становится больше, из памяти выбрасываются давно неиспользуемые
+MAX_BUCKETS = 10000
+
+# Чёрный список чатов (можно менять на лету)
+blocked_chats = set(BLOCKED_CHAT_IDS)
+
+
+class TokenBucket:
+    """Корзина токенов: каждое действие тратит токен, токены восполняются со временем"""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def is_idle(self, now: float) -> bool:
+        """Корзина уже восполнилась бы полностью — её можно забыть"""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+_buckets: Dict[Hashable, TokenBucket] = {}
+
+
+def is_blocked_chat_id(chat_id: int) -> bool:
+    return chat_id in blocked_chats
+
+
+def _take(key: Hashable, limit, now: float) -> bool:
+    bucket = _buckets.get(key)
+    if bucket is None:
+        if len(_buckets) >= MAX_BUCKETS:
+            _sweep(now)
+        bucket = _buckets[key] = TokenBucket(*limit, now)
+    return bucket.take(now)
+
+
+def _sweep(now: float) -> None:
+    for key in [key for key, bucket in _buckets.items() if bucket.is_idle(now)]:
+        del _buckets[key]
+
+
+def _is_command(update: Update) -> bool:
+    message = update.message or update.edited_message
+    return bool(message and message.text and message.text.startswith("/"))
+
+
+async def antispam_filter(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Группа -100: отсекает лишнее до того, как обработчики начнут читать файлы и ходить в API"""
+    chat = update.effective_chat
+    if chat and chat.id in blocked_chats:
+        raise ApplicationHandlerStop()
+
+    query = update.callback_query
+    if not query and not _is_command(update):
+        return  # обычные сообщения не ограничиваем — по ним только собирается статистика
+
+    user = update.effective_user
+    now = time.monotonic()
+    allowed = True
+    if user:
+        user_limit = USER_CALLBACK_LIMIT if query else USER_COMMAND_LIMIT
+        allowed = _take(("cb" if query else "cmd", user.id), user_limit, now)
+    if allowed and chat:
+        allowed = _take(("chat", chat.id), CHAT_LIMIT, now)
+    if allowed:
+        return
+
+    if query:
+        try:
+            await query.answer("⏳ Слишком часто, подождите немного")
+        except Exception as e:
+            logger.debug("Failed to answer throttled callback: %s", e)
+    logger.debug("Throttled update from user %s in chat %s", user.id if user else None, chat.id if chat else None)
+    raise ApplicationHandlerStop()
@@ -0,0 +1,303 @@
+"""Монте-Карло блекджека бота: матожидание выплат по стратегиям и преимущество казино.
+
+    python -m benchmarks.blackjack_sim [--hands 2000000] [--players 1] [--stand-on 12,13,14,15,16,17,18]
+                                       [--decks N] [--bet 100] [--batch 200000] [--seed 1]
+                                       [--engine numpy|python|both] [--json report.json]
+
+Правила те же, что в blackjack.py: шуз из --decks колод (по умолчанию BLACKJACK_DECKS, туз 11),
+раздача как в start_game (игрокам, дилеру, игрокам, дилеру), очки как в add_card_score
+(тузы по одному становятся 1, пока перебор), блекджек — 21 с раздачи, дилер берёт до 17
+(на мягких 17 стоит), выплаты как в payout() — включая int() для 2.5x.
+Стратегия «--stand-on N»: брать карту, пока очков меньше N (в replay игроки стоят на 16).
+
+Движок numpy считает партии пачками по --batch столов, каждому столу — свежий шуз; без numpy —
+эталонный движок на самих BlackjackGame, Shoe и payout(): один шуз на все раунды, перемешивание
+после отрезной карты, как за столом в чате (в десятки раз медленнее, по умолчанию и рук меньше).
+Для стратегий с постоянным порогом отрезная карта на матожидание почти не влияет.
+Обоим движкам для каждой стратегии даётся один и тот же --seed: стратегии играют
+одинаковыми колодами, и разница между ними меньше зашумлена.
+
+numpy — необязательная зависимость бенчмарков: pip install -r requirements-bench.txt.
+--engine both прогоняет оба движка и сверяет их: матожидания каждой стратегии должны
+совпасть в пределах трёх стандартных ошибок разницы, иначе выход с кодом 1.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+try:
+    import numpy as np
+except ImportError:  # только эталонный движок
+    np = None
+
+DEALER_STANDS_ON = 17
+DEFAULT_NUMPY_HANDS = 2_000_000
+DEFAULT_PYTHON_HANDS = 50_000
+# Допуск сверки движков — в стандартных ошибках разницы матожиданий
+COMPARE_SIGMAS = 3.0
+
+
+class Tally:
+    """Итоги рук одной стратегии: исходы и сумма выигрыша (для матожидания и разброса)"""
+
+    def __init__(self, stand_on: int, bet: int):
+        self.stand_on = stand_on
+        self.bet = bet
+        self.hands = 0
+        self.outcomes = {"blackjack": 0, "win": 0, "push": 0, "loss": 0}
+        self.net = 0.0
+        self.net_sq = 0.0
+        self.seconds = 0.0
+
+    @property
+    def ev(self) -> float:
+        """Средний выигрыш игрока за руку в монетах (отрицательный — монеты уходят казино)"""
+        return self.net / self.hands if self.hands else 0.0
+
+    @property
+    def stderr(self) -> float:
+        if self.hands < 2:
+            return 0.0
+        variance = max(0.0, self.net_sq / self.hands - self.ev ** 2)
+        return math.sqrt(variance / self.hands)
+
+    @property
+    def ci95(self) -> float:
+        return 1.96 * self.stderr
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stand_on": self.stand_on,
+            "hands": self.hands,
+            "ev_coins": self.ev,
+            "house_edge_pct": -self.ev / self.bet * 100,
+            "ci95_pct": self.ci95 / self.bet * 100,
+            "outcomes": {name: count / self.hands for name, count in self.outcomes.items()},
+            "hands_per_s": self.hands / self.seconds if self.seconds else 0.0,
+        }
+
+
+# ---- эталонный движок: сами классы и функции бота ----
+
+def simulate_python(tally: Tally, hands: int, players: int, decks: int, seed: int) -> None:
+    from blackjack import BlackjackGame, payout
+    from blackjack_shoe import Shoe
+
+    shoe = Shoe(decks, rng=random.Random(seed))
+    for _ in range(math.ceil(hands / players)):
+        game = BlackjackGame(0, 0)
+        for user_id in range(players):
+            game.add_player(user_id, "", "")
+        shoe.start_round()
+        game.start_game(shoe)
+        for player in game.players:
+            while not player.is_blackjack and player.score < tally.stand_on:
+                player.add_card(shoe.draw())
+            player.is_bust = player.score > 21
+        while game.dealer_score < DEALER_STANDS_ON:
+            game.add_dealer_card(shoe.draw())
+        for player in game.players:
+            player.bet = tally.bet
+            returned = payout(player, game.dealer_score)
+            if player.is_bust or not returned:
+                outcome = "loss"
+            elif player.is_blackjack and game.dealer_score != 21:
+                outcome = "blackjack"
+            else:
+                outcome = "win" if returned == 2 * tally.bet else "push"
+            tally.outcomes[outcome] += 1
+            net = returned - tally.bet
+            tally.net += net
+            tally.net_sq += net * net
+            tally.hands += 1
+
+
+# ---- векторный движок ----
+
+def _shoe_values(decks: int) -> "np.ndarray":
+    from blackjack import CARD_VALUES
+
+    # Очки карт шуза бота; порядок не важен — каждая партия его перемешивает
+    return np.tile(np.array(CARD_VALUES, dtype=np.int16), decks)
+
+
+def _score(total: "np.ndarray", aces: "np.ndarray") -> "np.ndarray":
+    # add_card_score: пока перебор, туз за тузом становится 1 — столько тузов, сколько нужно, но не больше, чем есть
+    return total - 10 * np.clip((total - 12) // 10, 0, aces)
+
+
+def _draw(rng, shoes, rows, position) -> "np.ndarray":
+    """Карта с позиции position в шузах rows — Фишер-Йейтс по ходу игры.
+
+    Перемешивать весь шуз незачем: за партию сдаётся меньше трети колоды. Карта на позицию
+    выбирается случайно из ещё не сданных — это та же равномерная перестановка.
+    """
+    swap = rng.integers(position, shoes.shape[1], size=len(rows))
+    card = shoes[rows, swap]
+    shoes[rows, swap] = shoes[rows, position]
+    shoes[rows, position] = card
+    return card
+
+
+def _draw_until(rng, shoes, pointer, total, aces, stop_at: int) -> None:
+    """Брать карты, пока очков меньше stop_at и шуз не кончился (массивы меняются на месте)"""
+    while True:
+        active = np.flatnonzero((_score(total, aces) < stop_at) & (pointer < shoes.shape[1]))
+        if not active.size:
+            return
+        card = _draw(rng, shoes, active, pointer[active])
+        total[active] += card
+        aces[active] += card == 11
+        pointer[active] += 1
+
+
+def simulate_numpy_batch(tally: Tally, rng, shoe: "np.ndarray", tables: int, players: int) -> None:
+    shoes = np.tile(shoe, (tables, 1))
+    rows = np.arange(tables)
+    # Раздача как в start_game: по карте игрокам, дилеру, ещё по карте игрокам, вторая дилеру
+    dealt = np.stack([_draw(rng, shoes, rows, position) for position in range(2 * players + 2)])
+    first, second = dealt[:players], dealt[players + 1:2 * players + 1]
+    total = first + second
+    aces = (first == 11).astype(np.int16) + (second == 11)
+    dealer_total = dealt[players] + dealt[2 * players + 1]
+    dealer_aces = (dealt[players] == 11).astype(np.int16) + (dealt[2 * players + 1] == 11)
+    pointer = np.full(tables, 2 * players + 2, dtype=np.int16)
+    blackjack = _score(total, aces) == 21
+
+    for index in range(players):
+        _draw_until(rng, shoes, pointer, total[index], aces[index], tally.stand_on)
+    _draw_until(rng, shoes, pointer, dealer_total, dealer_aces, DEALER_STANDS_ON)
+
+    score = _score(total, aces)
+    dealer = _score(dealer_total, dealer_aces)
+    bust = score > 21
+    # Порядок условий — как в payout()
+    outcome = np.select(
+        [bust, blackjack & (dealer != 21), (dealer > 21) | (score > dealer), score == dealer],
+        [3, 0, 1, 2], 3,
+    )
+    returned = np.array([int(tally.bet * 2.5), 2 * tally.bet, tally.bet, 0], dtype=np.int64)
+    net = returned[outcome] - tally.bet
+    counts = np.bincount(outcome.ravel(), minlength=4)
+    for name, count in zip(("blackjack", "win", "push", "loss"), counts):
+        tally.outcomes[name] += int(count)
+    tally.net += float(net.sum())
+    tally.net_sq += float((net * net).sum())
+    tally.hands += net.size
+
+
+def simulate_numpy(tally: Tally, hands: int, players: int, decks: int, seed: int, batch: int) -> None:
+    rng = np.random.default_rng(seed)
+    shoe = _shoe_values(decks)
+    tables = math.ceil(hands / players)
+    while tables > 0:
+        size = min(batch, tables)
+        simulate_numpy_batch(tally, rng, shoe, size, players)
+        tables -= size
+
+
+# ---- запуск ----
+
+def run_engine(engine: str, strategies: List[int], hands: int, players: int, decks: int, bet: int,
+               seed: int, batch: int) -> List[Tally]:
+    tallies = []
+    for stand_on in strategies:
+        tally = Tally(stand_on, bet)
+        started = time.perf_counter()
+        if engine == "numpy":
+            simulate_numpy(tally, hands, players, decks, seed, batch)
+        else:
+            simulate_python(tally, hands, players, decks, seed)
+        tally.seconds = time.perf_counter() - started
+        tallies.append(tally)
+    return tallies
+
+
+def compare_engines(numpy_tallies: List[Tally], python_tallies: List[Tally]) -> bool:
+    """Сверка движков по каждой стратегии; True, если все матожидания совпали в пределах допуска"""
+    print(f"{'stand on':>8} {'numpy ev':>9} {'python ev':>9} {'diff':>7} {'limit':>7}")
+    agree = True
+    for fast, slow in zip(numpy_tallies, python_tallies):
+        diff = fast.ev - slow.ev
+        limit = COMPARE_SIGMAS * math.hypot(fast.stderr, slow.stderr)
+        ok = abs(diff) <= limit
+        agree = agree and ok
+        print(f"{fast.stand_on:>8} {fast.ev:>9.2f} {slow.ev:>9.2f} {diff:>7.2f} {limit:>7.2f}{'' if ok else '  MISMATCH'}")
+    print("engines agree" if agree else "engines disagree", file=sys.stdout if agree else sys.stderr)
+    return agree
+
+
+def print_report(tallies: List[Tally], engine: str, players: int, decks: int, bet: int) -> None:
+    print(f"engine: {engine}, players per table: {players}, decks: {decks}, bet: {bet}")
+    print(f"{'stand on':>8} {'hands':>10} {'ev/hand':>9} {'edge %':>7} {'±95%':>6} "
+          f"{'bj %':>6} {'win %':>6} {'push %':>6} {'loss %':>6} {'hands/s':>11}")
+    for tally in tallies:
+        report = tally.to_dict()
+        shares = report["outcomes"]
+        print(f"{tally.stand_on:>8} {tally.hands:>10} {report['ev_coins']:>9.2f} {report['house_edge_pct']:>7.2f} "
+              f"{report['ci95_pct']:>6.2f} {shares['blackjack'] * 100:>6.2f} {shares['win'] * 100:>6.2f} "
+              f"{shares['push'] * 100:>6.2f} {shares['loss'] * 100:>6.2f} {report['hands_per_s']:>11.0f}")
+    best = max(tallies, key=lambda tally: tally.ev)
+    print(f"best strategy: stand on {best.stand_on}, casino keeps {-best.ev:.2f} coins per hand of {bet}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hands", type=int, default=0,
+                        help=f"рук на стратегию (по умолчанию {DEFAULT_NUMPY_HANDS} для numpy, {DEFAULT_PYTHON_HANDS} для python)")
+    parser.add_argument("--players", type=int, default=1, help="игроков за столом (1-5), делят одну колоду")
+    parser.add_argument("--stand-on", default="12,13,14,15,16,17,18",
+                        help="стратегии: на скольких очках перестать брать карты")
+    parser.add_argument("--decks", type=int, default=0, help="колод в шузе (по умолчанию BLACKJACK_DECKS)")
+    parser.add_argument("--bet", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=200_000, help="столов в одной пачке numpy")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--engine", choices=("numpy", "python", "both"), default="numpy",
+                        help="both — оба движка и сверка матожиданий (нужен numpy)")
+    parser.add_argument("--json", help="записать отчёт в файл")
+    args = parser.parse_args()
+
+    from blackjack import MAX_PLAYERS
+    from config import BLACKJACK_DECKS
+
+    if not 1 <= args.players <= MAX_PLAYERS:
+        parser.error(f"--players must be between 1 and {MAX_PLAYERS}")
+    strategies = [int(value) for value in args.stand_on.split(",")]
+    if any(not 1 <= value <= 21 for value in strategies):
+        parser.error("--stand-on values must be between 1 and 21")
+    decks = args.decks or BLACKJACK_DECKS
+    engine = args.engine
+    if engine == "both" and np is None:
+        parser.error("--engine both needs numpy (pip install -r requirements-bench.txt)")
+    if engine == "numpy" and np is None:
+        print("numpy is not installed, falling back to the python engine "
+              "(pip install -r requirements-bench.txt)", file=sys.stderr)
+        engine = "python"
+
+    engines = ("numpy", "python") if engine == "both" else (engine,)
+    reports = {}
+    for name in engines:
+        hands = args.hands or (DEFAULT_NUMPY_HANDS if name == "numpy" else DEFAULT_PYTHON_HANDS)
+        reports[name] = run_engine(name, strategies, hands, args.players, decks, args.bet, args.seed, args.batch)
+        print_report(reports[name], name, args.players, decks, args.bet)
+
+    agree = compare_engines(reports["numpy"], reports["python"]) if engine == "both" else True
+    if args.json:
+        report = {"engine": engine, "players": args.players, "decks": decks, "bet": args.bet}
+        if engine == "both":
+            report["strategies"] = {name: [tally.to_dict() for tally in tallies] for name, tallies in reports.items()}
+            report["engines_agree"] = agree
+        else:
+            report["strategies"] = [tally.to_dict() for tally in reports[engine]]
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if not agree:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
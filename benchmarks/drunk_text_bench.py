@@ -0,0 +1,57 @@
+"""Бенчмарк движка пьяного текста.
+
+    python -m benchmarks.drunk_text_bench [--sessions 20000]
+
+Меряет отрисовку каждого уровня и целые «попойки» (все напитки, уровни 1..MAX_DRINKS).
+"""
+import argparse
+import time
+
+import drunk_text
+from drinking import COMPILED_DRUNK_MESSAGES, DRINKS, DRUNK_MESSAGES, MAX_DRINKS, apply_drunk_effect
+
+
+def bench_levels(iterations: int) -> None:
+    print(f"{'level':>5} {'renders':>9} {'µs/render':>10}")
+    for level, template in COMPILED_DRUNK_MESSAGES.items():
+        started = time.perf_counter()
+        for seed in range(iterations):
+            drunk_text.render(template, level, seed)
+        elapsed = time.perf_counter() - started
+        print(f"{level:>5} {iterations:>9} {elapsed / iterations * 1e6:>10.2f}")
+
+
+def bench_sessions(sessions: int) -> None:
+    renders = 0
+    started = time.perf_counter()
+    for session in range(sessions):
+        for drink_type in DRINKS:
+            for level in range(1, MAX_DRINKS + 1):
+                apply_drunk_effect(DRUNK_MESSAGES[level]["text"], level, drink_type, f"{session}:{level}")
+                renders += 1
+    elapsed = time.perf_counter() - started
+    print(f"sessions: {sessions} x {len(DRINKS)} drinks, {renders} renders, "
+          f"{elapsed:.3f}s total, {elapsed / renders * 1e6:.2f} µs/render")
+
+
+def check_reproducible() -> None:
+    for level, template in COMPILED_DRUNK_MESSAGES.items():
+        for seed in range(100):
+            result = drunk_text.render(template, level, seed)
+            assert result == drunk_text.render(template, level, seed), (level, seed)
+            # Результат должен оставаться корректной разметкой
+            drunk_text.compile_template(result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20000)
+    args = parser.parse_args()
+
+    check_reproducible()
+    bench_levels(args.sessions * len(DRINKS))
+    bench_sessions(args.sessions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Локальная заглушка Bot API для бенчмарков.
+
+Отвечает заготовленными ответами на методы, которыми пользуется бот, запоминает
+последние инлайн-кнопки в каждом чате (чтобы сценарии могли их «нажимать»)
+и по заказу отвечает 429 Too Many Requests на каждый N-й запрос.
+Обновления, добавленные push_update, отдаются long polling'ом (getUpdates) с учётом
+allowed_updates, как это делает Telegram.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {
+    "id": 777000001,
+    "is_bot": True,
+    "first_name": "Bench",
+    "username": "bench_bot",
+    "can_join_groups": True,
+    "can_read_all_group_messages": False,
+    "supports_inline_queries": False,
+}
+
+# Методы, которые никогда не отвечают 429 (без них приложение не запустится)
+NEVER_LIMITED = {"getMe", "deleteWebhook", "setWebhook", "setMyCommands", "getUpdates"}
+MESSAGE_METHODS = {"sendMessage", "sendPhoto", "sendAnimation", "sendDocument", "copyMessage"}
+EDIT_METHODS = {"editMessageText", "editMessageCaption", "editMessageReplyMarkup"}
+# Что Telegram присылает, если allowed_updates не задан: всё, кроме этих типов
+NOT_DEFAULT_UPDATES = {"chat_member", "message_reaction", "message_reaction_count"}
+
+
+def update_type(update: Dict[str, Any]) -> str:
+    return next(key for key in update if key != "update_id")
+
+
+def _parse_multipart(body: bytes, boundary: str) -> Dict[str, str]:
+    params = {}
+    for part in body.split(b"--" + boundary.encode()):
+        head, sep, value = part.partition(b"\r\n\r\n")
+        if not sep:
+            continue
+        for line in head.decode("utf-8", "replace").split("\r\n"):
+            if line.lower().startswith("content-disposition") and 'name="' in line:
+                name = line.split('name="', 1)[1].split('"', 1)[0]
+                # Содержимое файлов не нужно — достаточно знать, что файл был
+                is_file = "filename=" in line
+                params[name] = '"file"' if is_file else value.rstrip(b"\r\n").decode("utf-8", "replace")
+    return params
+
+
+def _parse_body(headers: Dict[str, str], body: bytes) -> Dict[str, Any]:
+    content_type = headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        raw = _parse_multipart(body, content_type.split("boundary=", 1)[1].strip('"'))
+    elif content_type.startswith("application/json"):
+        return json.loads(body or b"{}")
+    else:
+        raw = {key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()}
+    # Bot API принимает сложные параметры строками JSON
+    params: Dict[str, Any] = {}
+    for key, value in raw.items():
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+class FakeBotApi:
+    """HTTP-сервер на 127.0.0.1, похожий на api.telegram.org для нужд бота"""
+
+    def __init__(self, rate_limit_every: int = 0, retry_after: int = 1, latency: float = 0.0):
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.rate_limited: Counter = Counter()
+        # chat_id -> {message_id: callback_data кнопок} для сообщений с кнопками
+        self.keyboards: Dict[int, Dict[int, List[str]]] = {}
+        self._next_message_id = 1000
+        self._total = 0
+        # Последние allowed_updates из getUpdates или setWebhook (None — по умолчанию Telegram)
+        self.allowed_updates: Optional[List[str]] = None
+        self.webhook: Dict[str, Any] = {}
+        # Обновления, ждущие getUpdates, и сколько отброшено из-за allowed_updates
+        self.pending_updates: List[Dict[str, Any]] = []
+        self.filtered_updates: Counter = Counter()
+        self._new_updates = asyncio.Event()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.port = 0
+
+    @property
+    def base_url(self) -> str:
+        """Значение для ApplicationBuilder.base_url (токен дописывается в конец)"""
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def buttons(self, chat_id: int, prefix: str = "") -> Tuple[Optional[int], List[str]]:
+        """Кнопки самого нового сообщения чата, у которого есть callback_data с началом prefix"""
+        messages = self.keyboards.get(chat_id, {})
+        for message_id in sorted(messages, reverse=True):
+            datas = [data for data in messages[message_id] if data.startswith(prefix)]
+            if datas:
+                return message_id, datas
+        return None, []
+
+    def allows(self, update: Dict[str, Any]) -> bool:
+        """Доставил бы Telegram это обновление при текущем allowed_updates"""
+        kind = update_type(update)
+        if not self.allowed_updates:
+            return kind not in NOT_DEFAULT_UPDATES
+        return kind in self.allowed_updates
+
+    def push_update(self, update: Dict[str, Any]) -> None:
+        """Поставить обновление в очередь для getUpdates"""
+        self.pending_updates.append(update)
+        self._new_updates.set()
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if "allowed_updates" in params:
+            self.allowed_updates = params["allowed_updates"] or None
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+        while True:
+            ready = []
+            for update in self.pending_updates:
+                if update["update_id"] < offset:
+                    continue  # подтверждено через offset
+                if self.allows(update):
+                    ready.append(update)
+                else:
+                    self.filtered_updates[update_type(update)] += 1
+            self.pending_updates = ready
+            remaining = deadline - time.monotonic()
+            if ready or remaining <= 0:
+                return ready[:limit]
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # httpx держит соединения открытыми, поэтому обслуживаем запросы в цикле
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                path = request_line.decode("latin-1").split()[1]
+                status, payload = await self._dispatch(path.rsplit("/", 1)[-1], _parse_body(headers, body))
+                data = json.dumps(payload, ensure_ascii=False).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            logger.exception("Fake Bot API failed to serve a request")
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, params: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        self.calls[method] += 1
+        self._total += 1
+        if method == "getUpdates":
+            # Long polling ждёт обновления, и задержка сети приходится на путь ответа к боту
+            result = await self._get_updates(params)
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            return "200 OK", {"ok": True, "result": result}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if (self.rate_limit_every and method not in NEVER_LIMITED
+                and self._total % self.rate_limit_every == 0):
+            self.rate_limited[method] += 1
+            return "429 Too Many Requests", {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }
+        try:
+            result = self._result(method, params)
+        except LookupError as e:
+            return "400 Bad Request", {"ok": False, "error_code": 400, "description": f"Bad Request: {e}"}
+        return "200 OK", {"ok": True, "result": result}
+
+    def _message(self, chat_id: Any, message_id: int, params: Dict[str, Any]) -> Dict[str, Any]:
+        chat_id = int(chat_id)
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup", "title": f"chat {chat_id}"},
+            "from": BOT_USER,
+        }
+        if "text" in params:
+            message["text"] = str(params["text"])
+        if "caption" in params:
+            message["caption"] = str(params["caption"])
+        if "photo" in params:
+            message["photo"] = [{"file_id": "bench", "file_unique_id": "bench", "width": 1, "height": 1}]
+        markup = params.get("reply_markup")
+        if isinstance(markup, dict) and "inline_keyboard" in markup:
+            message["reply_markup"] = markup
+            datas = [button["callback_data"] for row in markup["inline_keyboard"]
+                     for button in row if "callback_data" in button]
+            self.keyboards.setdefault(chat_id, {})[message_id] = datas
+        else:
+            # Правка без reply_markup убирает кнопки
+            self.keyboards.get(chat_id, {}).pop(message_id, None)
+        return message
+
+    def _result(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == "getMe":
+            return BOT_USER
+        if method in MESSAGE_METHODS:
+            self._next_message_id += 1
+            return self._message(params["chat_id"], self._next_message_id, params)
+        if method in EDIT_METHODS:
+            if "inline_message_id" in params:
+                return True
+            return self._message(params["chat_id"], int(params["message_id"]), params)
+        if method in ("deleteMessage", "deleteMessages"):
+            message_ids = params.get("message_ids") or [params.get("message_id")]
+            for message_id in message_ids:
+                self.keyboards.get(int(params["chat_id"]), {}).pop(int(message_id), None)
+            return True
+        if method == "getChat":
+            chat_id = str(params["chat_id"])
+            if chat_id.startswith("@"):
+                raise LookupError("chat not found")
+            chat_id = int(chat_id)
+            return {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup", "title": f"chat {chat_id}"}
+        if method == "getChatMember":
+            user_id = int(params["user_id"])
+            return {"status": "member", "user": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}}
+        if method == "getChatAdministrators":
+            return []
+        if method == "setWebhook":
+            self.webhook = params
+            self.allowed_updates = params.get("allowed_updates") or None
+            return True
+        return True
@@ -0,0 +1,173 @@
+"""Бенчмарк холодного старта: разбор `python -X importtime` для import main и сборки приложения.
+
+    python -m benchmarks.import_time [--runs 5] [--top 15] [--max-ms 0]
+    python -m benchmarks.import_time --save-baseline   # запомнить текущие цифры
+    python -m benchmarks.import_time                   # сравнить с сохранёнными
+
+Каждый прогон — новый процесс: import main, затем bootstrap_application() на временной
+папке данных. Печатаются медианы, самые тяжёлые пакеты и что импортирует сборка.
+Код выхода 1, если при старте импортировалось отложенное (g4f, requests, модули ленивых
+обработчиков) или время выросло больше чем на --tolerance от сохранённого (или --max-ms).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Set
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE_FILE = Path(__file__).resolve().parent / "import_time_baseline.json"
+# Импортируются только при первом пожелании (greetings) — при старте их быть не должно
+DEFERRED_IMPORTS = {"g4f", "requests", "aiohttp", "generate_image"}
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.bootstrap_application("123456:BENCHMARK")
+built = time.perf_counter()
+import handler_registry
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "bootstrap_ms": (built - imported) * 1000,
+    "lazy_modules": sorted(handler_registry.lazy_modules),
+}))
+"""
+
+
+class ImportEntry(NamedTuple):
+    name: str
+    depth: int
+    self_us: int
+    cumulative_us: int
+
+
+def parse_importtime(stderr: str) -> List[ImportEntry]:
+    """Строки вида `import time:   self |  cumulative |   пакет` в порядке завершения импорта"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # заголовок
+        raw_name = parts[2].rstrip()
+        name = raw_name.lstrip()
+        depth = (len(raw_name) - len(name) - 1) // 2
+        entries.append(ImportEntry(name, depth, int(parts[0]), int(parts[1])))
+    return entries
+
+
+def run_probe() -> Dict:
+    with tempfile.TemporaryDirectory(prefix="bot-import-") as data_dir:
+        env = dict(os.environ, BOT_DATA_DIR=data_dir, LOG_LEVEL="WARNING", PYTHONDONTWRITEBYTECODE="1")
+        env.pop("RECORD_UPDATES_DIR", None)
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROBE],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=False,
+        )
+    if proc.returncode != 0:
+        sys.exit(f"probe failed:\n{proc.stderr[-3000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["entries"] = parse_importtime(proc.stderr)
+    return result
+
+
+def analyze(entries: List[ImportEntry]) -> Dict:
+    """Собственное время по пакетам верхнего уровня в поддереве main и импорты после него"""
+    main_index = next(i for i, e in enumerate(entries) if e.name == "main" and e.depth == 0)
+    start = main_index
+    while start > 0 and entries[start - 1].depth > 0:
+        start -= 1
+    by_package: Dict[str, int] = defaultdict(int)
+    for entry in entries[start:main_index + 1]:
+        by_package[entry.name.split(".")[0]] += entry.self_us
+    after = entries[main_index + 1:]
+    return {
+        "main_us": entries[main_index].cumulative_us,
+        "by_package": dict(by_package),
+        "bootstrap_imports": [e for e in after if e.depth == 0],
+        "imported": {e.name.split(".")[0] for e in entries},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="сколько пакетов показать")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимый рост относительно сохранённого")
+    parser.add_argument("--max-ms", type=float, default=0.0, help="жёсткий предел на import main + сборку")
+    args = parser.parse_args()
+
+    import_ms: List[float] = []
+    bootstrap_ms: List[float] = []
+    importtime_ms: List[float] = []
+    by_package: Dict[str, List[int]] = defaultdict(list)
+    imported: Set[str] = set()
+    lazy_modules: Set[str] = set()
+    last = None
+    for _ in range(args.runs):
+        probe = run_probe()
+        last = analyze(probe["entries"])
+        import_ms.append(probe["import_ms"])
+        bootstrap_ms.append(probe["bootstrap_ms"])
+        importtime_ms.append(last["main_us"] / 1000)
+        for package, self_us in last["by_package"].items():
+            by_package[package].append(self_us)
+        imported |= last["imported"]
+        lazy_modules |= set(probe["lazy_modules"])
+
+    current = {
+        "import_ms": statistics.median(import_ms),
+        "bootstrap_ms": statistics.median(bootstrap_ms),
+    }
+    current["total_ms"] = current["import_ms"] + current["bootstrap_ms"]
+    print(f"import main:  {current['import_ms']:7.1f} ms (median of {args.runs}; "
+          f"-X importtime cumulative {statistics.median(importtime_ms):.1f} ms)")
+    print(f"bootstrap:    {current['bootstrap_ms']:7.1f} ms")
+    print(f"total:        {current['total_ms']:7.1f} ms\n")
+
+    print(f"{'package':<24} {'self ms':>8}")
+    ranked = sorted(by_package.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for package, samples in ranked[:args.top]:
+        print(f"{package:<24} {statistics.median(samples) / 1000:>8.1f}")
+    if last["bootstrap_imports"]:
+        print("\nimported by bootstrap_application():")
+        for entry in sorted(last["bootstrap_imports"], key=lambda e: e.cumulative_us, reverse=True)[:args.top]:
+            print(f"  {entry.name:<22} {entry.cumulative_us / 1000:>8.1f}")
+
+    failures = []
+    eager = sorted((DEFERRED_IMPORTS | lazy_modules) & imported)
+    if eager:
+        failures.append(f"imported at startup but should be deferred: {', '.join(eager)}")
+    if args.max_ms and current["total_ms"] > args.max_ms:
+        failures.append(f"cold start {current['total_ms']:.1f} ms exceeds --max-ms {args.max_ms:.1f}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps({k: round(v, 1) for k, v in current.items()}, indent=2) + "\n")
+        print(f"\nbaseline saved to {args.baseline}")
+    elif args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())
+        print(f"\nbaseline ({args.baseline.name}): total {baseline['total_ms']:.1f} ms")
+        for key in ("import_ms", "total_ms"):
+            limit = baseline[key] * (1 + args.tolerance)
+            if current[key] > limit:
+                failures.append(f"{key} {current[key]:.1f} ms > baseline {baseline[key]:.1f} ms "
+                                f"+{args.tolerance:.0%}")
+
+    if failures:
+        print("\nFAIL:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+"""Бенчмарк на воспроизведении обновлений через настоящее приложение и заглушку Bot API.
+
+    python -m benchmarks.replay [--users 40] [--chats 5] [--work-rounds 200] [--blackjack-games 10]
+                                [--rate-limit-every 0] [--api-latency-ms 0] [--json report.json]
+    python -m benchmarks.replay --replay data/recorded/updates-*.jsonl.gz [--speed 10]
+
+Приложение собирается bootstrap_application() и получает синтетические обновления
+(/balance, /top, смены /work с нажатиями, партии блекджека, /брак с принятием) или
+записанные recorder.py — с исходными паузами, ускоренными в --speed раз (0 — без пауз).
+Данные пишутся во временную папку, паузы анимаций выключены, сеть и токен не нужны.
+В конце — пропускная способность, p50/p99 по обработчикам, чтения/записи JSON и запросы к API.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from benchmarks.fake_bot_api import BOT_USER, FakeBotApi
+
+BENCH_TOKEN = "123456:BENCHMARK"
+ADMIN_ID = 1000
+FIRST_USER_ID = 1001
+FIRST_CHAT_ID = -1000000000001
+START_BALANCE = 100000
+# Сколько ждать изменений в партии, прежде чем считать её зависшей (в секундах)
+STALL_TIMEOUT = 5.0
+# Команды, которые Telegram размечает как bot_command (латиница, цифры, _)
+COMMAND_RE = re.compile(r"^/[A-Za-z0-9_]+(?:@\w+)?")
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+
+def _chat(chat_id: int) -> Dict[str, Any]:
+    if chat_id > 0:
+        return {"id": chat_id, "type": "private", "first_name": f"User{chat_id}"}
+    return {"id": chat_id, "type": "supergroup", "title": f"Bench {chat_id}"}
+
+
+def _update_kind(update) -> str:
+    if update.callback_query:
+        return (update.callback_query.data or "").split(":", 1)[0]
+    if update.message and update.message.text:
+        word = update.message.text.split(maxsplit=1)[0]
+        return word if word.startswith("/") else "text"
+    return "other"
+
+
+class Replay:
+    """Подаёт обновления в приложение по одному, как это делает обработчик очереди в проде"""
+
+    def __init__(self, app, api: FakeBotApi):
+        self.app = app
+        self.api = api
+        self.update_latency: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.stalled_games = 0
+        self._lock = asyncio.Lock()
+        self._update_id = 0
+        self._message_id = 0
+
+    def _next_update_id(self) -> int:
+        self._update_id += 1
+        return self._update_id
+
+    def message(self, chat_id: int, user_id: int, text: str, reply_to: Optional[Dict[str, Any]] = None):
+        from telegram import Update
+
+        self._message_id += 1
+        payload = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": _chat(chat_id),
+            "from": _user(user_id),
+            "text": text,
+        }
+        command = COMMAND_RE.match(text)
+        if command:
+            payload["entities"] = [{"type": "bot_command", "offset": 0, "length": command.end()}]
+        if reply_to:
+            payload["reply_to_message"] = reply_to
+        return Update.de_json({"update_id": self._next_update_id(), "message": payload}, self.app.bot)
+
+    def callback(self, chat_id: int, user_id: int, data: str, message_id: int):
+        from telegram import Update
+
+        update_id = self._next_update_id()
+        payload = {
+            "id": f"bench-{update_id}",
+            "from": _user(user_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {"message_id": message_id, "date": int(time.time()), "chat": _chat(chat_id),
+                        "from": BOT_USER, "text": "…"},
+        }
+        return Update.de_json({"update_id": update_id, "callback_query": payload}, self.app.bot)
+
+    async def feed(self, update) -> None:
+        # В проде обновления обрабатываются строго по одному; сценарии идут параллельно,
+        # но в приложение попадают через общую блокировку
+        async with self._lock:
+            started = time.perf_counter()
+            await self.app.process_update(update)
+            self.update_latency[_update_kind(update)].append(time.perf_counter() - started)
+
+    async def send(self, chat_id: int, user_id: int, text: str, reply_to: Optional[Dict[str, Any]] = None):
+        update = self.message(chat_id, user_id, text, reply_to)
+        await self.feed(update)
+        return update
+
+    async def click(self, chat_id: int, user_id: int, data: str, message_id: Optional[int] = None) -> None:
+        if message_id is None:
+            message_id, _ = self.api.buttons(chat_id, data)
+        await self.feed(self.callback(chat_id, user_id, data, message_id or 1))
+
+    @property
+    def updates(self) -> int:
+        return sum(len(samples) for samples in self.update_latency.values())
+
+    async def count_error(self, update: object, context) -> None:
+        self.errors[type(context.error).__name__] += 1
+
+
+async def wait_background() -> None:
+    """Дождаться фоновой обработки нажатий (callbacks.instant_callback)"""
+    pending = [task for task in asyncio.all_tasks()
+               if task.get_name().startswith("callback:") and not task.done()]
+    if pending:
+        await asyncio.wait(pending, timeout=30)
+
+
+# ---- сценарии ----
+
+async def scenario_balance(replay: Replay, chats: List[int], users: List[int]) -> None:
+    for index, user_id in enumerate(users):
+        chat_id = chats[index % len(chats)]
+        await replay.send(chat_id, user_id, "привет")
+        await replay.send(chat_id, user_id, "/balance")
+    for chat_id in chats:
+        await replay.send(chat_id, users[0], "/top")
+        for target in ("blackjack", "balance"):
+            await replay.click(chat_id, users[0], f"top_switch:{target}")
+
+
+async def scenario_work(replay: Replay, chat_id: int, user_id: int) -> None:
+    from work import REQUIRED_CLICKS
+
+    await replay.send(chat_id, user_id, "/work")
+    data = f"work_click:{user_id}"
+    message_id, buttons = replay.api.buttons(chat_id, data)
+    if not buttons:
+        return  # кулдаун — предупреждение уже отправлено
+    # Пара лишних нажатий сверх нормы, как у торопливых пользователей
+    for _ in range(REQUIRED_CLICKS + 2):
+        await replay.click(chat_id, user_id, data, message_id)
+    await wait_background()
+
+
+async def scenario_blackjack(replay: Replay, chat_id: int, players: List[int]) -> None:
+    import blackjack
+
+    await replay.send(chat_id, ADMIN_ID, "/блекджек")
+    message_id, _ = replay.api.buttons(chat_id, "bj_join:")
+    for user_id in players:
+        await replay.click(chat_id, user_id, f"bj_join:{chat_id}", message_id)
+    await wait_background()
+    await replay.send(chat_id, ADMIN_ID, "/блекджек_начать")
+
+    # Дальше «смотрим на экран»: жмём кнопки того игрока, чей сейчас ход
+    last_state, changed_at = None, time.monotonic()
+    while chat_id in blackjack.active_games:
+        game = blackjack.active_games[chat_id]
+        state = (game.is_signup_phase, game.current_betting_player, game.current_player_index,
+                 sum(len(player.cards) for player in game.players), len(game.game_messages))
+        if state != last_state:
+            last_state, changed_at = state, time.monotonic()
+        elif time.monotonic() - changed_at > STALL_TIMEOUT:
+            # Игра застряла (например, нужное сообщение не ушло из-за 429) — в проде она висела бы вечно
+            replay.stalled_games += 1
+            blackjack.active_games.pop(chat_id, None)
+            return
+
+        if game.is_betting_phase:
+            index = game.current_betting_player
+            # Кнопки самого свежего сообщения со ставками: на старых кнопки остаются, как и в Telegram
+            _, buttons = replay.api.buttons(chat_id, "bj_bet_")
+            accept = f"bj_bet_accept:{chat_id}:{index}"
+            data = accept if accept in buttons else f"bj_bet_add:{chat_id}:{index}:25"
+            await replay.click(chat_id, game.players[index].user_id, data)
+            # Нажатие выполнит актор игры — ждём его, как пользователь ждёт ответа на экране
+            await game.inbox.join()
+        elif game.is_game_active and game.get_current_player() and \
+                replay.api.buttons(chat_id, f"bj_stand:{chat_id}:{game.current_player_index}")[1]:
+            index = game.current_player_index
+            player = game.players[index]
+            action = "bj_hit" if player.score < 16 else "bj_stand"
+            await replay.click(chat_id, player.user_id, f"{action}:{chat_id}:{index}")
+            await game.inbox.join()
+        else:
+            await asyncio.sleep(0.005)
+
+
+async def scenario_marriage(replay: Replay, chat_id: int, proposer: int, target: int) -> None:
+    greeting = await replay.send(chat_id, target, "всем привет")
+    await replay.send(chat_id, proposer, "/брак", reply_to=greeting.message.to_dict())
+    message_id, buttons = replay.api.buttons(target, "accept:")
+    if not buttons:
+        return
+    await replay.click(target, target, buttons[0], message_id)
+    await wait_background()
+
+
+def read_recorded(paths: List[str]) -> Iterator[Tuple[Optional[float], Dict[str, Any]]]:
+    """(время получения, Update.to_dict()) из файлов recorder.py; годятся и строки с голым Update"""
+    for path in sorted(paths):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if "update" in record:
+                    yield record.get("t"), record["update"]
+                else:
+                    yield None, record
+
+
+async def run_recorded(replay: Replay, paths: List[str], speed: float) -> None:
+    from telegram import Update
+
+    first_at = started = None
+    for received_at, payload in read_recorded(paths):
+        if speed and received_at is not None:
+            if first_at is None:
+                first_at, started = received_at, time.monotonic()
+            delay = (received_at - first_at) / speed - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await replay.feed(Update.de_json(payload, replay.app.bot))
+
+
+# ---- запуск ----
+
+def seed_data(data_dir: str, users: List[int]) -> None:
+    with open(os.path.join(data_dir, "economy.json"), "w", encoding="utf-8") as f:
+        json.dump({"balances": {str(user_id): START_BALANCE for user_id in users}, "slaves": {}, "usernames": {}}, f)
+    with open(os.path.join(data_dir, "admins.json"), "w", encoding="utf-8") as f:
+        json.dump({"owner_id": ADMIN_ID, "admins": [ADMIN_ID], "custom_commands": {}}, f)
+
+
+def disable_throttling() -> None:
+    import antispam
+
+    unlimited = (float("inf"), 0.0)
+    antispam.USER_COMMAND_LIMIT = antispam.USER_CALLBACK_LIMIT = antispam.CHAT_LIMIT = unlimited
+
+
+async def run_synthetic(replay: Replay, args: argparse.Namespace) -> None:
+    users = [FIRST_USER_ID + i for i in range(args.users)]
+    chats = [FIRST_CHAT_ID - i for i in range(args.chats)]
+
+    await scenario_balance(replay, chats, users)
+
+    pairs = [(chat_id, user_id) for chat_id in chats for user_id in users]
+    work = [scenario_work(replay, *pairs[i % len(pairs)]) for i in range(args.work_rounds)]
+    await asyncio.gather(*work)
+
+    games = []
+    for game in range(args.blackjack_games):
+        chat_id = chats[game % len(chats)]
+        players = [users[(game * 5 + i) % len(users)] for i in range(2 + game % 4)]
+        games.append((chat_id, players))
+    # В одном чате может идти только одна игра — чаты играют параллельно, партии в чате по очереди
+    by_chat: Dict[int, List[List[int]]] = defaultdict(list)
+    for chat_id, players in games:
+        by_chat[chat_id].append(players)
+
+    async def play_chat(chat_id: int) -> None:
+        for players in by_chat[chat_id]:
+            await scenario_blackjack(replay, chat_id, players)
+
+    await asyncio.gather(*(play_chat(chat_id) for chat_id in by_chat))
+
+    marriages = []
+    for chat_id in chats:
+        for i in range(0, min(len(users) - 1, args.marriages * 2), 2):
+            marriages.append(scenario_marriage(replay, chat_id, users[i], users[i + 1]))
+    await asyncio.gather(*marriages)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    # Импорты проекта — только после того, как окружение указывает на временную папку
+    import main
+    import metrics
+    import loop_watchdog
+    from callbacks import callback_stats
+    from storage import flush_batched_stores
+
+    if not args.antispam:
+        disable_throttling()
+
+    handler_samples: Dict[str, List[float]] = defaultdict(list)
+    handler_io: Dict[str, Counter] = defaultdict(Counter)
+
+    def observe(name: str, elapsed: float, counters) -> None:
+        handler_samples[name].append(elapsed)
+        handler_io[name].update(loads=counters.json_loads, saves=counters.json_saves, api=counters.api_calls)
+
+    metrics.handler_observers.append(observe)
+
+    api = FakeBotApi(args.rate_limit_every, latency=args.api_latency_ms / 1000)
+    await api.start()
+    app = main.bootstrap_application(token=BENCH_TOKEN, base_url=api.base_url)
+    replay = Replay(app, api)
+    app.add_error_handler(replay.count_error)
+
+    await app.initialize()
+    await app.start()
+    loop_watchdog.start_watchdog(args.block_threshold_ms / 1000)
+    started = time.perf_counter()
+    try:
+        if args.replay:
+            await run_recorded(replay, args.replay, args.speed)
+        else:
+            await run_synthetic(replay, args)
+        await wait_background()
+    finally:
+        elapsed = time.perf_counter() - started
+        loop_watchdog.stop_watchdog()
+        flush_batched_stores()
+        await app.stop()
+        await app.shutdown()
+        await api.stop()
+
+    return {
+        "updates": replay.updates,
+        "seconds": elapsed,
+        "updates_per_second": replay.updates / elapsed if elapsed else 0.0,
+        "errors": dict(replay.errors),
+        "stalled_games": replay.stalled_games,
+        "handlers": {
+            name: {
+                "calls": len(samples),
+                "p50_ms": _percentile(samples, 0.5) * 1000,
+                "p99_ms": _percentile(samples, 0.99) * 1000,
+                "json_loads": handler_io[name]["loads"],
+                "json_saves": handler_io[name]["saves"],
+                "api_calls": handler_io[name]["api"],
+            }
+            for name, samples in handler_samples.items()
+        },
+        "updates_by_kind": {
+            kind: {"count": len(samples), "p50_ms": _percentile(samples, 0.5) * 1000,
+                   "p99_ms": _percentile(samples, 0.99) * 1000}
+            for kind, samples in replay.update_latency.items()
+        },
+        "callbacks": {name: stats.summary() for name, stats in callback_stats.items()},
+        "json_io": {f"{op}:{file_name}": count for (op, file_name), count in sorted(metrics.json_io_totals.items())},
+        "api_calls": dict(api.calls),
+        "api_rate_limited": dict(api.rate_limited),
+        "loop_lag_p99_ms": metrics.loop_lag.quantile(0.99) * 1000,
+        "loop_blockers": [
+            {"handler": handler, "site": site, "count": count, "total_ms": total * 1000, "max_ms": worst * 1000}
+            for handler, site, count, total, worst in loop_watchdog.top_blockers()
+        ],
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"updates: {report['updates']} in {report['seconds']:.2f}s → "
+          f"{report['updates_per_second']:.1f} updates/s, errors: {report['errors'] or 0}")
+    if report["stalled_games"]:
+        print(f"stalled blackjack games: {report['stalled_games']}")
+
+    print(f"\n{'handler':<28} {'calls':>6} {'p50 ms':>8} {'p99 ms':>8} {'loads':>7} {'saves':>7} {'api':>6}")
+    rows = sorted(report["handlers"].items(), key=lambda item: -item[1]["p99_ms"])
+    for name, row in rows:
+        calls = row["calls"]
+        print(f"{name:<28} {calls:>6} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+              f"{row['json_loads'] / calls:>7.2f} {row['json_saves'] / calls:>7.2f} {row['api_calls'] / calls:>6.2f}")
+
+    print(f"\n{'update':<28} {'count':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    for kind, row in sorted(report["updates_by_kind"].items(), key=lambda item: -item[1]["p99_ms"]):
+        print(f"{kind:<28} {row['count']:>6} {row['p50_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+
+    if report["callbacks"]:
+        print(f"\n{'callback (background)':<28} {'count':>6} {'ack p95':>8} {'done p95':>9} {'dropped':>8}")
+        for name, row in sorted(report["callbacks"].items()):
+            print(f"{name:<28} {row['count']:>6} {row['ack_p95'] * 1000:>8.2f} "
+                  f"{row['done_p95'] * 1000:>9.2f} {row['dropped']:>8}")
+
+    print("\njson io: " + ", ".join(f"{key} {count}" for key, count in report["json_io"].items()))
+    print("api calls: " + ", ".join(f"{method} {count}" for method, count in sorted(report["api_calls"].items())))
+    if report["api_rate_limited"]:
+        print("429 answered: " + ", ".join(f"{method} {count}" for method, count in report["api_rate_limited"].items()))
+    print(f"event loop lag p99 ≤ {report['loop_lag_p99_ms']:.0f} ms")
+    if report["loop_blockers"]:
+        print(f"\n{'loop blocked by':<28} {'at':<36} {'count':>6} {'total ms':>9} {'max ms':>7}")
+        for row in report["loop_blockers"]:
+            print(f"{row['handler']:<28} {row['site']:<36} {row['count']:>6} {row['total_ms']:>9.0f} {row['max_ms']:>7.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--chats", type=int, default=5)
+    parser.add_argument("--work-rounds", type=int, default=200)
+    parser.add_argument("--blackjack-games", type=int, default=10)
+    parser.add_argument("--marriages", type=int, default=5, help="пар на чат")
+    parser.add_argument("--replay", nargs="+", help="файлы recorder.py (JSONL, можно .gz) вместо синтетики")
+    parser.add_argument("--speed", type=float, default=0.0, help="ускорение записанного трафика (1 — как было, 0 — без пауз)")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="отвечать 429 на каждый N-й запрос")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0)
+    parser.add_argument("--antispam", action="store_true", help="не отключать ограничение частоты")
+    parser.add_argument("--block-threshold-ms", type=float, default=20.0,
+                        help="с какой задержки цикла событий снимать стек блокирующего вызова")
+    parser.add_argument("--json", help="сохранить отчёт в файл (для сравнения прогонов)")
+    parser.add_argument("--keep-data", action="store_true", help="не удалять временную папку с данными")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="bot-bench-")
+    os.environ["BOT_DATA_DIR"] = data_dir
+    os.environ["ANIMATION_DELAY_SCALE"] = "0"
+    os.environ["METRICS_PORT"] = "0"
+    seed_data(data_dir, [FIRST_USER_ID + i for i in range(args.users)])
+
+    try:
+        # main при импорте настраивает logging.basicConfig — уровень выставляем после
+        import main as bot_main  # noqa: F401
+        logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+        report = asyncio.run(run(args))
+    finally:
+        if args.keep_data:
+            print(f"data: {data_dir}")
+        else:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Генератор POST-запросов к вебхуку и сравнение доставки с long polling.
+
+    python -m benchmarks.webhook_post [--mode both] [--updates 2000] [--rate 200] [--connections 8]
+                                      [--noise 0.3] [--all-types] [--api-latency-ms 0]
+
+Бенчмарк сам изображает Telegram: готовит поток обновлений (команды, обычный текст и «шум» —
+правки, реакции, смены участников, которые бот не обрабатывает), фильтрует их по
+allowed_updates, зарегистрированным ботом, и доставляет либо POST-запросами на встроенный
+сервер (webhook.py), либо через getUpdates заглушки Bot API (polling).
+Задержка доставки — от отправки обновления до конца его обработки всеми группами.
+--all-types подписывает бота на Update.ALL_TYPES, как было до вывода allowed_updates.
+--api-latency-ms изображает расстояние до Telegram: на столько задерживается каждый ответ
+Bot API (getUpdates в том числе) и каждый POST вебхука перед отправкой.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.fake_bot_api import BOT_USER, FakeBotApi, update_type
+from benchmarks.replay import (
+    BENCH_TOKEN, FIRST_CHAT_ID, FIRST_USER_ID, _chat, _percentile, _user, disable_throttling, seed_data,
+)
+
+SECRET = "bench-secret"
+WEBHOOK_PATH = "/telegram"
+NOISE_TYPES = ("edited_message", "message_reaction", "my_chat_member", "chat_member")
+# Сколько ждать обработки последних обновлений (в секундах)
+DRAIN_TIMEOUT = 30.0
+
+
+def make_updates(count: int, noise: float, users: List[int], chats: List[int], seed: int = 1) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    updates = []
+    for update_id in range(1, count + 1):
+        user_id, chat_id = rng.choice(users), rng.choice(chats)
+        now = int(time.time())
+        message = {"message_id": update_id, "date": now, "chat": _chat(chat_id), "from": _user(user_id)}
+        if rng.random() < 0.5:
+            message["text"] = "/balance"
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len("/balance")}]
+        else:
+            message["text"] = "привет"
+        kind = rng.choice(NOISE_TYPES) if rng.random() < noise else "message"
+        if kind in ("message", "edited_message"):
+            if kind == "edited_message":
+                message["edit_date"] = now
+            payload: Dict[str, Any] = message
+        elif kind == "message_reaction":
+            payload = {"chat": _chat(chat_id), "message_id": update_id, "user": _user(user_id), "date": now,
+                       "old_reaction": [], "new_reaction": [{"type": "emoji", "emoji": "👍"}]}
+        else:
+            member = BOT_USER if kind == "my_chat_member" else _user(user_id)
+            payload = {"chat": _chat(chat_id), "from": _user(user_id), "date": now,
+                       "old_chat_member": {"status": "member", "user": member},
+                       "new_chat_member": {"status": "left", "user": member}}
+        updates.append({"update_id": update_id, kind: payload})
+    return updates
+
+
+async def _post(connection: Tuple[asyncio.StreamReader, asyncio.StreamWriter], port: int,
+                body: bytes, secret: str) -> int:
+    reader, writer = connection
+    writer.write(
+        f"POST {WEBHOOK_PATH} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nContent-Type: application/json\r\n"
+        f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    if length:
+        await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+
+class Delivery:
+    """Отметки времени: когда обновление «отправил Telegram» и когда бот закончил его обработку"""
+
+    def __init__(self):
+        self.sent: Dict[int, float] = {}
+        self.done: Dict[int, float] = {}
+        self.delivered_types: Counter = Counter()
+        self.ack: List[float] = []
+        self.statuses: Counter = Counter()
+        self._all_done = asyncio.Event()
+
+    async def mark_done(self, update, context) -> None:
+        self.done[update.update_id] = time.perf_counter()
+        self.delivered_types[update_type(update.to_dict())] += 1
+        if len(self.done) >= len(self.sent):
+            self._all_done.set()
+
+    async def drain(self) -> None:
+        if len(self.done) < len(self.sent):
+            self._all_done.clear()
+            try:
+                await asyncio.wait_for(self._all_done.wait(), DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+
+    def latencies(self) -> List[float]:
+        return [self.done[update_id] - sent for update_id, sent in self.sent.items() if update_id in self.done]
+
+
+async def _paced(updates: List[Dict[str, Any]], rate: float):
+    started = time.perf_counter()
+    for index, update in enumerate(updates):
+        if rate:
+            delay = started + index / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield update
+
+
+async def deliver_webhook(app, api: FakeBotApi, allowed: List[str], updates: List[Dict[str, Any]],
+                          delivery: Delivery, args: argparse.Namespace) -> None:
+    from webhook import start_webhook
+
+    server = await start_webhook(app, allowed, listen="127.0.0.1", port=0, path=WEBHOOK_PATH,
+                                 secret=SECRET, url="https://bench.invalid" + WEBHOOK_PATH)
+    port = server.sockets[0].getsockname()[1]
+    pool: asyncio.Queue = asyncio.Queue()
+    for _ in range(args.connections):
+        pool.put_nowait(await asyncio.open_connection("127.0.0.1", port))
+    try:
+        # Чужой запрос без секрета сервер обязан отклонить
+        connection = await pool.get()
+        assert await _post(connection, port, b"{}", "wrong") == 403
+        pool.put_nowait(connection)
+
+        async def send(update: Dict[str, Any]) -> None:
+            # Путь от Telegram до сервера бота
+            await asyncio.sleep(args.api_latency_ms / 1000)
+            connection = await pool.get()
+            try:
+                body = json.dumps(update).encode()
+                started = time.perf_counter()
+                delivery.statuses[await _post(connection, port, body, SECRET)] += 1
+                delivery.ack.append(time.perf_counter() - started)
+            finally:
+                pool.put_nowait(connection)
+
+        tasks = []
+        async for update in _paced(updates, args.rate):
+            # Telegram не присылает того, на что бот не подписан
+            if api.allows(update):
+                delivery.sent[update["update_id"]] = time.perf_counter()
+                tasks.append(asyncio.create_task(send(update)))
+            else:
+                api.filtered_updates[update_type(update)] += 1
+        await asyncio.gather(*tasks)
+        await delivery.drain()
+    finally:
+        while not pool.empty():
+            _, writer = pool.get_nowait()
+            writer.close()
+        server.close()
+
+
+async def deliver_polling(app, api: FakeBotApi, allowed: List[str], updates: List[Dict[str, Any]],
+                          delivery: Delivery, args: argparse.Namespace) -> None:
+    await app.updater.start_polling(allowed_updates=allowed, timeout=10)
+    try:
+        async for update in _paced(updates, args.rate):
+            delivery.sent[update["update_id"]] = time.perf_counter()
+            api.push_update(update)
+        # Отфильтрованные Telegram'ом до бота не дойдут — не ждём их
+        while api.pending_updates or api._new_updates.is_set():
+            await asyncio.sleep(0.05)
+        for update in updates:
+            if not api.allows(update):
+                delivery.sent.pop(update["update_id"], None)
+        await delivery.drain()
+    finally:
+        await app.updater.stop()
+
+
+async def run_mode(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    import main
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    from webhook import allowed_updates_for, webhook_requests
+
+    api = FakeBotApi(latency=args.api_latency_ms / 1000)
+    await api.start()
+    app = main.bootstrap_application(token=BENCH_TOKEN, base_url=api.base_url)
+    delivery = Delivery()
+    app.add_handler(TypeHandler(Update, delivery.mark_done), group=1000)
+    handled = allowed_updates_for(app)
+    allowed = list(Update.ALL_TYPES) if args.all_types else handled
+
+    users = [FIRST_USER_ID + i for i in range(args.users)]
+    chats = [FIRST_CHAT_ID - i for i in range(args.chats)]
+    updates = make_updates(args.updates, args.noise, users, chats)
+
+    await app.initialize()
+    await app.start()
+    started = time.perf_counter()
+    try:
+        deliver = deliver_webhook if mode == "webhook" else deliver_polling
+        await deliver(app, api, allowed, updates, delivery, args)
+    finally:
+        elapsed = time.perf_counter() - started
+        await app.stop()
+        await app.shutdown()
+        await api.stop()
+
+    latencies = delivery.latencies()
+    wasted = sum(count for kind, count in delivery.delivered_types.items() if kind not in handled)
+    return {
+        "mode": mode,
+        "allowed_updates": allowed,
+        "generated": len(updates),
+        "delivered": sum(delivery.delivered_types.values()),
+        "wasted": wasted,
+        "filtered_by_telegram": sum(api.filtered_updates.values()),
+        "lost": len(delivery.sent) - len(latencies),
+        "seconds": elapsed,
+        "delivery_p50_ms": _percentile(latencies, 0.5) * 1000,
+        "delivery_p99_ms": _percentile(latencies, 0.99) * 1000,
+        "ack_p50_ms": _percentile(delivery.ack, 0.5) * 1000,
+        "ack_p99_ms": _percentile(delivery.ack, 0.99) * 1000,
+        "http_statuses": dict(delivery.statuses),
+        "webhook_requests": dict(webhook_requests) if mode == "webhook" else {},
+        "api_calls": dict(api.calls),
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"[{report['mode']}] allowed_updates: {', '.join(report['allowed_updates'])}")
+    print(f"  generated {report['generated']}, filtered by Telegram {report['filtered_by_telegram']}, "
+          f"delivered {report['delivered']} (wasted {report['wasted']}), lost {report['lost']}, "
+          f"{report['seconds']:.2f}s")
+    print(f"  delivery p50 {report['delivery_p50_ms']:.2f} ms, p99 {report['delivery_p99_ms']:.2f} ms")
+    if report["mode"] == "webhook":
+        print(f"  POST ack p50 {report['ack_p50_ms']:.2f} ms, p99 {report['ack_p99_ms']:.2f} ms, "
+              f"statuses {report['http_statuses']}, server {report['webhook_requests']}")
+    else:
+        print(f"  getUpdates calls: {report['api_calls'].get('getUpdates', 0)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("webhook", "polling", "both"), default="both")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=200.0, help="обновлений в секунду (0 — без пауз)")
+    parser.add_argument("--connections", type=int, default=8, help="параллельных соединений к вебхуку")
+    parser.add_argument("--noise", type=float, default=0.3, help="доля обновлений, которые бот не обрабатывает")
+    parser.add_argument("--all-types", action="store_true", help="подписаться на Update.ALL_TYPES")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="задержка сети до Telegram")
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--chats", type=int, default=5)
+    parser.add_argument("--json", help="сохранить отчёт в файл")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="bot-webhook-")
+    os.environ["BOT_DATA_DIR"] = data_dir
+    os.environ["METRICS_PORT"] = "0"
+    seed_data(data_dir, [FIRST_USER_ID + i for i in range(args.users)])
+
+    modes = ("polling", "webhook") if args.mode == "both" else (args.mode,)
+    reports = []
+    try:
+        import main as bot_main  # noqa: F401
+        logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+        disable_throttling()
+        for mode in modes:
+            reports.append(asyncio.run(run_mode(mode, args)))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    for report in reports:
+        print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
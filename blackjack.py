@@ -1,52 +1,80 @@
 import asyncio
-import random
+import math
 import time
 import logging
 import os
-import json
-from pathlib import Path
-from typing import Dict, List, Optional, Set, Any
-from dataclasses import dataclass, field
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from typing import Dict, List, Optional, Set, Any, Tuple
+from config import DATA_DIR, ANIMATION_DELAY_SCALE, BLACKJACK_DECKS
+from telegram import Update, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup, Message
 from telegram.constants import ParseMode, ChatType
-from telegram.ext import ContextTypes
+from telegram.ext import CallbackContext, ContextTypes
 from admin import is_admin
-from economy import get_user_balance, add_user_balance
+from economy import get_balances, get_slaves, add_user_balance
+import leaderboards
+from storage import SharedJsonFile
+from callbacks import instant_callback, answer_callback
+from metrics import handler_scope
+import game_journal
+import blackjack_shoe
+from blackjack_shoe import Shoe
 
 logger = logging.getLogger(__name__)
 
-# Путь к папке с данными
-DATA_DIR = Path("data")
-DATA_DIR.mkdir(exist_ok=True)
-
 # Константы игры
 GAME_SIGNUP_TIME = 60  # 1 минута на набор игроков
 MAX_PLAYERS = 5  # Максимум игроков
 MIN_PLAYERS = 2  # Минимум игроков для начала игры
+SIGNUP_RESUME_TIME = 20  # Сколько секунд набора остаётся минимум после перезапуска бота
+SIGNUP_REFRESH_INTERVAL = 15  # Как часто обновлять таймер в сообщении набора (в секундах)
+SIGNUP_LAST_CALL = 10  # За сколько секунд до конца набора — последнее обновление таймера
 
 # Глобальное хранилище активных игр
 active_games: Dict[int, 'BlackjackGame'] = {}
 
-@dataclass
-class Card:
-    """Карта"""
-    suit: str  # ♠️♥️♦️♣️
-    rank: str  # A, 2-10, J, Q, K
-    value: int  # Числовое значение для подсчета очков
-    
-    def __str__(self):
-        return f"{self.rank}{self.suit}"
 
-@dataclass 
+async def pause(seconds: float) -> None:
+    """Пауза анимации (масштабируется ANIMATION_DELAY_SCALE)"""
+    await asyncio.sleep(seconds * ANIMATION_DELAY_SCALE)
+
+
+def _journal(game: 'BlackjackGame', phase: Optional[str] = None) -> None:
+    """Записать снимок игры: после перезапуска её можно будет восстановить или вернуть ставки"""
+    game_journal.record(game.chat_id, game.snapshot(phase))
+
+SUITS = ('♠️', '♥️', '♦️', '♣️')
+RANKS = ('A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K')
+
+# Карта — число 0..51 (масть * 13 + ранг); очки, туз и надпись берутся из таблиц по коду
+Card = int
+CARD_VALUES = tuple(11 if rank == 'A' else 10 if rank in ('J', 'Q', 'K') else int(rank)
+                    for suit in SUITS for rank in RANKS)  # туз считается за 11, пока нет перебора
+CARD_IS_ACE = tuple(int(rank == 'A') for suit in SUITS for rank in RANKS)
+CARD_LABELS = tuple(f"{rank}{suit}" for suit in SUITS for rank in RANKS)
+
+
+def add_card_score(score: int, soft_aces: int, card: Card) -> Tuple[int, int]:
+    """Очки руки после новой карты и сколько тузов в ней ещё считаются за 11"""
+    score += CARD_VALUES[card]
+    soft_aces += CARD_IS_ACE[card]
+    # При переборе туз за тузом становится 1
+    while score > 21 and soft_aces:
+        score -= 10
+        soft_aces -= 1
+    return score, soft_aces
+
+
 class Player:
     """Игрок в блекджеке"""
+    __slots__ = ("user_id", "username", "first_name", "cards", "score", "soft_aces", "is_bust",
+                 "is_blackjack", "is_stand", "bet", "temp_bet", "slave_bet", "slave_bet_info")
     
     def __init__(self, user_id: int, username: str, first_name: str):
         self.user_id = user_id
         self.username = username
         self.first_name = first_name
         self.cards: List[Card] = []
-        self.score: int = 0
+        self.score: int = 0  # считается по ходу игры в add_card
+        self.soft_aces: int = 0  # тузы, которые пока считаются за 11
         self.is_bust: bool = False
         self.is_blackjack: bool = False
         self.is_stand: bool = False
@@ -55,67 +83,78 @@ class Player:
         self.slave_bet: bool = False  # ставит ли игрок раба
         self.slave_bet_info: Optional[Dict[str, Any]] = None  # информация о поставленном рабе
 
+    def add_card(self, card: Card) -> None:
+        """Взять карту: очки пересчитываются только на неё"""
+        self.cards.append(card)
+        self.score, self.soft_aces = add_card_score(self.score, self.soft_aces, card)
+
+def _normalize_stats(data: Dict[str, Any]) -> Dict[str, Any]:
+    data.setdefault("stats", {})
+    return data
+
+
+# Статистика общая для всех шардов: обновление — транзакцией под блокировкой файла
+_stats_file = SharedJsonFile(DATA_DIR / "blackjack_stats.json", dict, normalize=_normalize_stats)
+
+
 def load_blackjack_stats() -> Dict[str, Any]:
     """Загружает статистику блекджека."""
-    stats_file = DATA_DIR / "blackjack_stats.json"
-    if not stats_file.exists():
-        return {"stats": {}}
-    try:
-        with open(stats_file, "r", encoding="utf-8") as f:
-            data = json.load(f) or {}
-            data.setdefault("stats", {})
-            return data
-    except Exception as e:
-        logger.error("Failed to read blackjack stats: %s", e)
-        return {"stats": {}}
+    return _stats_file.load()
 
 
 def save_blackjack_stats(data: Dict[str, Any]) -> None:
     """Сохраняет статистику блекджека."""
-    stats_file = DATA_DIR / "blackjack_stats.json"
-    try:
-        with open(stats_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error("Failed to write blackjack stats: %s", e)
+    _stats_file.save(data)
+
+
+def blackjack_stats_version() -> int:
+    """Растёт, когда файл статистики перечитан с диска (например, после записи другим шардом)"""
+    _stats_file.read()
+    return _stats_file.version
 
 
 def update_player_stats(user_id: int, result: str, user_name: str) -> None:
     """Обновляет статистику игрока. result: 'win', 'loss', 'draw'"""
-    data = load_blackjack_stats()
     user_key = str(user_id)
-    
-    if user_key not in data["stats"]:
-        data["stats"][user_key] = {
-            "wins": 0,
-            "losses": 0,
-            "draws": 0,
-            "games": 0,
-            "name": user_name
-        }
-    
-    stats = data["stats"][user_key]
-    stats["name"] = user_name  # Обновляем имя на случай изменения
-    stats["games"] += 1
-    
-    if result == "win":
-        stats["wins"] += 1
-    elif result == "loss":
-        stats["losses"] += 1
-    elif result == "draw":
-        stats["draws"] += 1
-    
-    save_blackjack_stats(data)
+    with _stats_file.transaction() as data:
+        if user_key not in data["stats"]:
+            data["stats"][user_key] = {
+                "wins": 0,
+                "losses": 0,
+                "draws": 0,
+                "games": 0,
+                "name": user_name
+            }
+
+        stats = data["stats"][user_key]
+        stats["name"] = user_name  # Обновляем имя на случай изменения
+        stats["games"] += 1
+
+        if result == "win":
+            stats["wins"] += 1
+        elif result == "loss":
+            stats["losses"] += 1
+        elif result == "draw":
+            stats["draws"] += 1
+
+    leaderboards.on_blackjack_stats_changed(user_id, stats)
 
 
-def get_blackjack_leaderboard() -> List[Dict[str, Any]]:
-    """Возвращает топ игроков по блекджеку, отсортированный по победам, ничьим, поражениям."""
-    data = load_blackjack_stats()
+def get_blackjack_leaderboard(limit: int = 10, chat_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Возвращает топ игроков по блекджеку, отсортированный по победам, ничьим, поражениям.
+    Если указан chat_id, в топ попадают только участники этого чата."""
+    board = leaderboards.get_blackjack_board()
+    if chat_id is None:
+        top_ids = board.top(limit)
+    else:
+        from chat_members import get_chat_members
+        top_ids = board.top_among(get_chat_members(chat_id), limit)
     players = []
     
-    for user_id, stats in data["stats"].items():
+    for user_id in top_ids:
+        stats = leaderboards.get_cached_blackjack_stats(user_id)
         players.append({
-            "user_id": int(user_id),
+            "user_id": user_id,
             "name": stats["name"],
             "wins": stats["wins"],
             "losses": stats["losses"],
@@ -123,9 +162,6 @@ def get_blackjack_leaderboard() -> List[Dict[str, Any]]:
             "games": stats["games"]
         })
     
-    # Сортируем: сначала по победам (убывание), потом по ничьим (убывание), потом по поражениям (возрастание)
-    players.sort(key=lambda x: (-x["wins"], -x["draws"], x["losses"]))
-    
     return players
 
 class BlackjackGame:
@@ -135,13 +171,19 @@ class BlackjackGame:
         self.chat_id = chat_id
         self.admin_id = admin_id
         self.players: List[Player] = []
-        self.deck: List[Card] = []
+        self.shoe: Optional[Shoe] = None  # шуз чата на этот раунд
         self.dealer_cards: List[Card] = []
         self.dealer_score: int = 0
+        self.dealer_soft_aces: int = 0
         self.is_signup_phase = True
         self.is_game_active = False
         self.signup_end_time = time.time() + GAME_SIGNUP_TIME
         self.signup_message_id: Optional[int] = None
+        self._signup_job = None  # задание job_queue со следующим обновлением таймера набора
+        # Снимок балансов и рабов игроков: сообщения игры рисуются по нему, без чтения economy.json.
+        # Обновляется при списании (ставка, раб на кону) и перед ставками
+        self.balances: Dict[int, int] = {}
+        self.slaves: Dict[int, Optional[Dict[str, Any]]] = {}
         self.has_photo_message = False
         self.game_messages: List[int] = []  # ID сообщений игры для удаления
         self.current_player_index: int = 0  # Индекс текущего игрока
@@ -149,38 +191,81 @@ class BlackjackGame:
         self.player_ids: Set[int] = set()  # ID игроков для фильтрации сообщений
         self.is_betting_phase: bool = False  # фаза ставок
         self.current_betting_player: int = 0  # индекс игрока, который делает ставку
+        # Актор игры (run_game): нажатия выполняются по очереди одной задачей
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self._actor: Optional[asyncio.Task] = None
+        # Отложенная перерисовка сообщения игры и то, что уже показано
+        self._view: Optional[tuple] = None
+        self._shown: Optional[tuple] = None
         
-    def create_deck(self) -> List[Card]:
-        """Создать стандартную колоду карт"""
-        suits = ['♠️', '♥️', '♦️', '♣️']
-        ranks = ['A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K']
-        
-        deck = []
-        for suit in suits:
-            for rank in ranks:
-                if rank == 'A':
-                    value = 11  # Туз изначально 11, потом может стать 1
-                elif rank in ['J', 'Q', 'K']:
-                    value = 10
-                else:
-                    value = int(rank)
-                    
-                deck.append(Card(suit, rank, value))
-        
-        random.shuffle(deck)
-        return deck
-    
-    def calculate_score(self, cards: List[Card]) -> int:
-        """Подсчитать очки с учетом тузов"""
-        score = sum(card.value for card in cards)
-        aces = sum(1 for card in cards if card.rank == 'A')
-        
-        # Конвертируем тузы из 11 в 1, если нужно
-        while score > 21 and aces > 0:
-            score -= 10
-            aces -= 1
-            
-        return score
+    def start(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Запустить актор игры"""
+        self._actor = asyncio.create_task(run_game(context, self), name=f"blackjack:{self.chat_id}")
+        if self.is_signup_phase:
+            self.schedule_signup_tick(context)
+
+    def schedule_signup_tick(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Назначить следующее обновление таймера набора (прежнее отменяется)"""
+        self.cancel_signup_tick()
+        delay = _signup_delay(self.signup_end_time - time.time())
+        self._signup_job = context.job_queue.run_once(_signup_deadline, delay, data=self,
+                                                      name=f"blackjack_signup:{self.chat_id}")
+
+    def cancel_signup_tick(self) -> None:
+        if self._signup_job is not None:
+            self._signup_job.schedule_removal()
+            self._signup_job = None
+
+    def load_wallets(self, only_missing: bool = False) -> None:
+        """Прочитать балансы и рабов игроков одним заходом (only_missing — только новых игроков)"""
+        user_ids = [player.user_id for player in self.players
+                    if not only_missing or player.user_id not in self.balances]
+        if user_ids:
+            self.balances.update(get_balances(user_ids))
+            self.slaves.update(get_slaves(user_ids))
+
+    def cached_balance(self, user_id: int) -> int:
+        if user_id not in self.balances:
+            self.load_wallets(only_missing=True)
+        return self.balances[user_id]
+
+    def cached_slave(self, user_id: int) -> Optional[Dict[str, Any]]:
+        if user_id not in self.balances:
+            self.load_wallets(only_missing=True)
+        return self.slaves[user_id]
+
+    def post(self, action, query: Optional[CallbackQuery] = None, *args) -> None:
+        """Поставить событие в очередь игры: action(context, game, query, *args) выполнит актор"""
+        self.inbox.put_nowait((action, query, args))
+
+    def show(self, message_id: int, text: str, keyboard: Optional[InlineKeyboardMarkup] = None,
+             caption: bool = False) -> None:
+        """Запомнить, как должно выглядеть сообщение; актор отправит одну правку после пачки событий"""
+        self._view = (message_id, text, keyboard, caption)
+
+    def drop_view(self) -> None:
+        """Отменить отложенную перерисовку — сообщение дальше меняется напрямую (анимации, смена фазы)"""
+        self._view = None
+
+    async def flush_view(self, bot) -> None:
+        view, self._view = self._view, None
+        if view is None or view == self._shown:
+            return
+        message_id, text, keyboard, caption = view
+        try:
+            if caption:
+                await bot.edit_message_caption(chat_id=self.chat_id, message_id=message_id, caption=text,
+                                               reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
+            else:
+                await bot.edit_message_text(chat_id=self.chat_id, message_id=message_id, text=text,
+                                            reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
+            self._shown = view
+        except Exception as e:
+            logger.warning("Failed to update blackjack message in chat %s: %s", self.chat_id, e)
+
+    def add_dealer_card(self, card: Card) -> None:
+        self.dealer_cards.append(card)
+        self.dealer_score, self.dealer_soft_aces = add_card_score(self.dealer_score, self.dealer_soft_aces, card)
     
     def add_player(self, user_id: int, username: str, first_name: str) -> bool:
         """Добавить игрока в игру"""
@@ -227,7 +312,7 @@ class BlackjackGame:
     
     def format_cards(self, cards: List[Card]) -> str:
         """Форматировать карты для отображения"""
-        return " ".join(str(card) for card in cards)
+        return " ".join([CARD_LABELS[card] for card in cards])
     
     def format_dealer_cards(self, hide_second: bool = True) -> str:
         """Форматировать карты дилера (с возможностью скрыть вторую карту)"""
@@ -235,41 +320,73 @@ class BlackjackGame:
             return ""
         
         if hide_second and len(self.dealer_cards) >= 2:
-            return f"{self.dealer_cards[0]} 🂠"
+            return f"{CARD_LABELS[self.dealer_cards[0]]} 🂠"
         else:
-            return " ".join(str(card) for card in self.dealer_cards)
+            return self.format_cards(self.dealer_cards)
     
-    def start_game(self):
-        """Начать игру"""
+    def start_game(self, shoe: Optional[Shoe] = None):
+        """Начать игру (раздача без анимации; shoe — свой шуз вместо шуза чата, для симуляций)"""
         self.is_signup_phase = False
         self.is_game_active = True
-        self.deck = self.create_deck()
+        self.shoe = shoe or blackjack_shoe.shoe_for_round(self.chat_id)
         
         # Первый круг - всем по одной карте открыто
         for player in self.players:
-            card = self.deck.pop()
-            player.cards.append(card)
+            player.add_card(self.shoe.draw())
         
         # Дилеру первая карта открыто
-        dealer_first_card = self.deck.pop()
-        self.dealer_cards.append(dealer_first_card)
+        self.add_dealer_card(self.shoe.draw())
         
         # Второй круг - всем по второй карте открыто
         for player in self.players:
-            card = self.deck.pop()
-            player.cards.append(card)
-            player.score = self.calculate_score(player.cards)
+            player.add_card(self.shoe.draw())
             
             # Проверяем блекджек
             if player.score == 21:
                 player.is_blackjack = True
         
         # Дилеру вторая карта закрыто
-        dealer_hidden_card = self.deck.pop()
-        self.dealer_cards.append(dealer_hidden_card)
+        dealer_hidden_card = self.shoe.draw()
+        self.add_dealer_card(dealer_hidden_card)
         self.dealer_hidden_card = dealer_hidden_card
-        self.dealer_score = self.calculate_score(self.dealer_cards)
     
+    def snapshot(self, phase: Optional[str] = None) -> Dict[str, Any]:
+        """Компактный снимок игры для журнала (game_journal)"""
+        if phase is None:
+            if self.is_signup_phase:
+                phase = "signup"
+            elif self.is_betting_phase:
+                phase = "betting"
+            elif not self.is_game_active:
+                phase = "dealing"
+            elif self.current_player_index < len(self.players):
+                phase = "turns"
+            else:
+                phase = "dealer"
+        players = []
+        for player in self.players:
+            entry: Dict[str, Any] = {"id": player.user_id, "name": player.first_name}
+            if player.username:
+                entry["username"] = player.username
+            if player.slave_bet_info:
+                entry["slave"] = player.slave_bet_info
+            elif player.bet:
+                entry["bet"] = player.bet
+            if player.cards:
+                entry["cards"] = self.format_cards(player.cards)
+            players.append(entry)
+        snapshot = {"chat_id": self.chat_id, "phase": phase, "admin_id": self.admin_id,
+                    "players": players, "ts": int(time.time())}
+        if phase == "signup":
+            snapshot["signup_end_time"] = self.signup_end_time
+            snapshot["message_id"] = self.signup_message_id
+            snapshot["photo"] = self.has_photo_message
+        if self.dealer_cards:
+            snapshot["dealer"] = self.format_cards(self.dealer_cards)
+        if self.shoe:
+            snapshot["shoe"] = self.shoe.checkpoint()
+        return snapshot
+
     def get_current_player(self) -> Optional[Player]:
         """Получить текущего игрока"""
         if 0 <= self.current_player_index < len(self.players):
@@ -294,7 +411,7 @@ class BlackjackGame:
         message = "🎰 **БЛЕКДЖЕК - ИГРА ИДЕТ**\n\n"
         
         # Показываем карты дилера
-        dealer_visible_score = self.dealer_cards[0].value if self.dealer_cards else 0
+        dealer_visible_score = CARD_VALUES[self.dealer_cards[0]] if self.dealer_cards else 0
         message += f"🏦 **Дилер:** {self.format_dealer_cards()} (очки: {dealer_visible_score}+?)\n\n"
         
         # Показываем карты игроков
@@ -320,11 +437,9 @@ class BlackjackGame:
 
     def get_betting_keyboard(self, player_index: int) -> InlineKeyboardMarkup:
         """Создать клавиатуру для ставок"""
-        from economy import get_user_balance, get_user_slave
-        
         player = self.players[player_index]
-        balance = get_user_balance(player.user_id)
-        slave_info = get_user_slave(player.user_id)
+        balance = self.cached_balance(player.user_id)
+        slave_info = self.cached_slave(player.user_id)
         
         buttons = []
         # Кнопки фишек
@@ -371,59 +486,69 @@ class BlackjackGame:
         
         return InlineKeyboardMarkup(buttons)
 
-async def cb_blackjack_bet_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Обработка добавления фишек к ставке"""
-    from economy import get_user_balance
-    
+async def _post_click(update: Update, action) -> None:
+    """Нажатие кнопки игры → событие в очереди её актора (bj_*:chat_id:индекс игрока[:фишка])"""
     query = update.callback_query
     if not query or not query.data or not query.from_user:
         return
-    
-    await query.answer()
-    
-    # Парсим данные callback
     try:
-        _, chat_id_str, player_index_str, chip_str = query.data.split(":")
+        _, chat_id_str, *args = query.data.split(":")
         chat_id = int(chat_id_str)
-        player_index = int(player_index_str)
-        chip = int(chip_str)
-    except (ValueError, IndexError):
-        await query.answer("❌ Ошибка обработки команды.", show_alert=True)
+        args = [int(arg) for arg in args]
+    except ValueError:
+        await answer_callback(query, "❌ Ошибка обработки команды.", show_alert=True)
         return
-    
-    # Проверяем, есть ли активная игра
-    if chat_id not in active_games:
-        await query.answer("❌ Игра уже завершена!", show_alert=True)
+    game = active_games.get(chat_id)
+    if game is None:
+        await answer_callback(query, "❌ Игра уже завершена!", show_alert=True)
         return
-    
-    game = active_games[chat_id]
-    
-    # Проверяем фазу ставок и правильного игрока
-    if (not game.is_betting_phase or 
-        player_index != game.current_betting_player or 
-        game.players[player_index].user_id != query.from_user.id):
-        await query.answer("❌ Сейчас не ваш ход для ставки!", show_alert=True)
+    game.post(action, query, *args)
+
+
+def _betting_turn_error(game: BlackjackGame, query: CallbackQuery, player_index: int) -> Optional[str]:
+    if (not game.is_betting_phase or
+            player_index != game.current_betting_player or
+            game.players[player_index].user_id != query.from_user.id):
+        return "❌ Сейчас не ваш ход для ставки!"
+    return None
+
+
+async def cb_blackjack_bet_add(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработка добавления фишек к ставке"""
+    await _post_click(update, _bet_add)
+
+
+async def _bet_add(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame, query: CallbackQuery,
+                   player_index: int, chip: int) -> None:
+    error = _betting_turn_error(game, query, player_index)
+    if error:
+        await answer_callback(query, error, show_alert=True)
         return
     
     player = game.players[player_index]
     
     # Проверяем, что нет ставки рабом
     if player.slave_bet:
-        await query.answer("❌ Нельзя добавлять деньги к ставке рабом!", show_alert=True)
+        await answer_callback(query, "❌ Нельзя добавлять деньги к ставке рабом!", show_alert=True)
         return
     
-    # Проверяем баланс
-    balance = get_user_balance(player.user_id)
+    # Проверяем баланс (по снимку игры; списание при принятии ставки его обновит)
+    balance = game.cached_balance(player.user_id)
     if balance < player.temp_bet + chip:
-        await query.answer("❌ Недостаточно средств!", show_alert=True)
+        await answer_callback(query, "❌ Недостаточно средств!", show_alert=True)
         return
     
     # Добавляем фишку к ставке
     player.temp_bet += chip
-    await query.answer(f"💰 Добавлено {chip} монет. Ставка: {player.temp_bet}", show_alert=False)
+    await answer_callback(query, f"💰 Добавлено {chip} монет. Ставка: {player.temp_bet}")
     
     # Обновляем сообщение
-    await update_betting_message(context, game, player_index)
+    update_betting_message(game, player_index)
+
+def _shoe_rules() -> str:
+    if BLACKJACK_DECKS == 1:
+        return "Стандартная колода карт (52 карты)"
+    return f"Шуз из {BLACKJACK_DECKS} колод ({BLACKJACK_DECKS * 52} карт)"
 
 def create_signup_message(game: BlackjackGame, remaining_time: int) -> str:
     """Создать сообщение для набора игроков"""
@@ -434,7 +559,7 @@ def create_signup_message(game: BlackjackGame, remaining_time: int) -> str:
     if game.players:
         players_list = "\n\n👥 **Игроки:**\n"
         for i, player in enumerate(game.players, 1):
-            balance = get_user_balance(player.user_id)
+            balance = game.cached_balance(player.user_id)
             players_list += f"{i}. {player.first_name} (💰 {balance} монет)\n"
     
     return (
@@ -444,7 +569,7 @@ def create_signup_message(game: BlackjackGame, remaining_time: int) -> str:
         f"🎯 Минимум для начала: **{MIN_PLAYERS} игрока**\n"
         f"💰 **Минимальный баланс: 20 монет**\n\n"
         f"📋 **Правила:**\n"
-        f"• Стандартная колода карт (52 карты)\n"
+        f"• {_shoe_rules()}\n"
         f"• Цель: набрать 21 очко или **близко к этому** путем нажатием на Взять карту. Если вы превысите 21 очко - вы проиграете (перебор)\n"
         f"• Туз = 1 или 11, фигуры = 10\n"
         f"• Больше 21 = проигрыш\n\n"
@@ -482,7 +607,7 @@ async def cmd_blackjack(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     
     # Создаем сообщение о наборе
     keyboard = game.get_signup_keyboard()
-    message_text = create_signup_message(game, 60)
+    message_text = create_signup_message(game, GAME_SIGNUP_TIME)
     
     try:
         # Пытаемся найти фото в папке res
@@ -506,7 +631,7 @@ async def cmd_blackjack(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             )
             game.has_photo_message = False
     except Exception as e:
-        logger.warning(f"Failed to send photo, sending text message: {e}")
+        logger.warning("Failed to send photo, sending text message: %s", e)
         message = await context.bot.send_message(
             chat_id=chat_id,
             text=message_text,
@@ -516,9 +641,10 @@ async def cmd_blackjack(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         game.has_photo_message = False
     
     game.signup_message_id = message.message_id
+    _journal(game)
     
-    # Запускаем таймер обновления
-    asyncio.create_task(update_signup_timer(context, game))
+    # Запускаем актор игры: он же ведёт таймер набора
+    game.start(context)
 
 async def cmd_blackjack_add_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /блекджек+30сек - добавить 30 секунд к таймеру"""
@@ -537,23 +663,29 @@ async def cmd_blackjack_add_time(update: Update, context: ContextTypes.DEFAULT_T
         await update.message.reply_text("❌ Нет активной игры в блекджек!")
         return
     
-    game = active_games[chat_id]
-    
+    # Выполнит актор игры — после нажатий, пришедших раньше команды
+    active_games[chat_id].post(_add_signup_time, None, update.message)
+
+
+async def _add_signup_time(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame, query: None, message: Message) -> None:
     # Проверяем, что игра еще в фазе набора
     if not game.is_signup_phase:
-        await update.message.reply_text("❌ Игра уже началась!")
+        await message.reply_text("❌ Игра уже началась!")
         return
     
-    # Добавляем 30 секунд
+    # Добавляем 30 секунд: переносим следующее обновление таймера и показываем новое время
     game.signup_end_time += 30
+    _journal(game)
+    game.schedule_signup_tick(context)
+    show_signup_message(game)
     
     # Удаляем команду админа
     try:
-        await update.message.delete()
+        await message.delete()
     except Exception as e:
-        logger.warning(f"Failed to delete admin command: {e}")
+        logger.warning("Failed to delete admin command: %s", e)
     
-    logger.info(f"Admin {update.effective_user.id} added 30 seconds to blackjack game in chat {chat_id}")
+    logger.info("Admin %s added 30 seconds to blackjack game in chat %s", message.from_user.id, game.chat_id)
 
 async def cmd_blackjack_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /блекджек_начать - начать игру досрочно"""
@@ -572,141 +704,109 @@ async def cmd_blackjack_start(update: Update, context: ContextTypes.DEFAULT_TYPE
         await update.message.reply_text("❌ Нет активной игры в блекджек!")
         return
     
-    game = active_games[chat_id]
-    
+    # Выполнит актор игры — после нажатий, пришедших раньше команды
+    active_games[chat_id].post(_force_start, None, update.message)
+
+
+async def _force_start(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame, query: None, message: Message) -> None:
     # Проверяем, что игра еще в фазе набора
     if not game.is_signup_phase:
-        await update.message.reply_text("❌ Игра уже началась!")
+        await message.reply_text("❌ Игра уже началась!")
         return
     
     # Проверяем минимальное количество игроков
     if len(game.players) < MIN_PLAYERS:
-        await update.message.reply_text(f"❌ Нужно минимум {MIN_PLAYERS} игрока для начала игры!")
+        await message.reply_text(f"❌ Нужно минимум {MIN_PLAYERS} игрока для начала игры!")
         return
     
     # Удаляем команду админа
     try:
-        await update.message.delete()
+        await message.delete()
     except Exception as e:
-        logger.warning(f"Failed to delete admin command: {e}")
+        logger.warning("Failed to delete admin command: %s", e)
     
-    # Принудительно завершаем фазу набора
-    game.signup_end_time = time.time()
+    logger.info("Admin %s force-started blackjack game in chat %s", message.from_user.id, game.chat_id)
     
-    logger.info(f"Admin {update.effective_user.id} force-started blackjack game in chat {chat_id}")
+    # Принудительно завершаем фазу набора
+    await end_signup_phase(context, game)
+
+def _parse_join_chat_id(data: str) -> Optional[int]:
+    try:
+        _, chat_id_str = data.split(":")
+        return int(chat_id_str)
+    except ValueError:
+        return None
+
+
+def precheck_blackjack_join(update: Update) -> Optional[str]:
+    """Проверки присоединения по памяти: игра, фаза, баланс из кэша таблицы лидеров, места"""
+    query = update.callback_query
+    chat_id = _parse_join_chat_id(query.data)
+    if chat_id is None:
+        return "❌ Ошибка обработки команды."
+    game = active_games.get(chat_id)
+    if game is None:
+        return "❌ Игра уже завершена!"
+    if not game.is_signup_phase:
+        return "❌ Игра уже началась!"
+    user_id = query.from_user.id
+    leaderboards.get_balance_board()
+    if leaderboards.get_cached_balance(user_id) < 20:
+        return "❌ Для участия нужно минимум 20 монет на балансе!"
+    if user_id in game.player_ids:
+        return "❌ Вы уже участвуете в игре!"
+    if len(game.players) >= MAX_PLAYERS:
+        return "❌ Игра заполнена! Максимум игроков достигнут."
+    return None
 
+
+# Без текста подтверждения: присоединение идёт через очередь игры и ещё может не состояться
+# (игра началась, пока нажатие ждало), а успех и так виден по списку игроков в сообщении
+@instant_callback(precheck_blackjack_join)
 async def cb_blackjack_join(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка нажатия кнопки присоединения к игре"""
     query = update.callback_query
-    if not query or not query.data or not query.from_user:
-        return
-    
-    await query.answer()
-    
-    # Парсим данные callback
-    try:
-        _, chat_id_str = query.data.split(":")
-        chat_id = int(chat_id_str)
-    except (ValueError, IndexError):
-        await query.answer("❌ Ошибка обработки команды.", show_alert=True)
-        return
-    
-    # Проверяем, есть ли активная игра
-    if chat_id not in active_games:
-        await query.answer("❌ Игра уже завершена!", show_alert=True)
-        return
-    
-    game = active_games[chat_id]
+    chat_id = _parse_join_chat_id(query.data)
     
-    # Проверяем, что игра еще в фазе набора
+    game = active_games.get(chat_id)
+    if game is not None:
+        game.post(_join, query)
+
+
+async def _join(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame, query: CallbackQuery) -> None:
+    # Пока нажатие ждало своей очереди, игра могла начаться
     if not game.is_signup_phase:
-        await query.answer("❌ Игра уже началась!", show_alert=True)
         return
     
+    chat_id = game.chat_id
     user = query.from_user
     username = user.username or ""
     
-    balance = get_user_balance(user.id)
-    if balance < 20:
-        await query.answer("❌ Для участия нужно минимум 20 монет на балансе!", show_alert=True)
+    # Пытаемся добавить игрока; повторные нажатия и полную игру уже отсеял precheck_blackjack_join
+    if not game.add_player(user.id, username, user.first_name):
         return
-    
-    # Пытаемся добавить игрока
-    if game.add_player(user.id, username, user.first_name):
-        await query.answer(f"✅ Вы присоединились к игре!", show_alert=False)
-        logger.info(f"Player {user.first_name} ({user.id}) joined blackjack game in chat {chat_id}")
-        
-        try:
-            remaining_time = int(game.signup_end_time - time.time())
-            keyboard = game.get_signup_keyboard()
-            message_text = create_signup_message(game, remaining_time)
-            
-            if game.has_photo_message:
-                await context.bot.edit_message_caption(
-                    chat_id=game.chat_id,
-                    message_id=game.signup_message_id,
-                    caption=message_text,
-                    reply_markup=keyboard,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            else:
-                await context.bot.edit_message_text(
-                    chat_id=game.chat_id,
-                    message_id=game.signup_message_id,
-                    text=message_text,
-                    reply_markup=keyboard,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-        except Exception as e:
-            logger.warning(f"Failed to update signup message after player join: {e}")
-            
-    else:
-        # Проверяем, не добавлен ли уже игрок
-        for player in game.players:
-            if player.user_id == user.id:
-                await query.answer("❌ Вы уже участвуете в игре!", show_alert=True)
-                return
-        
-        if len(game.players) >= MAX_PLAYERS:
-            await query.answer("❌ Игра заполнена! Максимум игроков достигнут.", show_alert=True)
-        else:
-            await query.answer("❌ Не удалось присоединиться к игре!", show_alert=True)
+    logger.info("Player %s (%s) joined blackjack game in chat %s", user.first_name, user.id, chat_id)
+    _journal(game)
+    show_signup_message(game)
 
 async def cb_blackjack_hit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка нажатия кнопки 'Взять карту'"""
-    query = update.callback_query
-    if not query or not query.data or not query.from_user:
-        return
-    
-    await query.answer()
-    
-    # Парсим данные callback
-    try:
-        _, chat_id_str, player_index_str = query.data.split(":")
-        chat_id = int(chat_id_str)
-        player_index = int(player_index_str)
-    except (ValueError, IndexError):
-        await query.answer("❌ Ошибка обработки команды.", show_alert=True)
-        return
-    
-    # Проверяем, есть ли активная игра
-    if chat_id not in active_games:
-        await query.answer("❌ Игра уже завершена!", show_alert=True)
-        return
-    
-    game = active_games[chat_id]
-    
-    # Проверяем, что это ход правильного игрока
+    await _post_click(update, _hit)
+
+
+async def _hit(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame, query: CallbackQuery,
+               player_index: int) -> None:
+    # Проверяем, что это ход правильного игрока (повторное нажатие после перебора сюда уже не пройдёт)
     if (player_index != game.current_player_index or 
         game.players[player_index].user_id != query.from_user.id):
-        await query.answer("❌ Сейчас не ваш ход!", show_alert=True)
+        await answer_callback(query, "❌ Сейчас не ваш ход!", show_alert=True)
         return
     
     player = game.players[player_index]
     
     # Показываем анимацию "Достаю карту для игрока..."
     animation_text = f"🎰 **БЛЕКДЖЕК - ИГРА ИДЕТ**\n\n"
-    animation_text += f"🏦 **Дилер:** {game.format_dealer_cards()} (очки: {game.dealer_cards[0].value}+?)\n\n"
+    animation_text += f"🏦 **Дилер:** {game.format_dealer_cards()} (очки: {CARD_VALUES[game.dealer_cards[0]]}+?)\n\n"
     animation_text += "👥 **Игроки:**\n"
     for i, p in enumerate(game.players):
         status_icon = ""
@@ -725,6 +825,7 @@ async def cb_blackjack_hit(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     
     # Обновляем сообщение с анимацией
     if game.game_messages:
+        game.drop_view()
         try:
             await context.bot.edit_message_text(
                 chat_id=game.chat_id,
@@ -733,84 +834,57 @@ async def cb_blackjack_hit(update: Update, context: ContextTypes.DEFAULT_TYPE) -
                 parse_mode=ParseMode.MARKDOWN
             )
         except Exception as e:
-            logger.warning(f"Failed to edit message with animation: {e}")
+            logger.warning("Failed to edit message with animation: %s", e)
     
-    await asyncio.sleep(2)
+    await pause(2)
     
     # Выдаем карту
-    if game.deck:
-        card = game.deck.pop()
-        player.cards.append(card)
-        player.score = game.calculate_score(player.cards)
-        
-        if player.score > 21:
-            player.is_bust = True
-            await query.answer(f"💥 Перебор! У вас {player.score} очков.", show_alert=True)
-            # Переходим к следующему игроку только при перебое
-            await continue_game(context, game)
-        else:
-            await query.answer(f"🃏 Вы взяли {card}. Очки: {player.score}", show_alert=False)
-            keyboard = game.get_game_keyboard(game.current_player_index)
-            message_text = game.create_game_status_message()
-            
-            try:
-                # Обновляем сообщение с новым состоянием
-                await context.bot.edit_message_text(
-                    chat_id=game.chat_id,
-                    message_id=game.game_messages[-1],
-                    text=message_text,
-                    reply_markup=keyboard,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            except Exception as e:
-                logger.error(f"Failed to send updated game message: {e}")
+    card = game.shoe.draw()
+    player.add_card(card)
+    _journal(game)
+    
+    if player.score > 21:
+        player.is_bust = True
+        await answer_callback(query, f"💥 Перебор! У вас {player.score} очков.", show_alert=True)
+        # Переходим к следующему игроку только при перебое
+        await continue_game(context, game)
+    else:
+        await answer_callback(query, f"🃏 Вы взяли {CARD_LABELS[card]}. Очки: {player.score}")
+        # Новое состояние покажет актор — одной правкой после всех накопившихся нажатий
+        game.show(game.game_messages[-1], game.create_game_status_message(),
+                  game.get_game_keyboard(game.current_player_index))
 
 async def cb_blackjack_stand(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка нажатия кнопки 'Остановиться'"""
-    query = update.callback_query
-    if not query or not query.data or not query.from_user:
-        return
-    
-    await query.answer()
-    
-    # Парсим данные callback
-    try:
-        _, chat_id_str, player_index_str = query.data.split(":")
-        chat_id = int(chat_id_str)
-        player_index = int(player_index_str)
-    except (ValueError, IndexError):
-        await query.answer("❌ Ошибка обработки команды.", show_alert=True)
-        return
-    
-    # Проверяем, есть ли активная игра
-    if chat_id not in active_games:
-        await query.answer("❌ Игра уже завершена!", show_alert=True)
-        return
-    
-    game = active_games[chat_id]
-    
+    await _post_click(update, _stand)
+
+
+async def _stand(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame, query: CallbackQuery,
+                 player_index: int) -> None:
     # Проверяем, что это ход правильного игрока
     if (player_index != game.current_player_index or 
         game.players[player_index].user_id != query.from_user.id):
-        await query.answer("❌ Сейчас не ваш ход!", show_alert=True)
+        await answer_callback(query, "❌ Сейчас не ваш ход!", show_alert=True)
         return
     
     player = game.players[player_index]
     player.is_stand = True
+    _journal(game)
     
-    await query.answer(f"✋ Вы остановились с {player.score} очками.", show_alert=False)
+    await answer_callback(query, f"✋ Вы остановились с {player.score} очками.")
     
     # Переходим к следующему игроку или завершаем игру
     await continue_game(context, game)
 
 async def continue_game(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame):
     """Продолжить игру - перейти к следующему игроку или завершить"""
+    game.drop_view()
     if game.next_player():
         current_player = game.get_current_player()
         if current_player:
             # Показываем анимацию перехода
             transition_text = f"🎰 **БЛЕКДЖЕК - ИГРА ИДЕТ**\n\n"
-            transition_text += f"🏦 **Дилер:** {game.format_dealer_cards()} (очки: {game.dealer_cards[0].value}+?)\n\n"
+            transition_text += f"🏦 **Дилер:** {game.format_dealer_cards()} (очки: {CARD_VALUES[game.dealer_cards[0]]}+?)\n\n"
             transition_text += "👥 **Игроки:**\n"
             for i, p in enumerate(game.players):
                 status_icon = ""
@@ -837,9 +911,9 @@ async def continue_game(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame)
                         parse_mode=ParseMode.MARKDOWN
                     )
                 except Exception as e:
-                    logger.warning(f"Failed to edit message with transition: {e}")
+                    logger.warning("Failed to edit message with transition: %s", e)
             
-            await asyncio.sleep(2)
+            await pause(2)
             
             # Показываем игровое меню для нового игрока
             keyboard = game.get_game_keyboard(game.current_player_index)
@@ -854,16 +928,17 @@ async def continue_game(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame)
                     parse_mode=ParseMode.MARKDOWN
                 )
             except Exception as e:
-                logger.error(f"Failed to send game message: {e}")
+                logger.error("Failed to send game message: %s", e)
     else:
         # Все игроки завершили ходы, играет дилер
         await dealer_turn(context, game)
 
 async def dealer_turn(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame):
     """Ход дилера с анимацией"""
+    _journal(game, "dealer")
     # Убираем кнопки и показываем переход к дилеру
     transition_text = f"🎰 **БЛЕКДЖЕК - ХОД ДИЛЕРА**\n\n"
-    transition_text += f"🏦 **Дилер:** {game.format_dealer_cards()} (очки: {game.dealer_cards[0].value}+?)\n\n"
+    transition_text += f"🏦 **Дилер:** {game.format_dealer_cards()} (очки: {CARD_VALUES[game.dealer_cards[0]]}+?)\n\n"
     transition_text += "👥 **Игроки завершили ходы:**\n"
     for player in game.players:
         status_icon = ""
@@ -887,13 +962,11 @@ async def dealer_turn(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame):
                 parse_mode=ParseMode.MARKDOWN
             )
         except Exception as e:
-            logger.warning(f"Failed to edit message: {e}")
-    
-    await asyncio.sleep(3)
+            logger.warning("Failed to edit message: %s", e)
     
-    # Открываем скрытую карту дилера
-    game.dealer_score = game.calculate_score(game.dealer_cards)
+    await pause(3)
     
+    # Открываем скрытую карту дилера (очки с ней уже посчитаны при раздаче)
     reveal_text = f"🎰 **БЛЕКДЖЕК - ХОД ДИЛЕРА**\n\n"
     reveal_text += f"🏦 **Дилер открыл карты:** {game.format_dealer_cards(hide_second=False)} (очки: {game.dealer_score})\n\n"
     reveal_text += "👥 **Игроки:**\n"
@@ -925,68 +998,66 @@ async def dealer_turn(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame):
             parse_mode=ParseMode.MARKDOWN
         )
     except Exception as e:
-        logger.error(f"Failed to edit dealer reveal message: {e}")
+        logger.error("Failed to edit dealer reveal message: %s", e)
     
-    await asyncio.sleep(3)
+    await pause(3)
     
     # Дилер берет карты пока у него меньше 17
     while game.dealer_score < 17:
-        if game.deck:
-            # Анимация взятия карты дилером
-            taking_text = reveal_text + f"\n\n🃏 **Дилер берет карту...**"
-            
-            try:
-                await context.bot.edit_message_text(
-                    chat_id=game.chat_id,
-                    message_id=game.game_messages[-1],
-                    text=taking_text,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            except Exception as e:
-                logger.error(f"Failed to edit taking card message: {e}")
-            
-            await asyncio.sleep(2)
-            
-            # Берем карту
-            card = game.deck.pop()
-            game.dealer_cards.append(card)
-            game.dealer_score = game.calculate_score(game.dealer_cards)
-            
-            # Обновляем сообщение с новой картой
-            reveal_text = f"🎰 **БЛЕКДЖЕК - ХОД ДИЛЕРА**\n\n"
-            reveal_text += f"🏦 **Дилер:** {game.format_dealer_cards(hide_second=False)} (очки: {game.dealer_score})\n\n"
-            reveal_text += "👥 **Игроки:**\n"
-            for player in game.players:
-                status_icon = ""
-                if player.is_blackjack:
-                    status_icon = "🎯"
-                elif player.is_bust:
-                    status_icon = "💥"
-                elif player.is_stand:
-                    status_icon = "✋"
-                
-                reveal_text += f"{status_icon} **{player.first_name}:** {game.format_cards(player.cards)} (очки: {player.score})\n"
-            
-            reveal_text += f"\n🃏 **Дилер взял:** {card}"
-            
-            if game.dealer_score > 21:
-                reveal_text += f"\n💥 **У дилера перебор!**"
-            elif game.dealer_score >= 17:
-                reveal_text += f"\n✋ **Дилер останавливается**"
-            else:
-                reveal_text += f"\n🤔 **Дилер должен брать еще...**"
-            
-            try:
-                await context.bot.edit_message_text(
-                    chat_id=game.chat_id,
-                    message_id=game.game_messages[-1],
-                    text=reveal_text,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            except Exception as e:
-                logger.error(f"Failed to edit dealer card message: {e}")
+        # Анимация взятия карты дилером
+        taking_text = reveal_text + f"\n\n🃏 **Дилер берет карту...**"
+        
+        try:
+            await context.bot.edit_message_text(
+                chat_id=game.chat_id,
+                message_id=game.game_messages[-1],
+                text=taking_text,
+                parse_mode=ParseMode.MARKDOWN
+            )
+        except Exception as e:
+            logger.error("Failed to edit taking card message: %s", e)
+        
+        await pause(2)
+        
+        # Берем карту
+        card = game.shoe.draw()
+        game.add_dealer_card(card)
+        
+        # Обновляем сообщение с новой картой
+        reveal_text = f"🎰 **БЛЕКДЖЕК - ХОД ДИЛЕРА**\n\n"
+        reveal_text += f"🏦 **Дилер:** {game.format_dealer_cards(hide_second=False)} (очки: {game.dealer_score})\n\n"
+        reveal_text += "👥 **Игроки:**\n"
+        for player in game.players:
+            status_icon = ""
+            if player.is_blackjack:
+                status_icon = "🎯"
+            elif player.is_bust:
+                status_icon = "💥"
+            elif player.is_stand:
+                status_icon = "✋"
             
-            await asyncio.sleep(3)
+            reveal_text += f"{status_icon} **{player.first_name}:** {game.format_cards(player.cards)} (очки: {player.score})\n"
+        
+        reveal_text += f"\n🃏 **Дилер взял:** {CARD_LABELS[card]}"
+        
+        if game.dealer_score > 21:
+            reveal_text += f"\n💥 **У дилера перебор!**"
+        elif game.dealer_score >= 17:
+            reveal_text += f"\n✋ **Дилер останавливается**"
+        else:
+            reveal_text += f"\n🤔 **Дилер должен брать еще...**"
+        
+        try:
+            await context.bot.edit_message_text(
+                chat_id=game.chat_id,
+                message_id=game.game_messages[-1],
+                text=reveal_text,
+                parse_mode=ParseMode.MARKDOWN
+            )
+        except Exception as e:
+            logger.error("Failed to edit dealer card message: %s", e)
+        
+        await pause(3)
     
     # Финальная пауза перед результатами
     final_dealer_text = reveal_text + f"\n\n⏳ **Подсчитываю результаты...**"
@@ -999,9 +1070,9 @@ async def dealer_turn(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame):
             parse_mode=ParseMode.MARKDOWN
         )
     except Exception as e:
-        logger.error(f"Failed to edit final dealer message: {e}")
+        logger.error("Failed to edit final dealer message: %s", e)
     
-    await asyncio.sleep(3)
+    await pause(3)
     await end_game(context, game)
 
 async def end_game(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame):
@@ -1009,6 +1080,9 @@ async def end_game(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame):
     from economy import (get_user_balance, add_user_balance, get_user_slave, 
                         set_user_slave, remove_user_slave, get_slave_owner)
     
+    # Выплаты начались: после перезапуска ставки уже не возвращаем, иначе можно заплатить дважды
+    _journal(game, "payout")
+    
     results_message = "🎰 **РЕЗУЛЬТАТЫ ИГРЫ**\n\n"
     results_message += f"🏦 **Дилер:** {game.format_dealer_cards(hide_second=False)} (очки: {game.dealer_score})\n\n"
     
@@ -1073,17 +1147,35 @@ async def end_game(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame):
             parse_mode=ParseMode.MARKDOWN
         )
     except Exception as e:
-        logger.error(f"Failed to send results message: {e}")
+        logger.error("Failed to send results message: %s", e)
     
     try:
         await process_game_results(context, game, winners, slave_players, slave_participating)
     except Exception as e:
-        logger.error(f"Error processing game results: {e}")
+        logger.error("Error processing game results: %s", e)
     
     # Удаляем игру из активных (всегда выполняется, даже если была ошибка в обработке результатов)
     if game.chat_id in active_games:
         del active_games[game.chat_id]
-        logger.info(f"Game cleanup completed for chat {game.chat_id}")
+        logger.info("Game cleanup completed for chat %s", game.chat_id)
+    game_journal.forget(game.chat_id)
+    blackjack_shoe.save(game.chat_id, game.shoe)
+
+def payout(player: Player, dealer_score: int) -> int:
+    """Сколько вернуть игроку за денежную ставку вместе с ней (0 — ставка проиграна).
+
+    Блекджек платит 2.5x, если у дилера не 21; победа — 2x; ничья возвращает ставку.
+    Те же правила считает benchmarks/blackjack_sim.py — меняя их, поправьте и симулятор.
+    """
+    if player.is_bust:
+        return 0
+    if player.is_blackjack and dealer_score != 21:
+        return int(player.bet * 2.5)
+    if dealer_score > 21 or player.score > dealer_score:
+        return player.bet * 2
+    if player.score == dealer_score:
+        return player.bet
+    return 0
 
 async def process_game_results(context, game, winners, slave_players, slave_participating):
     """Обрабатывает результаты игры с упрощенной логикой рабов"""
@@ -1093,14 +1185,9 @@ async def process_game_results(context, game, winners, slave_players, slave_part
     # Сначала обрабатываем обычные денежные выплаты для всех игроков
     for player in game.players:
         if not player.slave_bet:  # только денежные ставки
-            if player.is_blackjack and game.dealer_score != 21:
-                add_user_balance(player.user_id, int(player.bet * 2.5))
-            elif game.dealer_score > 21 and not player.is_bust:
-                add_user_balance(player.user_id, player.bet * 2)
-            elif player.score > game.dealer_score and not player.is_bust:
-                add_user_balance(player.user_id, player.bet * 2)
-            elif player.score == game.dealer_score and not player.is_bust:
-                add_user_balance(player.user_id, player.bet)
+            winnings = payout(player, game.dealer_score)
+            if winnings:
+                add_user_balance(player.user_id, winnings)
     
     # Теперь обрабатываем ставки рабами по упрощенным правилам
     for slave_player in slave_players:
@@ -1210,11 +1297,8 @@ async def process_game_results(context, game, winners, slave_players, slave_part
 
 async def show_betting_for_player(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame, player_index: int):
     """Показать интерфейс ставок для игрока"""
-    from economy import get_user_balance, get_user_slave
-    
     player = game.players[player_index]
-    balance = get_user_balance(player.user_id)
-    slave_info = get_user_slave(player.user_id)
+    balance = game.cached_balance(player.user_id)
     
     betting_text = f"🎰 **БЛЕКДЖЕК - СТАВКИ**\n\n"
     betting_text += f"👤 **Ход игрока:** {player.first_name}\n"
@@ -1251,52 +1335,34 @@ async def show_betting_for_player(context: ContextTypes.DEFAULT_TYPE, game: Blac
         )
         game.game_messages.append(betting_msg.message_id)
     except Exception as e:
-        logger.error(f"Failed to send betting message: {e}")
+        logger.error("Failed to send betting message: %s", e)
 
 async def cb_blackjack_bet_slave(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка ставки рабом"""
+    await _post_click(update, _bet_slave)
+
+
+async def _bet_slave(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame, query: CallbackQuery,
+                     player_index: int) -> None:
     from economy import get_user_slave, remove_user_slave
     
-    query = update.callback_query
-    if not query or not query.data or not query.from_user:
-        return
-    
-    await query.answer()
-    
-    # Парсим данные callback
-    try:
-        _, chat_id_str, player_index_str = query.data.split(":")
-        chat_id = int(chat_id_str)
-        player_index = int(player_index_str)
-    except (ValueError, IndexError):
-        await query.answer("❌ Ошибка обработки команды.", show_alert=True)
-        return
-    
-    # Проверяем, есть ли активная игра
-    if chat_id not in active_games:
-        await query.answer("❌ Игра уже завершена!", show_alert=True)
-        return
-    
-    game = active_games[chat_id]
-    
-    # Проверяем фазу ставок и правильного игрока
-    if (not game.is_betting_phase or 
-        player_index != game.current_betting_player or 
-        game.players[player_index].user_id != query.from_user.id):
-        await query.answer("❌ Сейчас не ваш ход для ставки!", show_alert=True)
+    error = _betting_turn_error(game, query, player_index)
+    if error:
+        await answer_callback(query, error, show_alert=True)
         return
     
     player = game.players[player_index]
+    # Раб уходит на кон — читаем из файла, снимок мог устареть
     slave_info = get_user_slave(player.user_id)
     
     # Проверяем, есть ли раб
     if not slave_info:
-        await query.answer("❌ У вас нет раба!", show_alert=True)
+        await answer_callback(query, "❌ У вас нет раба!", show_alert=True)
         return
     
     # Проверяем, что нет денежной ставки
     if player.temp_bet > 0:
-        await query.answer("❌ Нельзя ставить раба вместе с деньгами!", show_alert=True)
+        await answer_callback(query, "❌ Нельзя ставить раба вместе с деньгами!", show_alert=True)
         return
     
     # Ставим раба
@@ -1305,18 +1371,18 @@ async def cb_blackjack_bet_slave(update: Update, context: ContextTypes.DEFAULT_T
     
     # Забираем раба у игрока
     remove_user_slave(player.user_id)
+    game.slaves[player.user_id] = None
+    _journal(game)
     
-    await query.answer(f"👤 Поставлен раб: {slave_info['slave_name']}", show_alert=False)
+    await answer_callback(query, f"👤 Поставлен раб: {slave_info['slave_name']}")
     
     # Обновляем сообщение
-    await update_betting_message(context, game, player_index)
+    update_betting_message(game, player_index)
 
-async def update_betting_message(context, game, player_index):
-    """Обновляет сообщение ставок"""
-    from economy import get_user_balance, get_user_slave
-    
+def update_betting_message(game, player_index):
+    """Обновляет сообщение ставок (правку отправит актор игры)"""
     player = game.players[player_index]
-    balance = get_user_balance(player.user_id)
+    balance = game.cached_balance(player.user_id)
     
     betting_text = f"🎰 **БЛЕКДЖЕК - СТАВКИ**\n\n"
     betting_text += f"👤 **Ход игрока:** {player.first_name}\n"
@@ -1342,50 +1408,20 @@ async def update_betting_message(context, game, player_index):
     
     betting_text += f"\n💡 **Выберите фишки для ставки:**"
     
-    keyboard = game.get_betting_keyboard(player_index)
-    
-    try:
-        await context.bot.edit_message_text(
-            chat_id=game.chat_id,
-            message_id=game.game_messages[-1],
-            text=betting_text,
-            reply_markup=keyboard,
-            parse_mode=ParseMode.MARKDOWN
-        )
-    except Exception as e:
-        logger.error(f"Failed to update betting message: {e}")
+    game.show(game.game_messages[-1], betting_text, game.get_betting_keyboard(player_index))
 
 async def cb_blackjack_bet_reset(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка сброса ставки"""
-    from economy import get_user_balance, set_user_slave
-    
-    query = update.callback_query
-    if not query or not query.data or not query.from_user:
-        return
-    
-    await query.answer()
-    
-    # Парсим данные callback
-    try:
-        _, chat_id_str, player_index_str = query.data.split(":")
-        chat_id = int(chat_id_str)
-        player_index = int(player_index_str)
-    except (ValueError, IndexError):
-        await query.answer("❌ Ошибка обработки команды.", show_alert=True)
-        return
-    
-    # Проверяем, есть ли активная игра
-    if chat_id not in active_games:
-        await query.answer("❌ Игра уже завершена!", show_alert=True)
-        return
-    
-    game = active_games[chat_id]
+    await _post_click(update, _bet_reset)
+
+
+async def _bet_reset(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame, query: CallbackQuery,
+                     player_index: int) -> None:
+    from economy import set_user_slave
     
-    # Проверяем фазу ставок и правильного игрока
-    if (not game.is_betting_phase or 
-        player_index != game.current_betting_player or 
-        game.players[player_index].user_id != query.from_user.id):
-        await query.answer("❌ Сейчас не ваш ход для ставки!", show_alert=True)
+    error = _betting_turn_error(game, query, player_index)
+    if error:
+        await answer_callback(query, error, show_alert=True)
         return
     
     player = game.players[player_index]
@@ -1394,47 +1430,30 @@ async def cb_blackjack_bet_reset(update: Update, context: ContextTypes.DEFAULT_T
         slave_info = player.slave_bet_info
         set_user_slave(player.user_id, slave_info["slave_id"], 
                       slave_info["purchase_price"], slave_info["slave_name"])
+        game.slaves[player.user_id] = slave_info
         player.slave_bet = False
         player.slave_bet_info = None
-        await query.answer("🗑️ Ставка раба сброшена!", show_alert=False)
+        _journal(game)
+        await answer_callback(query, "🗑️ Ставка раба сброшена!")
     else:
         player.temp_bet = 0
-        await query.answer("🗑️ Ставка сброшена!", show_alert=False)
+        await answer_callback(query, "🗑️ Ставка сброшена!")
     
     # Обновляем сообщение
-    await update_betting_message(context, game, player_index)
+    update_betting_message(game, player_index)
 
 async def cb_blackjack_bet_accept(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка принятия ставки"""
-    from economy import get_user_balance, add_user_balance
-    
-    query = update.callback_query
-    if not query or not query.data or not query.from_user:
-        return
-    
-    await query.answer()
-    
-    # Парсим данные callback
-    try:
-        _, chat_id_str, player_index_str = query.data.split(":")
-        chat_id = int(chat_id_str)
-        player_index = int(player_index_str)
-    except (ValueError, IndexError):
-        await query.answer("❌ Ошибка обработки команды.", show_alert=True)
-        return
-    
-    # Проверяем, есть ли активная игра
-    if chat_id not in active_games:
-        await query.answer("❌ Игра уже завершена!", show_alert=True)
-        return
-    
-    game = active_games[chat_id]
+    await _post_click(update, _bet_accept)
+
+
+async def _bet_accept(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame, query: CallbackQuery,
+                      player_index: int) -> None:
+    from economy import try_debit
     
-    # Проверяем фазу ставок и правильного игрока
-    if (not game.is_betting_phase or 
-        player_index != game.current_betting_player or 
-        game.players[player_index].user_id != query.from_user.id):
-        await query.answer("❌ Сейчас не ваш ход для ставки!", show_alert=True)
+    error = _betting_turn_error(game, query, player_index)
+    if error:
+        await answer_callback(query, error, show_alert=True)
         return
     
     player = game.players[player_index]
@@ -1442,29 +1461,36 @@ async def cb_blackjack_bet_accept(update: Update, context: ContextTypes.DEFAULT_
     if player.slave_bet:
         # Ставка рабом
         if not player.slave_bet_info:
-            await query.answer("❌ Ошибка данных раба!", show_alert=True)
+            await answer_callback(query, "❌ Ошибка данных раба!", show_alert=True)
             return
         
         player.bet = player.slave_bet_info["purchase_price"]  # для отображения
-        await query.answer(f"✅ Ставка рабом {player.slave_bet_info['slave_name']} принята!", show_alert=False)
+        await answer_callback(query, f"✅ Ставка рабом {player.slave_bet_info['slave_name']} принята!")
     else:
         # Денежная ставка
         if player.temp_bet <= 0:
-            await query.answer("❌ Сделайте ставку перед принятием!", show_alert=True)
+            await answer_callback(query, "❌ Сделайте ставку перед принятием!", show_alert=True)
             return
         
-        # Списываем деньги и подтверждаем ставку
-        if not add_user_balance(player.user_id, -player.temp_bet):
-            await query.answer("❌ Ошибка списания средств!", show_alert=True)
+        # Фишки проверялись по снимку игры, поэтому списание проверяет баланс ещё раз; новый баланс — в снимок
+        debited, game.balances[player.user_id] = try_debit(player.user_id, player.temp_bet)
+        if not debited:
+            # Монеты потратили вне игры — ставку собирать заново от настоящего баланса
+            player.temp_bet = 0
+            await answer_callback(query, "❌ Недостаточно средств! Баланс изменился, сделайте ставку заново.",
+                                  show_alert=True)
+            update_betting_message(game, player_index)
             return
         
         player.bet = player.temp_bet
-        await query.answer(f"✅ Ставка {player.bet} монет принята!", show_alert=False)
+        await answer_callback(query, f"✅ Ставка {player.bet} монет принята!")
     
     player.temp_bet = 0
     
-    # Переходим к следующему игроку или начинаем игру
+    # Переходим к следующему игроку или начинаем игру; сообщение ставок дальше меняется напрямую
+    game.drop_view()
     game.current_betting_player += 1
+    _journal(game)
     
     if game.current_betting_player >= len(game.players):
         # Все игроки сделали ставки, начинаем игру
@@ -1479,7 +1505,7 @@ async def cb_blackjack_bet_accept(update: Update, context: ContextTypes.DEFAULT_
             )
             game.game_messages.pop()
         except Exception as e:
-            logger.warning(f"Failed to delete betting message: {e}")
+            logger.warning("Failed to delete betting message: %s", e)
         
         await show_betting_for_player(context, game, game.current_betting_player)
 
@@ -1492,7 +1518,7 @@ async def animated_card_dealing(context: ContextTypes.DEFAULT_TYPE, game: Blackj
             message_id=game.signup_message_id
         )
     except Exception as e:
-        logger.warning(f"Failed to delete signup message: {e}")
+        logger.warning("Failed to delete signup message: %s", e)
     
     # Начальное сообщение
     initial_text = "🎰 **БЛЕКДЖЕК - ИГРА НАЧАЛАСЬ!**\n\nРаздача карт..."
@@ -1505,15 +1531,15 @@ async def animated_card_dealing(context: ContextTypes.DEFAULT_TYPE, game: Blackj
         )
         game.game_messages.append(game_msg.message_id)
     except Exception as e:
-        logger.error(f"Failed to send initial message: {e}")
+        logger.error("Failed to send initial message: %s", e)
         return
     
-    await asyncio.sleep(3)
+    await pause(3)
     
     # Создаем колоду и начинаем игру
     game.is_signup_phase = False
     game.is_game_active = True
-    game.deck = game.create_deck()
+    game.shoe = blackjack_shoe.shoe_for_round(game.chat_id)
     
     # Показываем список игроков
     players_text = "🎰 **БЛЕКДЖЕК - ИГРА НАЧАЛАСЬ!**\n\n👥 **Игроки получили:**\n"
@@ -1528,14 +1554,13 @@ async def animated_card_dealing(context: ContextTypes.DEFAULT_TYPE, game: Blackj
             parse_mode=ParseMode.MARKDOWN
         )
     except Exception as e:
-        logger.error(f"Failed to edit message: {e}")
+        logger.error("Failed to edit message: %s", e)
     
-    await asyncio.sleep(2)
+    await pause(2)
     
     # Первый круг - раздаем по одной карте каждому игроку
     for i, player in enumerate(game.players):
-        card = game.deck.pop()
-        player.cards.append(card)
+        player.add_card(game.shoe.draw())
         
         # Обновляем сообщение с новой картой
         updated_text = "🎰 **БЛЕКДЖЕК - ИГРА НАЧАЛАСЬ!**\n\n👥 **Игроки получили:**\n"
@@ -1553,16 +1578,16 @@ async def animated_card_dealing(context: ContextTypes.DEFAULT_TYPE, game: Blackj
                 parse_mode=ParseMode.MARKDOWN
             )
         except Exception as e:
-            logger.error(f"Failed to edit message: {e}")
+            logger.error("Failed to edit message: %s", e)
         
-        await asyncio.sleep(1.5)
+        await pause(1.5)
     
     # Дилер получает первую карту
-    dealer_first_card = game.deck.pop()
-    game.dealer_cards.append(dealer_first_card)
+    dealer_first_card = game.shoe.draw()
+    game.add_dealer_card(dealer_first_card)
     
     updated_text = "🎰 **БЛЕКДЖЕК - ИГРА НАЧАЛАСЬ!**\n\n"
-    updated_text += f"🏦 **Дилер:** {dealer_first_card}\n\n"
+    updated_text += f"🏦 **Дилер:** {CARD_LABELS[dealer_first_card]}\n\n"
     updated_text += "👥 **Игроки получили:**\n"
     for player in game.players:
         updated_text += f"• **{player.first_name}:** {game.format_cards(p.cards)}\n"
@@ -1575,15 +1600,13 @@ async def animated_card_dealing(context: ContextTypes.DEFAULT_TYPE, game: Blackj
             parse_mode=ParseMode.MARKDOWN
         )
     except Exception as e:
-        logger.error(f"Failed to edit message: {e}")
+        logger.error("Failed to edit message: %s", e)
     
-    await asyncio.sleep(2)
+    await pause(2)
     
     # Второй круг - раздаем вторую карту игрокам
     for i, player in enumerate(game.players):
-        card = game.deck.pop()
-        player.cards.append(card)
-        player.score = game.calculate_score(player.cards)
+        player.add_card(game.shoe.draw())
         
         # Проверяем блекджек
         if player.score == 21:
@@ -1591,7 +1614,7 @@ async def animated_card_dealing(context: ContextTypes.DEFAULT_TYPE, game: Blackj
         
         # Обновляем сообщение
         updated_text = "🎰 **БЛЕКДЖЕК - ИГРА НАЧАЛАСЬ!**\n\n"
-        updated_text += f"🏦 **Дилер:** {dealer_first_card} + 🂠\n\n"
+        updated_text += f"🏦 **Дилер:** {CARD_LABELS[dealer_first_card]} + 🂠\n\n"
         updated_text += "👥 **Игроки получили:**\n"
         for j, p in enumerate(game.players):
             if j <= i:
@@ -1611,21 +1634,21 @@ async def animated_card_dealing(context: ContextTypes.DEFAULT_TYPE, game: Blackj
                 parse_mode=ParseMode.MARKDOWN
             )
         except Exception as e:
-            logger.error(f"Failed to edit message: {e}")
+            logger.error("Failed to edit message: %s", e)
         
-        await asyncio.sleep(1.5)
+        await pause(1.5)
     
     # Дилер получает вторую карту (скрытую)
-    dealer_hidden_card = game.deck.pop()
-    game.dealer_cards.append(dealer_hidden_card)
+    dealer_hidden_card = game.shoe.draw()
+    game.add_dealer_card(dealer_hidden_card)
     game.dealer_hidden_card = dealer_hidden_card
-    game.dealer_score = game.calculate_score(game.dealer_cards)
+    _journal(game)
     
-    await asyncio.sleep(2)
+    await pause(2)
     
     # Финальное сообщение о раздаче
     final_text = "🎰 **БЛЕКДЖЕК - РАЗДАЧА ЗАВЕРШЕНА**\n\n"
-    final_text += f"🏦 **Дилер:** {dealer_first_card} + 🂠\n\n"
+    final_text += f"🏦 **Дилер:** {CARD_LABELS[dealer_first_card]} + 🂠\n\n"
     final_text += "👥 **Игроки:**\n"
     for player in game.players:
         cards_text = game.format_cards(player.cards)
@@ -1642,9 +1665,9 @@ async def animated_card_dealing(context: ContextTypes.DEFAULT_TYPE, game: Blackj
             parse_mode=ParseMode.MARKDOWN
         )
     except Exception as e:
-        logger.error(f"Failed to edit message: {e}")
+        logger.error("Failed to edit message: %s", e)
     
-    await asyncio.sleep(3)
+    await pause(3)
     
     # Начинаем ходы игроков
     current_player = game.get_current_player()
@@ -1661,52 +1684,85 @@ async def animated_card_dealing(context: ContextTypes.DEFAULT_TYPE, game: Blackj
             )
             game.game_messages.append(msg.message_id)
         except Exception as e:
-            logger.error(f"Failed to send game message: {e}")
+            logger.error("Failed to send game message: %s", e)
     else:
         # Если у первого игрока блекджек, переходим к следующему
         await continue_game(context, game)
 
-async def update_signup_timer(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame):
-    """Обновлять таймер набора игроков"""
-    while game.is_signup_phase and time.time() < game.signup_end_time:
-        remaining_time = int(game.signup_end_time - time.time())
-        
-        if remaining_time <= 0:
-            break
-        
-        # Обновляем сообщение каждые 5 секунд
-        if remaining_time % 5 == 0 or remaining_time <= 10:
-            try:
-                keyboard = game.get_signup_keyboard()
-                message_text = create_signup_message(game, remaining_time)
-                
-                if game.has_photo_message:
-                    await context.bot.edit_message_caption(
-                        chat_id=game.chat_id,
-                        message_id=game.signup_message_id,
-                        caption=message_text,
-                        reply_markup=keyboard,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                else:
-                    await context.bot.edit_message_text(
-                        chat_id=game.chat_id,
-                        message_id=game.signup_message_id,
-                        text=message_text,
-                        reply_markup=keyboard,
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-            except Exception as e:
-                logger.warning(f"Failed to update signup message: {e}")
-        
-        await asyncio.sleep(1)
-    
-    # Время вышло или игра началась досрочно
-    if game.is_signup_phase:
+def show_signup_message(game: BlackjackGame) -> None:
+    """Перерисовать сообщение набора (правку отправит актор игры)"""
+    remaining_time = max(0, round(game.signup_end_time - time.time()))
+    game.show(game.signup_message_id, create_signup_message(game, remaining_time),
+              game.get_signup_keyboard(), caption=game.has_photo_message)
+
+
+def _signup_delay(remaining: float) -> float:
+    """Через сколько секунд обновить таймер: каждые SIGNUP_REFRESH_INTERVAL секунд,
+    на отметке SIGNUP_LAST_CALL и в конце набора"""
+    # Отметку, до которой меньше полсекунды, пропускаем — иначе две правки подряд
+    limit = remaining - 0.5
+    stops = (0, SIGNUP_LAST_CALL, (math.ceil(limit / SIGNUP_REFRESH_INTERVAL) - 1) * SIGNUP_REFRESH_INTERVAL)
+    next_stop = max((stop for stop in stops if 0 <= stop < limit), default=0)
+    return max(0.0, remaining - next_stop)
+
+
+async def _signup_deadline(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Задание job_queue: время обновить таймер набора — передаём тик актору игры"""
+    game = context.job.data
+    if game._signup_job is context.job:
+        game._signup_job = None
+    if active_games.get(game.chat_id) is game:
+        game.post(_signup_tick)
+
+
+async def _signup_tick(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame, query: None) -> None:
+    """Тик таймера набора игроков: обновить сообщение и назначить следующий или закончить набор"""
+    if not game.is_signup_phase:
+        return
+    if game.signup_end_time - time.time() < 0.5:
         await end_signup_phase(context, game)
+    else:
+        show_signup_message(game)
+        game.schedule_signup_tick(context)
+
+
+async def _run_event(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame, event: tuple) -> None:
+    action, query, args = event
+    # У каждого события свой замер: задача актора живёт дольше команды, которая создала игру
+    with handler_scope(f"blackjack:{action.__name__.lstrip('_')}"):
+        try:
+            await action(context, game, query, *args)
+        except Exception:
+            logger.exception("Blackjack %s failed in chat %s", action.__name__, game.chat_id)
+
+
+async def run_game(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame) -> None:
+    """Актор игры — единственная задача, которая меняет её состояние.
+
+    Нажатия приходят в game.inbox и выполняются строго по очереди, так что двойной клик
+    не сделает два хода. Тики таймера набора ставит туда же задание job_queue (_signup_deadline).
+    Всё, что накопилось в очереди, обрабатывается пачкой, после неё — одна правка сообщения.
+    """
+    while active_games.get(game.chat_id) is game:
+        await _run_event(context, game, await game.inbox.get())
+        game.inbox.task_done()
+        while not game.inbox.empty() and active_games.get(game.chat_id) is game:
+            await _run_event(context, game, game.inbox.get_nowait())
+            game.inbox.task_done()
+        if active_games.get(game.chat_id) is game:
+            with handler_scope("blackjack:render"):
+                await game.flush_view(context.bot)
+    # Игра закончилась — нажатия, которые не успели обработать, получают ответ
+    while not game.inbox.empty():
+        _, query, _ = game.inbox.get_nowait()
+        if query is not None:
+            await answer_callback(query, "❌ Игра уже завершена!", show_alert=True)
+        game.inbox.task_done()
 
 async def end_signup_phase(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGame):
     """Завершить фазу набора игроков"""
+    game.cancel_signup_tick()
+    game.drop_view()
     if len(game.players) < MIN_PLAYERS:
         # Недостаточно игроков - отменяем игру
         cancel_text = f"❌ **ИГРА ОТМЕНЕНА**\n\nНедостаточно игроков для начала игры!\nТребуется минимум {MIN_PLAYERS} игрока, записалось: {len(game.players)}"
@@ -1729,21 +1785,24 @@ async def end_signup_phase(context: ContextTypes.DEFAULT_TYPE, game: BlackjackGa
                     parse_mode=ParseMode.MARKDOWN
                 )
         except Exception as e:
-            logger.error(f"Failed to send cancel message: {e}")
+            logger.error("Failed to send cancel message: %s", e)
         
         # Удаляем игру из активных
         if game.chat_id in active_games:
             del active_games[game.chat_id]
+        game_journal.forget(game.chat_id)
         
-        logger.info(f"Blackjack game cancelled in chat {game.chat_id} - not enough players")
+        logger.info("Blackjack game cancelled in chat %s - not enough players", game.chat_id)
         return
     
-    # Достаточно игроков - начинаем фазу ставок
+    # Достаточно игроков - начинаем фазу ставок; свежий снимок балансов и рабов всех игроков одним чтением
+    game.load_wallets()
     game.is_signup_phase = False
     game.is_betting_phase = True
     game.current_betting_player = 0
+    _journal(game)
     
-    logger.info(f"Starting betting phase for blackjack game in chat {game.chat_id} with {len(game.players)} players")
+    logger.info("Starting betting phase for blackjack game in chat %s with %s players", game.chat_id, len(game.players))
     
     # Показываем интерфейс ставок для первого игрока
     await show_betting_for_player(context, game, 0)
@@ -1761,6 +1820,72 @@ async def delete_non_game_messages(context: ContextTypes.DEFAULT_TYPE, chat_id:
     # и удаления тех, которые не связаны с игрой
     pass
 
+async def restore_games(app, snapshots: List[Dict[str, Any]]) -> None:
+    """Поднять игры из журнала после перезапуска (вызывается из game_journal.recover_games).
+
+    Набор игроков продолжается с того же сообщения. Партии, где уже шли ставки или раздача,
+    отменяются: монеты и поставленные рабы возвращаются одной транзакцией.
+    """
+    from economy import return_stakes
+
+    context = CallbackContext(app)
+    coins: Dict[int, int] = {}
+    slaves: Dict[int, Dict[str, Any]] = {}
+    cancelled: List[int] = []
+    for snapshot in snapshots:
+        chat_id = snapshot["chat_id"]
+        phase = snapshot["phase"]
+        if phase == "signup" and snapshot.get("message_id"):
+            game = BlackjackGame(chat_id, snapshot["admin_id"])
+            for entry in snapshot["players"]:
+                game.add_player(entry["id"], entry.get("username", ""), entry["name"])
+            game.signup_message_id = snapshot["message_id"]
+            game.has_photo_message = snapshot.get("photo", False)
+            game.signup_end_time = max(snapshot["signup_end_time"], time.time() + SIGNUP_RESUME_TIME)
+            active_games[chat_id] = game
+            _journal(game)
+            game.start(context)
+            logger.info("Resumed blackjack signup in chat %s with %d players", chat_id, len(game.players))
+            continue
+        if snapshot.get("shoe"):
+            # Карты, которые уже видели за столом, не должны прийти снова
+            blackjack_shoe.restore(chat_id, snapshot["shoe"])
+        if phase == "payout":
+            # Часть выплат могла пройти — вернуть ставки значит рискнуть заплатить дважды
+            logger.error("Blackjack game in chat %s stopped during payout, stakes not returned: %s",
+                         chat_id, snapshot["players"])
+            continue
+        for entry in snapshot["players"]:
+            if entry.get("slave"):
+                slaves[entry["id"]] = entry["slave"]
+            elif entry.get("bet"):
+                coins[entry["id"]] = coins.get(entry["id"], 0) + entry["bet"]
+        if phase != "signup":
+            cancelled.append(chat_id)
+
+    if coins or slaves:
+        await asyncio.to_thread(return_stakes, coins, slaves)
+        # Сразу убираем отменённые игры из журнала, чтобы следующий старт не вернул ставки ещё раз.
+        # Не в потоке: возобновлённые наборы уже пишут в журнал из цикла событий
+        game_journal.compact()
+        logger.info("Returned blackjack stakes: %d coin bets, %d slaves", len(coins), len(slaves))
+    if cancelled:
+        # Telegram может отвечать медленно — старт бота это не задерживает
+        asyncio.create_task(_announce_cancelled(context, cancelled))
+
+
+async def _announce_cancelled(context: ContextTypes.DEFAULT_TYPE, chat_ids: List[int]) -> None:
+    async def announce(chat_id: int) -> None:
+        try:
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text="♻️ Бот перезапустился посреди игры в блекджек — игра отменена, ставки возвращены."
+            )
+        except Exception as e:
+            logger.warning("Failed to announce cancelled blackjack game in chat %s: %s", chat_id, e)
+
+    await asyncio.gather(*(announce(chat_id) for chat_id in chat_ids))
+
 def is_game_active(chat_id: int) -> bool:
     """Проверить, идет ли активная игра в чате"""
     return chat_id in active_games and active_games[chat_id].is_game_active
@@ -0,0 +1,94 @@
+"""Шуз блекджека: несколько колод на чат, которые доигрываются раунд за раундом до отрезной карты.
+
+Карты лежат в array('B') кодами 0..51 (см. blackjack.CARD_LABELS), раздача — сдвиг позиции.
+Порядок карт целиком задаётся seed перемешивания, так что состояние шуза — три числа
+(колод, seed, позиция): они сохраняются в конце раунда в blackjack_shoes.json (пачкой,
+через BatchedJsonStore) и в журнале партии, а после перезапуска шуз собирается заново.
+"""
+import logging
+import random
+from array import array
+from typing import Dict, List, Optional
+
+from config import DATA_DIR, BLACKJACK_DECKS, BLACKJACK_PENETRATION
+from storage import BatchedJsonStore
+
+logger = logging.getLogger(__name__)
+
+DECK_SIZE = 52
+_ONE_DECK = array('B', range(DECK_SIZE))
+
+_store = BatchedJsonStore(DATA_DIR / "blackjack_shoes.json", dict)
+# chat_id -> шуз чата (живёт между раундами)
+_shoes: Dict[int, "Shoe"] = {}
+_random = random.SystemRandom()
+
+
+class Shoe:
+    """decks колод, перемешанных вместе; отрезная карта — после BLACKJACK_PENETRATION шуза"""
+
+    def __init__(self, decks: int = BLACKJACK_DECKS, seed: Optional[int] = None, position: int = 0,
+                 rng: Optional[random.Random] = None):
+        self.decks = decks
+        self.cut = int(DECK_SIZE * decks * BLACKJACK_PENETRATION)
+        # Откуда берутся seed новых перемешиваний (симуляции передают свой для повторяемости)
+        self._rng = rng or _random
+        self.shuffle(seed)
+        self.position = position
+
+    def shuffle(self, seed: Optional[int] = None) -> None:
+        self.seed = self._rng.getrandbits(64) if seed is None else seed
+        self.cards = _ONE_DECK * self.decks
+        random.Random(self.seed).shuffle(self.cards)
+        self.position = 0
+
+    def draw(self) -> int:
+        if self.position >= len(self.cards):
+            # Шуз кончился посреди раунда (мало колод, много игроков) — мешаем новый
+            logger.info("Blackjack shoe ran out mid-round, reshuffling")
+            self.shuffle()
+        card = self.cards[self.position]
+        self.position += 1
+        return card
+
+    def start_round(self) -> None:
+        """Перед раундом: если в прошлом вышла отрезная карта — перемешать шуз"""
+        if self.position >= self.cut:
+            self.shuffle()
+
+    def checkpoint(self) -> List[int]:
+        return [self.decks, self.seed, self.position]
+
+
+def _from_checkpoint(state) -> Optional[Shoe]:
+    try:
+        decks, seed, position = state
+    except (TypeError, ValueError):
+        return None
+    if decks != BLACKJACK_DECKS:
+        return None  # число колод поменяли в настройках — начинаем новый шуз
+    return Shoe(decks, seed, position)
+
+
+def shoe_for_round(chat_id: int) -> Shoe:
+    """Шуз чата для нового раунда; если отрезная карта вышла в прошлом раунде — перемешанный"""
+    shoe = _shoes.get(chat_id)
+    if shoe is None:
+        shoe = _from_checkpoint(_store.data.get(str(chat_id))) or Shoe()
+        _shoes[chat_id] = shoe
+    shoe.start_round()
+    return shoe
+
+
+def save(chat_id: int, shoe: Shoe) -> None:
+    """Запомнить состояние шуза после раунда (на диск уйдёт со следующим сбросом хранилищ)"""
+    _store.data[str(chat_id)] = shoe.checkpoint()
+    _store.mark_dirty()
+
+
+def restore(chat_id: int, state) -> None:
+    """Состояние шуза из журнала прерванной партии — оно новее сохранённого после раунда"""
+    shoe = _from_checkpoint(state)
+    if shoe is not None:
+        _shoes[chat_id] = shoe
+        save(chat_id, shoe)
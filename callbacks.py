@@ -0,0 +1,165 @@
+"""Мгновенный ответ на нажатия кнопок: подтверждение сразу, тяжёлая работа — в фоне."""
+import asyncio
+import functools
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Optional, Set
+from telegram import CallbackQuery, Update
+from telegram.ext import ContextTypes
+
+from metrics import handler_scope
+
+logger = logging.getLogger(__name__)
+
+# Что делать с повторным нажатием той же кнопки, пока предыдущее ещё обрабатывается
+DROP_REPEATS = "drop"          # отбросить (переключатели, присоединение к игре)
+SERIALIZE_REPEATS = "serial"   # обработать по очереди (каждое нажатие важно)
+
+# Сколько последних замеров хранить для перцентилей
+LATENCY_WINDOW = 512
+
+CallbackHandler = Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[None]]
+Precheck = Callable[[Update], Optional[str]]
+
+# id запросов, на которые уже ответили (пока идёт фоновая обработка)
+_answered: Set[str] = set()
+_running: Set[Hashable] = set()
+# Очереди SERIALIZE_REPEATS: ключ -> [блокировка, сколько нажатий её ждут или держат]
+_locks: Dict[Hashable, list] = {}
+
+
+class LatencyStats:
+    """Задержки одного обработчика: получение → ответ и получение → завершение (в секундах)"""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.dropped = 0
+        self.ack: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.done: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    @staticmethod
+    def _percentile(samples: Deque[float], q: float) -> float:
+        if not samples:
+            return 0.0
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "dropped": self.dropped,
+            "ack_p50": self._percentile(self.ack, 0.5),
+            "ack_p95": self._percentile(self.ack, 0.95),
+            "done_p50": self._percentile(self.done, 0.5),
+            "done_p95": self._percentile(self.done, 0.95),
+        }
+
+
+callback_stats: Dict[str, LatencyStats] = {}
+
+
+def _stats(name: str) -> LatencyStats:
+    stats = callback_stats.get(name)
+    if stats is None:
+        stats = callback_stats[name] = LatencyStats()
+    return stats
+
+
+async def mark_callback_received(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Самая ранняя группа: запоминаем время получения нажатия (контекст общий для всех групп)"""
+    context.callback_received_at = time.monotonic()
+
+
+def _received_at(context: ContextTypes.DEFAULT_TYPE) -> float:
+    return getattr(context, "callback_received_at", None) or time.monotonic()
+
+
+def _dedup_key(query: CallbackQuery) -> Hashable:
+    # Одно и то же действие — та же кнопка того же сообщения от того же пользователя
+    if query.message:
+        message_key = (query.message.chat.id, query.message.message_id)
+    else:
+        message_key = query.inline_message_id
+    return message_key, query.data, query.from_user.id
+
+
+async def answer_callback(query: CallbackQuery, text: Optional[str] = None, show_alert: bool = False) -> bool:
+    """Ответить на нажатие, если на него ещё не ответили. Возвращает True, если ответ отправлен"""
+    if query.id in _answered:
+        if text:
+            logger.debug("Callback %s already acknowledged, dropping answer %r", query.id, text)
+        return False
+    try:
+        await query.answer(text, show_alert=show_alert)
+        return True
+    except Exception as e:
+        logger.debug("Failed to answer callback %s: %s", query.id, e)
+        return False
+
+
+def instant_callback(precheck: Optional[Precheck] = None, *, ack_text: Optional[str] = None,
+                     repeats: str = DROP_REPEATS) -> Callable[[CallbackHandler], CallbackHandler]:
+    """Декоратор обработчика кнопки.
+
+    precheck — дешёвая проверка без сети (файлы — только из кэша); если вернула текст, он показывается
+    во всплывающем окне, и обработчик не запускается. Иначе на нажатие отвечаем сразу
+    (с ack_text, если задан), а сам обработчик выполняется фоновой задачей приложения.
+    """
+    def decorator(handler: CallbackHandler) -> CallbackHandler:
+        name = handler.__name__
+        # Метрики самого обработчика пишутся отдельно от быстрого ответа на нажатие
+        background_name = f"{name}:background"
+
+        @functools.wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            query = update.callback_query
+            if not query or not query.data:
+                return
+            received = _received_at(context)
+            stats = _stats(name)
+            stats.count += 1
+
+            alert = precheck(update) if precheck else None
+            if alert:
+                await answer_callback(query, alert, show_alert=True)
+                stats.ack.append(time.monotonic() - received)
+                return
+
+            key = _dedup_key(query)
+            if repeats == DROP_REPEATS and key in _running:
+                stats.dropped += 1
+                await answer_callback(query)
+                return
+
+            await answer_callback(query, ack_text)
+            stats.ack.append(time.monotonic() - received)
+            _answered.add(query.id)
+            _running.add(key)
+
+            async def run() -> None:
+                try:
+                    if repeats == SERIALIZE_REPEATS:
+                        entry = _locks.setdefault(key, [asyncio.Lock(), 0])
+                        entry[1] += 1
+                        try:
+                            async with entry[0]:
+                                with handler_scope(background_name, update):
+                                    await handler(update, context)
+                        finally:
+                            entry[1] -= 1
+                            if not entry[1]:
+                                _locks.pop(key, None)
+                    else:
+                        with handler_scope(background_name, update):
+                            await handler(update, context)
+                finally:
+                    _answered.discard(query.id)
+                    _running.discard(key)
+                    stats.done.append(time.monotonic() - received)
+
+            context.application.create_task(run(), update=update, name=f"callback:{name}")
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,76 @@
+"""Индекс участников чатов: кто из пользователей активен в каком чате."""
+import logging
+from typing import Dict, Optional, Set
+from telegram import Update
+from telegram.constants import ChatType
+from telegram.ext import ContextTypes
+
+from config import CHAT_MEMBERS_FILE
+from storage import BatchedJsonStore
+
+logger = logging.getLogger(__name__)
+
+# На диске: {"chat_id": [user_id, ...]}, в памяти — множества для O(1) проверки
+_store = BatchedJsonStore(CHAT_MEMBERS_FILE, dict)
+_members: Dict[int, Set[int]] = {}
+# Версия _store, по которой построены множества (None — ещё не строили)
+_indexed_version: Optional[int] = None
+
+
+def _ensure_loaded() -> None:
+    global _indexed_version
+    if _indexed_version == _store.version:
+        return
+    data = _store.data
+    _indexed_version = _store.version
+    # Заново — и после того, как flush() подтянул участников, записанных другими шардами
+    _members.clear()
+    for chat_id_str, user_ids in data.items():
+        _members[int(chat_id_str)] = set(user_ids)
+
+
+def record_chat_member(chat_id: int, user_id: int) -> None:
+    """Отметить пользователя как участника чата"""
+    _ensure_loaded()
+    members = _members.setdefault(chat_id, set())
+    if user_id in members:
+        return
+    members.add(user_id)
+    _store.data.setdefault(str(chat_id), []).append(user_id)
+    _store.mark_dirty()
+
+
+def forget_chat_member(chat_id: int, user_id: int) -> None:
+    """Убрать пользователя из участников чата (вышел или был удалён)"""
+    _ensure_loaded()
+    members = _members.get(chat_id)
+    if not members or user_id not in members:
+        return
+    members.discard(user_id)
+    _store.data[str(chat_id)] = list(members)
+    _store.mark_dirty()
+
+
+def get_chat_members(chat_id: int) -> Set[int]:
+    """Известные участники чата"""
+    _ensure_loaded()
+    return _members.get(chat_id, set())
+
+
+async def track_chat_activity(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Пополняет индекс из всех входящих обновлений групп"""
+    chat = update.effective_chat
+    if not chat or chat.type not in (ChatType.GROUP, ChatType.SUPERGROUP):
+        return
+
+    user = update.effective_user
+    if user and not user.is_bot:
+        record_chat_member(chat.id, user.id)
+
+    message = update.message
+    if message:
+        for member in message.new_chat_members or ():
+            if not member.is_bot:
+                record_chat_member(chat.id, member.id)
+        if message.left_chat_member:
+            forget_chat_member(chat.id, message.left_chat_member.id)
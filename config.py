@@ -4,13 +4,60 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-# Пути к файлам данных
-DATA_DIR = Path(__file__).resolve().parent / "data"
+# Пути к файлам данных (BOT_DATA_DIR — другая папка, например временная для бенчмарков)
+DATA_DIR = Path(os.environ.get("BOT_DATA_DIR") or Path(__file__).resolve().parent / "data")
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 STORE_FILE = DATA_DIR / "subscribers.json"       
 MARRIAGE_FILE = DATA_DIR / "marriages.json"       
 ADMINS_FILE = DATA_DIR / "admins.json"
 COOLDOWNS_FILE = DATA_DIR / "cooldowns.json"
+CHAT_MEMBERS_FILE = DATA_DIR / "chat_members.json"
+USERS_FILE = DATA_DIR / "users.json"
+DRINKING_FILE = DATA_DIR / "drinking.json"
+
+# Как часто отложенные изменения сбрасываются на диск (в секундах)
+STORE_FLUSH_INTERVAL = 30
+
+# Множитель пауз в анимациях (0 — без пауз, для бенчмарков)
+ANIMATION_DELAY_SCALE = float(os.environ.get("ANIMATION_DELAY_SCALE", "1"))
+
+# Запись входящих обновлений для бенчмарков (пусто — выключена) и соль для обезличивания id
+RECORD_UPDATES_DIR = os.environ.get("RECORD_UPDATES_DIR", "")
+RECORD_SALT = os.environ.get("RECORD_SALT", "")
+
+# Уровень и формат логов: json (по строке JSON на запись) или text
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+
+# Шардирование по чатам (см. sharding.py): SHARD_COUNT > 1 — этот процесс диспетчер и запускает
+# столько воркеров; воркер получает свой SHARD_INDEX (-1 — не воркер) через окружение
+SHARD_COUNT = max(1, int(os.environ.get("SHARD_COUNT", "1")))
+SHARD_INDEX = int(os.environ.get("SHARD_INDEX", "-1"))
+# Папка с unix-сокетами воркеров (пусто — временная, создаёт диспетчер)
+SHARD_SOCKET_DIR = os.environ.get("SHARD_SOCKET_DIR", "")
+
+# Порт эндпоинта метрик на 127.0.0.1 (0 — выключен); у воркера шарда i — порт + 1 + i
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9108"))
+if METRICS_PORT and SHARD_INDEX >= 0:
+    METRICS_PORT += 1 + SHARD_INDEX
+
+# Получение обновлений: polling или webhook (встроенный HTTP-сервер, см. webhook.py)
+UPDATE_MODE = os.environ.get("UPDATE_MODE", "polling")
+# Публичный адрес вебхука для setWebhook (пусто — вебхук уже настроен снаружи, сервер просто слушает)
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+# Сверяется с заголовком X-Telegram-Bot-Api-Secret-Token; пусто — генерируется при запуске
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+# Сколько соединений Telegram держит к вебхуку одновременно
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Типы обновлений через запятую; пусто — выводятся из зарегистрированных обработчиков
+ALLOWED_UPDATES = [kind.strip() for kind in os.environ.get("ALLOWED_UPDATES", "").split(",") if kind.strip()]
+
+# Блекджек: сколько колод в шузе чата и какая его доля сдаётся до перемешивания (отрезная карта)
+BLACKJACK_DECKS = max(1, int(os.environ.get("BLACKJACK_DECKS", "1")))
+BLACKJACK_PENETRATION = min(1.0, max(0.1, float(os.environ.get("BLACKJACK_PENETRATION", "0.75"))))
 
 # Настройки по умолчанию
 DEFAULT_TZ = "Europe/Moscow"
@@ -26,7 +73,8 @@ RESERVED_COMMANDS = {
     "брак", "браки", "развод", "расширить", "закрыть_брак", "трахнуть", "выпить", "самоотсос",
     "admin_claim", "admins", "admin_add", "admin_remove",
     "cc_set", "cc_set_photo", "cc_remove", "cc_list",
-    "баланс", "balance", "give_coins", "take_coins", "set_balance", "work"
+    "баланс", "balance", "give_coins", "take_coins", "set_balance", "work",
+    "stats"
 }
 
 # Константы для системы браков
@@ -34,6 +82,13 @@ MARRY_DEEPLINK_PREFIX = "marry_"
 
 # Токен бота
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN")
+# Свой сервер Bot API, например "http://127.0.0.1:8081/bot" (пусто — api.telegram.org)
+BOT_API_BASE_URL = os.environ.get("BOT_API_BASE_URL", "")
+
+# Чаты, в которых бот молчит. Можно дополнить через BLOCKED_CHAT_IDS="-100...,-100..."
+BLOCKED_CHAT_IDS = {-1002403119663} | {
+    int(chat_id) for chat_id in os.environ.get("BLOCKED_CHAT_IDS", "").split(",") if chat_id.strip()
+}
 
 # Текст помощи
 HELP_TEXT = """
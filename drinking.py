@@ -1,15 +1,20 @@
-import random
 import time
 import re
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
-from storage import load_cooldowns, save_cooldowns
+from config import DRINKING_FILE
+from storage import load_cooldowns, save_cooldowns, BatchedJsonStore
+import drunk_text
+from reaper import schedule_delete
 
-# Максимальное количество выпитого
+# Максимальное количество выпитого за одну попойку
 MAX_DRINKS = 5
 
+# Сколько «единиц» алкоголя организм выводит за час
+ALCOHOL_ELIMINATION_PER_HOUR = 1.0
+
 # Кулдаун между использованиями команды (в секундах)
 DRINKING_COOLDOWN = 3600  # 60 минут
 
@@ -49,6 +54,59 @@ DRUNK_MESSAGES = {
     }
 }
 
+# Шаблоны разбираются (и проверяются) один раз при импорте
+COMPILED_DRUNK_MESSAGES = {
+    level: drunk_text.compile_template(message["text"]) for level, message in DRUNK_MESSAGES.items()
+}
+
+
+# Состояние пользователей: {"user_id": {"alcohol": float, "at": ts, "drinks": int}}
+# alcohol — содержание алкоголя на момент at; текущее значение считается при чтении
+_drinking_store = BatchedJsonStore(DRINKING_FILE, dict)
+
+
+def get_alcohol_level(user_id: int, now: Optional[float] = None) -> float:
+    """Текущее содержание алкоголя с учётом выведенного с момента последнего напитка"""
+    state = _drinking_store.data.get(str(user_id))
+    if not state:
+        return 0.0
+    elapsed = (now or time.time()) - state["at"]
+    return max(0.0, state["alcohol"] - ALCOHOL_ELIMINATION_PER_HOUR * elapsed / 3600)
+
+
+def get_session_drinks(user_id: int) -> int:
+    state = _drinking_store.data.get(str(user_id))
+    return state["drinks"] if state else 0
+
+
+def get_drunk_level(user_id: int, now: Optional[float] = None) -> int:
+    """Уровень опьянения 0..MAX_DRINKS по текущему содержанию алкоголя"""
+    level = min(MAX_DRINKS, int(get_alcohol_level(user_id, now) + 0.5))
+    # Кто пьёт прямо сейчас, тот хотя бы слегка пьян
+    if get_session_drinks(user_id):
+        level = max(level, 1)
+    return level
+
+
+def start_drinking_session(user_id: int) -> None:
+    """Новая попойка: счётчик напитков обнуляется, выпитое ранее продолжает выводиться"""
+    now = time.time()
+    _drinking_store.data[str(user_id)] = {"alcohol": get_alcohol_level(user_id, now), "at": now, "drinks": 0}
+    _drinking_store.mark_dirty()
+
+
+def record_drink(user_id: int, drink_type: str) -> int:
+    """Учесть выпитый напиток. Возвращает новый уровень опьянения"""
+    now = time.time()
+    strength = DRINKS.get(drink_type, DRINKS["cognac"])["strength"]
+    _drinking_store.data[str(user_id)] = {
+        "alcohol": get_alcohol_level(user_id, now) + strength,
+        "at": now,
+        "drinks": get_session_drinks(user_id) + 1,
+    }
+    _drinking_store.mark_dirty()
+    return get_drunk_level(user_id, now)
+
 
 def get_drinking_cooldown_key(user_id: int, chat_id: int) -> str:
     return f"drink_{user_id}_{chat_id}"
@@ -98,7 +156,7 @@ def create_drink_keyboard(user_id: int) -> InlineKeyboardMarkup:
     for drink_id, drink_info in DRINKS.items():
         button = InlineKeyboardButton(
             f"{drink_info['emoji']} {drink_info['name']}", 
-            callback_data=f"drink:{user_id}:{drink_id}:1"
+            callback_data=f"drink:{user_id}:{drink_id}"
         )
         row.append(button)
         
@@ -112,192 +170,28 @@ def create_drink_keyboard(user_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(buttons)
 
 
-def create_continue_keyboard(user_id: int, drink_type: str, level: int) -> InlineKeyboardMarkup:
+def create_continue_keyboard(user_id: int, drink_type: str, drinks: int) -> InlineKeyboardMarkup:
     """Создать клавиатуру для продолжения питья"""
-    if level >= MAX_DRINKS:
+    if drinks >= MAX_DRINKS:
         return InlineKeyboardMarkup([])
     
     drink_info = DRINKS.get(drink_type, DRINKS["cognac"])
     button = InlineKeyboardButton(
         f"🍻 Выпить еще {drink_info['name']}?", 
-        callback_data=f"drink:{user_id}:{drink_type}:{level + 1}"
+        callback_data=f"drink:{user_id}:{drink_type}"
     )
     
     return InlineKeyboardMarkup([[button]])
 
 
-def parse_html_segments(text: str) -> List[Dict[str, Any]]:
-    """Разбить текст на сегменты с информацией о форматировании"""
-    segments = []
-    current_pos = 0
-    
-    # Находим все HTML теги
-    tag_pattern = r'<(/?)([bi])>'
-    matches = list(re.finditer(tag_pattern, text))
-    
-    for match in matches:
-        # Добавляем текст до тега
-        if match.start() > current_pos:
-            plain_text = text[current_pos:match.start()]
-            if plain_text:
-                segments.append({
-                    'type': 'text',
-                    'content': plain_text,
-                    'formatting': []
-                })
-        
-        # Добавляем тег
-        is_closing = match.group(1) == '/'
-        tag_type = match.group(2)
-        segments.append({
-            'type': 'tag',
-            'tag_type': tag_type,
-            'is_closing': is_closing,
-            'content': match.group(0)
-        })
-        
-        current_pos = match.end()
-    
-    # Добавляем оставшийся текст
-    if current_pos < len(text):
-        remaining_text = text[current_pos:]
-        if remaining_text:
-            segments.append({
-                'type': 'text',
-                'content': remaining_text,
-                'formatting': []
-            })
-    
-    return segments
-
-
-def apply_drunk_effect_to_text(text: str, level: int) -> str:
-    """Применить эффекты опьянения только к тексту (без HTML)"""
-    if level < 3:
-        return text
-    
-    drunk_text = text
-    
-    if level >= 3:
-        # Замена некоторых букв
-        replacements = {
-            'с': 'ш', 'з': 'ж', 'т': 'ц', 'п': 'б'
-        }
-        for old, new in replacements.items():
-            if random.random() < 0.3:  # 30% шанс замены
-                drunk_text = drunk_text.replace(old, new)
-    
-    if level >= 4:
-        # Добавление лишних букв
-        words = drunk_text.split()
-        for i, word in enumerate(words):
-            if random.random() < 0.4 and len(word) > 3:
-                # Удваиваем случайную букву
-                pos = random.randint(1, len(word) - 1)
-                words[i] = word[:pos] + word[pos] + word[pos:]
-        drunk_text = ' '.join(words)
-    
-    if level >= 4:
-        # Добавление междометий между словами (реже и в курсиве)
-        interjections = ['хик', 'ууух', 'блин', 'ой', 'эээ']
-        if random.random() < 0.25:  # Только 25% шанс добавления междометия
-            # Находим все пробелы в тексте
-            words = drunk_text.split(' ')
-            if len(words) > 1:  # Есть хотя бы два слова
-                # Выбираем случайную позицию между словами
-                insert_pos = random.randint(1, len(words) - 1)
-                # Вставляем междометие с пробелами
-                interjection = f"<i>{random.choice(interjections)}</i>"
-                words.insert(insert_pos, interjection)
-                drunk_text = ' '.join(words)
-    
-    if level >= 5:
-        # Максимальное опьянение - много ошибок
-        drunk_text = drunk_text.replace('о', 'а').replace('е', 'и')
-        if random.random() < 0.3:  # Уменьшили шанс с 50% до 30%
-            drunk_text += " <i>икает</i>"
-    
-    return drunk_text
-
-
-def reconstruct_html_text(segments: List[Dict[str, Any]], level: int) -> str:
-    """Восстановить HTML текст с примененными эффектами опьянения"""
-    result = ""
-    
-    for segment in segments:
-        if segment['type'] == 'text':
-            # Применяем эффекты опьянения только к текстовым сегментам
-            processed_text = apply_drunk_effect_to_text(segment['content'], level)
-            result += processed_text
-        elif segment['type'] == 'tag':
-            # HTML теги добавляем как есть
-            result += segment['content']
-    
-    return result
-
-
-def validate_html_tags(text: str) -> str:
-    """Проверить и исправить HTML теги"""
-    # Стек для отслеживания открытых тегов
-    tag_stack = []
-    result = ""
-    
-    # Находим все теги
-    tag_pattern = r'<(/?)([bi])>'
-    last_pos = 0
-    
-    for match in re.finditer(tag_pattern, text):
-        # Добавляем текст до тега
-        result += text[last_pos:match.start()]
-        
-        is_closing = match.group(1) == '/'
-        tag_type = match.group(2)
-        
-        if is_closing:
-            # Закрывающий тег
-            if tag_stack and tag_stack[-1] == tag_type:
-                tag_stack.pop()
-                result += match.group(0)
-            # Если тег не соответствует последнему открытому, игнорируем его
-        else:
-            # Открывающий тег
-            tag_stack.append(tag_type)
-            result += match.group(0)
-        
-        last_pos = match.end()
-    
-    # Добавляем оставшийся текст
-    result += text[last_pos:]
-    
-    # Закрываем все незакрытые теги
-    while tag_stack:
-        tag = tag_stack.pop()
-        result += f"</{tag}>"
-    
-    return result
-
-
-def apply_drunk_effect(text: str, level: int, drink_type: str) -> str:
+def apply_drunk_effect(text: str, level: int, drink_type: str, seed: Optional[object] = None) -> str:
     """Применить эффекты опьянения к тексту с сохранением HTML"""
     if level < 3:
         return text
-    
-    try:
-        # Разбираем текст на сегменты
-        segments = parse_html_segments(text)
-        
-        # Восстанавливаем текст с примененными эффектами
-        result = reconstruct_html_text(segments, level)
-        
-        # Проверяем и исправляем HTML теги
-        result = validate_html_tags(result)
-        
-        return result
-    
-    except Exception as e:
-        # В случае ошибки возвращаем оригинальный текст
-        print(f"Error in apply_drunk_effect: {e}")
-        return text
+    template = COMPILED_DRUNK_MESSAGES.get(level)
+    if template is None or DRUNK_MESSAGES[level]["text"] != text:
+        template = drunk_text.compile_template(text)
+    return drunk_text.render(template, level, seed)
 
 
 async def cmd_drink(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -312,12 +206,6 @@ async def cmd_drink(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Проверяем кулдаун
     remaining_time = check_drinking_cooldown(user.id, chat_id)
     if remaining_time is not None:
-        # Удаляем сообщение пользователя
-        try:
-            await message.delete()
-        except Exception as e:
-            print(f"Failed to delete user message: {e}")
-        
         # Отправляем предупреждение
         warning_msg = await context.bot.send_message(
             chat_id,
@@ -327,17 +215,12 @@ async def cmd_drink(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             parse_mode=ParseMode.HTML
         )
         
-        # Удаляем предупреждение через 3 секунды
-        async def delete_warning(context):
-            try:
-                await context.bot.delete_message(chat_id, warning_msg.message_id)
-            except Exception as e:
-                print(f"Failed to delete warning message: {e}")
-        
-        context.job_queue.run_once(delete_warning, 3)
+        # Команду и предупреждение удаляем вместе через 3 секунды
+        schedule_delete(chat_id, message.message_id, warning_msg.message_id)
         return
     
     set_drinking_cooldown(user.id, chat_id)
+    start_drinking_session(user.id)
     
     # Создаем сообщение с выбором напитков
     keyboard = create_drink_keyboard(user.id)
@@ -355,14 +238,15 @@ async def cb_drink(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not query or not query.data:
         return
     
-    await query.answer()
-    
-    # Парсим данные callback
+    # Парсим данные callback: drink:{user}:{type} (старые кнопки — с уровнем в конце, он игнорируется)
+    parts = query.data.split(":")
     try:
-        _, user_id_str, drink_type, level_str = query.data.split(":")
-        user_id = int(user_id_str)
-        level = int(level_str)
-    except (ValueError, IndexError):
+        if len(parts) not in (3, 4):
+            raise ValueError(query.data)
+        user_id = int(parts[1])
+        drink_type = parts[2]
+    except ValueError:
+        await query.answer()
         await query.edit_message_text("❌ Ошибка обработки команды.")
         return
     
@@ -371,26 +255,30 @@ async def cb_drink(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await query.answer("🚫 Это не ваш напиток!", show_alert=True)
         return
     
-    # Проверяем лимит
-    if level > MAX_DRINKS:
+    # Проверяем лимит: сколько выпито, знает сервер, а не кнопка
+    if get_session_drinks(user_id) >= MAX_DRINKS:
         await query.answer("🤢 Хватит! Вы уже выпили слишком много!", show_alert=True)
         return
     
-    # Получаем информацию о напитке
-    drink_info = DRINKS.get(drink_type, DRINKS["cognac"])
+    await query.answer()
+    
+    level = record_drink(user_id, drink_type)
+    drinks = get_session_drinks(user_id)
     
     # Создаем сообщение об опьянении
     base_message = DRUNK_MESSAGES[level]["text"]
     
     # Применяем эффекты опьянения к тексту (начиная с 3-го уровня)
-    drunk_message = apply_drunk_effect(base_message, level, drink_type)
+    # Сид от сообщения и номера напитка: повторная отрисовка даёт тот же текст
+    seed = f"{query.message.chat.id}:{query.message.message_id}:{drinks}" if query.message else None
+    drunk_message = apply_drunk_effect(base_message, level, drink_type, seed)
     
     full_message = drunk_message 
     
     # Создаем клавиатуру для продолжения (если не достигнут лимит)
-    keyboard = create_continue_keyboard(user_id, drink_type, level)
+    keyboard = create_continue_keyboard(user_id, drink_type, drinks)
     
-    if level >= MAX_DRINKS:
+    if drinks >= MAX_DRINKS:
         full_message += f"\n\n🚫 <b>Всё, хватит на сегодня!</b>\n⏰ <i>Следующая попойка через {DRINKING_COOLDOWN // 60} минут</i>"
     
     try:
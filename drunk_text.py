@@ -0,0 +1,133 @@
+"""Движок «пьяного» текста: шаблоны разбираются один раз, эффекты применяются за один проход."""
+import random
+import re
+from typing import NamedTuple, Optional, Tuple, Union
+
+# Тип токена внутри текстового блока
+GAP, SHORT_WORD, LONG_WORD = 0, 1, 2
+
+_TAG_RE = re.compile(r"<(/?)([bi])>")
+_GAP_RE = re.compile(r"(\s+)")
+
+# Замены букв с 3-го уровня (каждая срабатывает с шансом 30% на блок текста)
+LETTER_SWAPS = (("с", "ш"), ("з", "ж"), ("т", "ц"), ("п", "б"))
+# С 5-го уровня эти замены применяются всегда
+HEAVY_SWAPS = (("о", "а"), ("е", "и"))
+
+INTERJECTIONS = ("хик", "ууух", "блин", "ой", "эээ")
+HICCUP = "икает"  # дописывается в конец сообщения на 5-м уровне
+
+SWAP_CHANCE = 0.3
+DOUBLE_LETTER_CHANCE = 0.4
+INTERJECTION_CHANCE = 0.25
+HICCUP_CHANCE = 0.3
+
+
+class TextRun(NamedTuple):
+    """Текст между тегами: слова и промежутки вперемешку"""
+    tokens: Tuple[str, ...]
+    kinds: bytes              # GAP / SHORT_WORD / LONG_WORD для каждого токена
+    gaps: Tuple[int, ...]     # индексы промежутков между двумя словами
+    italic: bool              # блок внутри <i>
+
+
+# Скомпилированный шаблон: теги (str) и текстовые блоки (TextRun) по порядку
+Template = Tuple[Union[str, TextRun], ...]
+
+
+def _build_tables():
+    """Таблицы str.translate для всех комбинаций замен: [тяжёлый уровень][маска замен]"""
+    tables = ([], [])
+    for heavy in (0, 1):
+        for mask in range(1 << len(LETTER_SWAPS)):
+            mapping = {old: new for bit, (old, new) in enumerate(LETTER_SWAPS) if mask & (1 << bit)}
+            if heavy:
+                mapping.update(HEAVY_SWAPS)
+            tables[heavy].append(str.maketrans(mapping))
+    return tuple(tables[0]), tuple(tables[1])
+
+
+_TABLES = _build_tables()
+
+
+def _compile_run(text: str, italic: bool) -> TextRun:
+    tokens = tuple(token for token in _GAP_RE.split(text) if token)
+    kinds = bytes(
+        GAP if token.isspace() else (LONG_WORD if len(token) > 3 else SHORT_WORD)
+        for token in tokens
+    )
+    gaps = tuple(
+        index for index in range(1, len(tokens) - 1)
+        if kinds[index] == GAP and kinds[index - 1] != GAP and kinds[index + 1] != GAP
+    )
+    return TextRun(tokens, kinds, gaps, italic)
+
+
+def compile_template(text: str) -> Template:
+    """Разобрать шаблон на теги и текстовые блоки. Бросает ValueError при неверной разметке"""
+    items = []
+    stack = []
+    pos = 0
+    for match in _TAG_RE.finditer(text):
+        if match.start() > pos:
+            items.append(_compile_run(text[pos:match.start()], "i" in stack))
+        closing, tag = match.group(1) == "/", match.group(2)
+        if closing:
+            if not stack or stack[-1] != tag:
+                raise ValueError(f"Unbalanced </{tag}> at {match.start()} in {text!r}")
+            stack.pop()
+        else:
+            stack.append(tag)
+        items.append(match.group(0))
+        pos = match.end()
+    if pos < len(text):
+        items.append(_compile_run(text[pos:], "i" in stack))
+    if stack:
+        raise ValueError(f"Unclosed <{stack[-1]}> in {text!r}")
+    for item in items:
+        if isinstance(item, TextRun) and any("<" in token or ">" in token for token in item.tokens):
+            raise ValueError(f"Unsupported markup in {text!r}")
+    return tuple(items)
+
+
+def _render_run(run: TextRun, level: int, rng: random.Random) -> str:
+    if level < 3:
+        return "".join(run.tokens)
+
+    mask = 0
+    for bit in range(len(LETTER_SWAPS)):
+        if rng.random() < SWAP_CHANCE:
+            mask |= 1 << bit
+    table = _TABLES[level >= 5][mask]
+
+    if level < 4:
+        return "".join(run.tokens).translate(table)
+
+    interject_at = -1
+    if run.gaps and rng.random() < INTERJECTION_CHANCE:
+        interject_at = rng.choice(run.gaps)
+
+    pieces = []
+    append = pieces.append
+    for index, token in enumerate(run.tokens):
+        if run.kinds[index] == LONG_WORD and rng.random() < DOUBLE_LETTER_CHANCE:
+            # Удваиваем случайную букву
+            pos = rng.randint(1, len(token) - 1)
+            token = token[:pos] + token[pos] + token[pos:]
+        append(token)
+        if index == interject_at:
+            word = rng.choice(INTERJECTIONS)
+            append(f"{word} " if run.italic else f"<i>{word}</i> ")
+    return "".join(pieces).translate(table)
+
+
+def render(template: Template, level: int, seed: Optional[object] = None) -> str:
+    """Текст шаблона с эффектами опьянения уровня level. Одинаковый seed — одинаковый результат"""
+    rng = random.Random(seed)
+    result = "".join(
+        item if isinstance(item, str) else _render_run(item, level, rng)
+        for item in template
+    )
+    if level >= 5 and rng.random() < HICCUP_CHANCE:
+        result += f" <i>{HICCUP}</i>"
+    return result
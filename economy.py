@@ -1,13 +1,16 @@
 """Система экономики бота."""
-import json
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterable, Optional, Tuple
 from telegram import Update
 from telegram.ext import ContextTypes
 from pathlib import Path
 from config import DATA_DIR
+from storage import SharedJsonFile
 from admin import ensure_admin, extract_target_user_id_from_message
 from utils import safe_html, profile_link_html
+import leaderboards
+import user_directory
+from username_resolver import resolve_message_target
 
 logger = logging.getLogger(__name__)
 
@@ -20,52 +23,94 @@ CURRENCY_NAME = "монет"
 CURRENCY_SYMBOL = "🪙"
 
 
+def _normalize_economy(data: Dict[str, Any]) -> Dict[str, Any]:
+    data.setdefault("balances", {})
+    data.setdefault("slaves", {})
+    data.setdefault("usernames", {})
+    return data
+
+
+# Общий для всех шардов файл: чтения из кэша, изменения — транзакциями под блокировкой файла
+_economy_file = SharedJsonFile(ECONOMY_FILE, dict, normalize=_normalize_economy)
+
+
 def load_economy() -> Dict[str, Any]:
     """Загружает данные экономики."""
-    if not ECONOMY_FILE.exists():
-        return {"balances": {}, "slaves": {}, "usernames": {}}
-    try:
-        with open(ECONOMY_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f) or {}
-            data.setdefault("balances", {})
-            data.setdefault("slaves", {})
-            data.setdefault("usernames", {})
-            return data
-    except Exception as e:
-        logger.error("Failed to read economy data: %s", e)
-        return {"balances": {}, "slaves": {}, "usernames": {}}
+    return _economy_file.load()
 
 
 def save_economy(data: Dict[str, Any]) -> None:
     """Сохраняет данные экономики."""
-    try:
-        with open(ECONOMY_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error("Failed to write economy data: %s", e)
+    _economy_file.save(data)
+
+
+def economy_version() -> int:
+    """Растёт, когда economy.json перечитан с диска (например, после записи другим шардом)"""
+    _economy_file.read()
+    return _economy_file.version
 
 
 def get_user_balance(user_id: int) -> int:
     """Получает баланс пользователя."""
-    data = load_economy()
-    return data["balances"].get(str(user_id), DEFAULT_BALANCE)
+    return _economy_file.read()["balances"].get(str(user_id), DEFAULT_BALANCE)
+
+
+def get_balances(user_ids: Iterable[int]) -> Dict[int, int]:
+    """Балансы нескольких пользователей за одно чтение."""
+    balances = _economy_file.read()["balances"]
+    return {user_id: balances.get(str(user_id), DEFAULT_BALANCE) for user_id in user_ids}
 
 
 def set_user_balance(user_id: int, amount: int) -> None:
     """Устанавливает баланс пользователя."""
-    data = load_economy()
-    data["balances"][str(user_id)] = amount
-    save_economy(data)
+    with _economy_file.transaction() as data:
+        data["balances"][str(user_id)] = amount
+    leaderboards.on_balance_changed(user_id, amount)
 
 
 def add_user_balance(user_id: int, amount: int) -> int:
     """Добавляет к балансу пользователя. Возвращает новый баланс."""
-    current_balance = get_user_balance(user_id)
-    new_balance = current_balance + amount
-    set_user_balance(user_id, new_balance)
+    # Чтение и запись под одной блокировкой: параллельное списание из другого шарда не потеряется
+    with _economy_file.transaction() as data:
+        new_balance = data["balances"].get(str(user_id), DEFAULT_BALANCE) + amount
+        data["balances"][str(user_id)] = new_balance
+    leaderboards.on_balance_changed(user_id, new_balance)
     return new_balance
 
 
+class _NotEnoughCoins(Exception):
+    """Отмена транзакции списания: файл не переписывается"""
+
+
+def try_debit(user_id: int, amount: int) -> Tuple[bool, int]:
+    """Списывает amount, только если на балансе хватает монет. Возвращает (списано ли, баланс)."""
+    # Проверка и списание под одной блокировкой: баланс мог потратиться в другом чате или шарде
+    try:
+        with _economy_file.transaction() as data:
+            balance = data["balances"].get(str(user_id), DEFAULT_BALANCE)
+            if balance < amount:
+                raise _NotEnoughCoins
+            balance -= amount
+            data["balances"][str(user_id)] = balance
+    except _NotEnoughCoins:
+        return False, balance
+    leaderboards.on_balance_changed(user_id, balance)
+    return True, balance
+
+
+def return_stakes(coins: Dict[int, int], slaves: Dict[int, Dict[str, Any]]) -> None:
+    """Вернуть ставки одной транзакцией: монеты и рабов хозяевам (если у хозяина не появился другой)"""
+    balances = {}
+    with _economy_file.transaction() as data:
+        for user_id, amount in coins.items():
+            balances[user_id] = data["balances"].get(str(user_id), DEFAULT_BALANCE) + amount
+            data["balances"][str(user_id)] = balances[user_id]
+        for owner_id, slave_info in slaves.items():
+            data["slaves"].setdefault(str(owner_id), slave_info)
+    for user_id, balance in balances.items():
+        leaderboards.on_balance_changed(user_id, balance)
+
+
 def format_balance(amount: int) -> str:
     """Форматирует сумму для отображения."""
     return f"{amount} {CURRENCY_SYMBOL}"
@@ -83,46 +128,41 @@ def save_user_username(user_id: int, username: str) -> None:
     """Сохраняет соответствие username -> user_id для будущих поисков."""
     if not username:
         return
-    
-    data = load_economy()
-    if "usernames" not in data:
-        data["usernames"] = {}
-    
-    # Убираем @ если есть
-    clean_username = username.lstrip('@').lower()
-    data["usernames"][clean_username] = user_id
-    save_economy(data)
+    user_directory.remember_user(user_id, username=username)
 
 
 def get_user_slave(user_id: int) -> Optional[Dict[str, Any]]:
     """Получает информацию о рабе пользователя."""
-    data = load_economy()
-    return data["slaves"].get(str(user_id))
+    return _economy_file.read()["slaves"].get(str(user_id))
+
+
+def get_slaves(user_ids: Iterable[int]) -> Dict[int, Optional[Dict[str, Any]]]:
+    """Рабы нескольких пользователей за одно чтение (None — раба нет)."""
+    slaves = _economy_file.read()["slaves"]
+    return {user_id: slaves.get(str(user_id)) for user_id in user_ids}
 
 
 def set_user_slave(owner_id: int, slave_id: int, purchase_price: int, slave_name: str) -> None:
     """Устанавливает раба для пользователя."""
-    data = load_economy()
-    data["slaves"][str(owner_id)] = {
-        "slave_id": slave_id,
-        "purchase_price": purchase_price,
-        "slave_name": slave_name
-    }
-    save_economy(data)
+    with _economy_file.transaction() as data:
+        data["slaves"][str(owner_id)] = {
+            "slave_id": slave_id,
+            "purchase_price": purchase_price,
+            "slave_name": slave_name
+        }
 
 
 def remove_user_slave(owner_id: int) -> None:
     """Удаляет раба у пользователя."""
-    data = load_economy()
-    if str(owner_id) in data["slaves"]:
-        del data["slaves"][str(owner_id)]
-        save_economy(data)
+    if str(owner_id) not in _economy_file.read()["slaves"]:
+        return
+    with _economy_file.transaction() as data:
+        data["slaves"].pop(str(owner_id), None)
 
 
 def get_slave_owner(slave_id: int) -> Optional[int]:
     """Находит владельца раба."""
-    data = load_economy()
-    for owner_id, slave_info in data["slaves"].items():
+    for owner_id, slave_info in _economy_file.read()["slaves"].items():
         if slave_info["slave_id"] == slave_id:
             return int(owner_id)
     return None
@@ -157,92 +197,19 @@ async def cmd_balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     if not update.effective_user or not update.message:
         return
     
-    if update.effective_user.username:
-        save_user_username(update.effective_user.id, update.effective_user.username)
-    
-    target_id = None
-    user_name = None
-    
-    # Сначала проверяем ответ на сообщение
-    if update.message.reply_to_message and update.message.reply_to_message.from_user:
-        target_id = update.message.reply_to_message.from_user.id
-        target_user = update.message.reply_to_message.from_user
-        user_name = target_user.first_name or target_user.username or f"Пользователь {target_id}"
-        
-        # Сохраняем username если есть
-        if target_user.username:
-            save_user_username(target_id, target_user.username)
-    
-    # Затем проверяем упоминания в тексте
-    elif update.message.entities:
-        for entity in update.message.entities:
-            if entity.type == "text_mention" and entity.user:
-                target_id = entity.user.id
-                user_name = entity.user.first_name or entity.user.username or f"Пользователь {target_id}"
-                
-                # Сохраняем username если есть
-                if entity.user.username:
-                    save_user_username(target_id, entity.user.username)
-                break
-            elif entity.type == "mention":
-                start = entity.offset
-                length = entity.length
-                username = update.message.text[start+1:start + length]  # +1 чтобы убрать @
-                user_name = f"@{username}"
-                
-                # Пытаемся найти пользователя разными способами
-                user_found = False
-                
-                # Способ 1: Через get_chat (работает если пользователь взаимодействовал с ботом)
-                try:
-                    chat = await context.bot.get_chat(f"@{username}")
-                    if chat and chat.id:
-                        target_id = chat.id
-                        user_name = chat.first_name or f"@{username}"
-                        user_found = True
-                        
-                        # Сохраняем username
-                        save_user_username(target_id, username)
-                except Exception:
-                    pass
-                
-                # Способ 2: Если это групповой чат, пытаемся через get_chat_member
-                if not user_found and update.effective_chat and update.effective_chat.type in ['group', 'supergroup']:
-                    try:
-                        chat_member = await context.bot.get_chat_member(update.effective_chat.id, f"@{username}")
-                        if chat_member and chat_member.user:
-                            target_id = chat_member.user.id
-                            user_name = chat_member.user.first_name or f"@{username}"
-                            user_found = True
-                            
-                            # Сохраняем username
-                            if chat_member.user.username:
-                                save_user_username(target_id, chat_member.user.username)
-                    except Exception:
-                        pass
-                
-                # Способ 3: Поиск в сохраненных данных экономики по username
-                if not user_found:
-                    data = load_economy()
-                    usernames = data.get("usernames", {})
-                    if username in usernames:
-                        target_id = usernames[username]
-                        user_name = f"@{username}"
-                        user_found = True
-                
-                # Если пользователь не найден
-                if not user_found:
-                    await update.message.reply_text(
-                        f"❌ Не удалось найти пользователя @{username}.\n"
-                        "Причина:\n"
-                        "• Пользователь не взаимодействовал с ботом в личные сообщения\n"
-                        "Используйте команду в ответ на сообщение этого пользователя."
-                    )
-                    return
-                break
+    # Ответ на сообщение, текстовое упоминание или @username
+    target_id, user_name, username = await resolve_message_target(update.message, context.bot)
+    if username and not target_id:
+        await update.message.reply_text(
+            f"❌ Не удалось найти пользователя @{username}.\n"
+            "Причина:\n"
+            "• Пользователь не взаимодействовал с ботом в личные сообщения\n"
+            "Используйте команду в ответ на сообщение этого пользователя."
+        )
+        return
     
     # Проверяем аргументы команды (числовой ID)
-    elif context.args and len(context.args) > 0:
+    if not target_id and context.args:
         try:
             target_id = int(context.args[0])
             user_name = f"Пользователь {target_id}"
@@ -272,13 +239,8 @@ async def cmd_balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         if owner_slave_info and owner_slave_info["slave_id"] == target_id:
             purchase_price = owner_slave_info["purchase_price"]
             
-            # Пытаемся найти username владельца для создания ссылки
-            data = load_economy()
-            owner_username = None
-            for username, user_id in data.get("usernames", {}).items():
-                if user_id == owner_id:
-                    owner_username = username
-                    break
+            # Username владельца для ссылки на профиль
+            owner_username = user_directory.get_username(owner_id)
             
             # Создаем ссылку на профиль владельца
             owner_link = profile_link_html(owner_id, f"Владелец {owner_id}", owner_username)
@@ -289,13 +251,8 @@ async def cmd_balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         slave_id = slave_info["slave_id"]
         slave_name = slave_info["slave_name"]
         
-        # Пытаемся найти username раба для создания ссылки
-        data = load_economy()
-        slave_username = None
-        for username, user_id in data.get("usernames", {}).items():
-            if user_id == slave_id:
-                slave_username = username
-                break
+        # Username раба для ссылки на профиль
+        slave_username = user_directory.get_username(slave_id)
         
         # Создаем ссылку на профиль раба
         slave_link = profile_link_html(slave_id, slave_name, slave_username)
@@ -313,6 +270,14 @@ async def cmd_balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     await update.message.reply_text(message, parse_mode="HTML", disable_web_page_preview=True)
 
 
+async def _resolve_admin_target(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[int]:
+    """ID цели админ-команды: ответ, упоминание, числовой ID или @username."""
+    target_id = extract_target_user_id_from_message(update.message)
+    if not target_id:
+        target_id, _, _ = await resolve_message_target(update.message, context.bot)
+    return target_id
+
+
 async def cmd_give_coins(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Админ команда для выдачи монет пользователю."""
     if not await ensure_admin(update):
@@ -322,12 +287,13 @@ async def cmd_give_coins(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     # Получаем целевого пользователя
-    target_id = extract_target_user_id_from_message(update.message)
+    target_id = await _resolve_admin_target(update, context)
     if not target_id:
         await update.message.reply_text(
             "Укажите пользователя и сумму:\n"
             "/give_coins <сумма> (ответом на сообщение)\n"
-            "или /give_coins <user_id> <сумма>"
+            "или /give_coins <user_id> <сумма>\n"
+            "или /give_coins @username <сумма>"
         )
         return
     
@@ -338,8 +304,8 @@ async def cmd_give_coins(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     try:
-        if len(parts) >= 3 and parts[1].isdigit():
-            # Формат: /give_coins <user_id> <amount>
+        if len(parts) >= 3 and (parts[1].isdigit() or parts[1].startswith("@")):
+            # Формат: /give_coins <user_id|@username> <amount>
             amount = int(parts[2])
         else:
             # Формат: /give_coins <amount> (с reply/mention)
@@ -371,12 +337,13 @@ async def cmd_take_coins(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     # Получаем целевого пользователя
-    target_id = extract_target_user_id_from_message(update.message)
+    target_id = await _resolve_admin_target(update, context)
     if not target_id:
         await update.message.reply_text(
             "Укажите пользователя и сумму:\n"
             "/take_coins <сумма> (ответом на сообщение)\n"
-            "или /take_coins <user_id> <сумма>"
+            "или /take_coins <user_id> <сумма>\n"
+            "или /take_coins @username <сумма>"
         )
         return
     
@@ -387,8 +354,8 @@ async def cmd_take_coins(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     try:
-        if len(parts) >= 3 and parts[1].isdigit():
-            # Формат: /take_coins <user_id> <amount>
+        if len(parts) >= 3 and (parts[1].isdigit() or parts[1].startswith("@")):
+            # Формат: /take_coins <user_id|@username> <amount>
             amount = int(parts[2])
         else:
             # Формат: /take_coins <amount> (с reply/mention)
@@ -420,12 +387,13 @@ async def cmd_set_balance(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     # Получаем целевого пользователя
-    target_id = extract_target_user_id_from_message(update.message)
+    target_id = await _resolve_admin_target(update, context)
     if not target_id:
         await update.message.reply_text(
             "Укажите пользователя и сумму:\n"
             "/set_balance <сумма> (ответом на сообщение)\n"
-            "или /set_balance <user_id> <сумма>"
+            "или /set_balance <user_id> <сумма>\n"
+            "или /set_balance @username <сумма>"
         )
         return
     
@@ -436,8 +404,8 @@ async def cmd_set_balance(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
     
     try:
-        if len(parts) >= 3 and parts[1].isdigit():
-            # Формат: /set_balance <user_id> <amount>
+        if len(parts) >= 3 and (parts[1].isdigit() or parts[1].startswith("@")):
+            # Формат: /set_balance <user_id|@username> <amount>
             amount = int(parts[2])
         else:
             # Формат: /set_balance <amount> (с reply/mention)
@@ -549,89 +517,16 @@ async def cmd_slave(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     
     buyer_id = update.effective_user.id
     
-    if update.effective_user.username:
-        save_user_username(update.effective_user.id, update.effective_user.username)
-    
-    target_id = None
-    target_name = None
-    
-    # Сначала проверяем ответ на сообщение
-    if update.message.reply_to_message and update.message.reply_to_message.from_user:
-        target_id = update.message.reply_to_message.from_user.id
-        target_user = update.message.reply_to_message.from_user
-        target_name = target_user.first_name or target_user.username or f"Пользователь {target_id}"
-        
-        # Сохраняем username если есть
-        if target_user.username:
-            save_user_username(target_id, target_user.username)
-    
-    # Затем проверяем упоминания в тексте
-    elif update.message.entities:
-        for entity in update.message.entities:
-            if entity.type == "text_mention" and entity.user:
-                target_id = entity.user.id
-                target_name = entity.user.first_name or entity.user.username or f"Пользователь {target_id}"
-                
-                # Сохраняем username если есть
-                if entity.user.username:
-                    save_user_username(target_id, entity.user.username)
-                break
-            elif entity.type == "mention":
-                start = entity.offset
-                length = entity.length
-                username = update.message.text[start+1:start + length]  # +1 чтобы убрать @
-                target_name = f"@{username}"
-                
-                # Пытаемся найти пользователя разными способами
-                user_found = False
-                
-                # Способ 1: Через get_chat (работает если пользователь взаимодействовал с ботом)
-                try:
-                    chat = await context.bot.get_chat(f"@{username}")
-                    if chat and chat.id:
-                        target_id = chat.id
-                        target_name = chat.first_name or f"@{username}"
-                        user_found = True
-                        
-                        # Сохраняем username
-                        save_user_username(target_id, username)
-                except Exception:
-                    pass
-                
-                # Способ 2: Если это групповой чат, пытаемся через get_chat_member
-                if not user_found and update.effective_chat and update.effective_chat.type in ['group', 'supergroup']:
-                    try:
-                        chat_member = await context.bot.get_chat_member(update.effective_chat.id, f"@{username}")
-                        if chat_member and chat_member.user:
-                            target_id = chat_member.user.id
-                            target_name = chat_member.user.first_name or f"@{username}"
-                            user_found = True
-                            
-                            # Сохраняем username
-                            if chat_member.user.username:
-                                save_user_username(target_id, chat_member.user.username)
-                    except Exception:
-                        pass
-                
-                # Способ 3: Поиск в сохраненных данных экономики по username
-                if not user_found:
-                    data = load_economy()
-                    usernames = data.get("usernames", {})
-                    if username in usernames:
-                        target_id = usernames[username]
-                        target_name = f"@{username}"
-                        user_found = True
-                
-                # Если пользователь не найден
-                if not user_found:
-                    await update.message.reply_text(
-                        f"❌ Не удалось найти пользователя @{username}.\n"
-                        "Причина:\n"
-                        "• Пользователь не взаимодействовал с ботом в личные сообщения\n"
-                        "Используйте команду в ответ на сообщение этого пользователя."
-                    )
-                    return
-                break
+    # Ответ на сообщение, текстовое упоминание или @username
+    target_id, target_name, username = await resolve_message_target(update.message, context.bot)
+    if username and not target_id:
+        await update.message.reply_text(
+            f"❌ Не удалось найти пользователя @{username}.\n"
+            "Причина:\n"
+            "• Пользователь не взаимодействовал с ботом в личные сообщения\n"
+            "Используйте команду в ответ на сообщение этого пользователя."
+        )
+        return
     
     # Если целевой пользователь не найден
     if not target_id:
@@ -757,13 +652,8 @@ async def cmd_slave_info(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         slave_name = slave_info["slave_name"]
         purchase_price = slave_info["purchase_price"]
         
-        # Пытаемся найти username раба для создания ссылки
-        data = load_economy()
-        slave_username = None
-        for username, uid in data.get("usernames", {}).items():
-            if uid == slave_id:
-                slave_username = username
-                break
+        # Username раба для ссылки на профиль
+        slave_username = user_directory.get_username(slave_id)
         
         slave_link = profile_link_html(slave_id, slave_name, slave_username)
         
@@ -788,13 +678,8 @@ async def cmd_slave_info(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             purchase_price = owner_slave_info["purchase_price"]
             user_balance = get_user_balance(user_id)
             
-            # Пытаемся найти информацию о владельце
-            data = load_economy()
-            owner_username = None
-            for username, uid in data.get("usernames", {}).items():
-                if uid == owner_id:
-                    owner_username = username
-                    break
+            # Username владельца для ссылки на профиль
+            owner_username = user_directory.get_username(owner_id)
             
             owner_link = profile_link_html(owner_id, f"Владелец {owner_id}", owner_username)
             
@@ -846,13 +731,8 @@ async def cmd_free_slave_owner(update: Update, context: ContextTypes.DEFAULT_TYP
     slave_name = slave_info["slave_name"]
     purchase_price = slave_info["purchase_price"]
     
-    # Пытаемся найти username раба для создания ссылки
-    data = load_economy()
-    slave_username = None
-    for username, user_id in data.get("usernames", {}).items():
-        if user_id == slave_id:
-            slave_username = username
-            break
+    # Username раба для ссылки на профиль
+    slave_username = user_directory.get_username(slave_id)
     
     slave_link = profile_link_html(slave_id, slave_name, slave_username)
     
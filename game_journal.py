@@ -0,0 +1,99 @@
+"""Журнал партий блекджека: снимок игры при каждой смене фазы, чтобы перезапуск не терял ставки.
+
+Снимки дописываются строками JSON в конец файла (одна запись — один write), завершённая
+игра отмечается строкой с phase="finished". При старте последние снимки незавершённых игр
+читаются в потоке и передаются blackjack.restore_games: набор игроков продолжается, а
+ставки идущих партий возвращаются одной транзакцией. Файл периодически переписывается,
+оставляя только снимки незавершённых игр.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from config import DATA_DIR, SHARD_INDEX
+from storage import write_text_atomic
+
+logger = logging.getLogger(__name__)
+
+# У каждого воркера шарда свой журнал: партии чата живут только в его процессе
+JOURNAL_FILE = DATA_DIR / ("blackjack_journal.jsonl" if SHARD_INDEX < 0 else f"blackjack_journal.{SHARD_INDEX}.jsonl")
+# После стольких записей журнал переписывается заново
+COMPACT_EVERY = 500
+
+# chat_id -> последний снимок незавершённой игры (строка журнала)
+_latest: Dict[int, str] = {}
+_fd: Optional[int] = None
+_records = 0
+
+
+def _append(line: str) -> None:
+    global _fd, _records
+    if _fd is None:
+        _fd = os.open(JOURNAL_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    # Без буфера: запись уходит в файл сразу и переживает падение процесса
+    os.write(_fd, (line + "\n").encode())
+    _records += 1
+    if _records >= COMPACT_EVERY:
+        compact()
+
+
+def record(chat_id: int, snapshot: Dict[str, Any]) -> None:
+    """Записать снимок игры в чате (после каждого изменения, которое нельзя потерять)"""
+    line = json.dumps(snapshot, ensure_ascii=False, separators=(",", ":"))
+    _latest[chat_id] = line
+    _append(line)
+
+
+def forget(chat_id: int) -> None:
+    """Игра в чате завершена или отменена — восстанавливать нечего"""
+    if _latest.pop(chat_id, None) is not None:
+        _append(json.dumps({"chat_id": chat_id, "phase": "finished"}))
+
+
+def compact() -> None:
+    """Переписать журнал, оставив только снимки незавершённых игр.
+
+    Только из цикла событий, как record() и forget(): они делят дескриптор и _latest без блокировки
+    (файл маленький — несколько снимков, так что перезапись цикл не задерживает).
+    """
+    global _fd, _records
+    write_text_atomic(JOURNAL_FILE, "".join(line + "\n" for line in _latest.values()))
+    if _fd is not None:
+        os.close(_fd)  # дескриптор смотрит на старый файл
+        _fd = None
+    _records = len(_latest)
+
+
+def read_unfinished() -> Dict[int, Dict[str, Any]]:
+    """Последние снимки незавершённых игр из журнала (блокирующее чтение — вызывать в потоке)"""
+    games: Dict[int, Dict[str, Any]] = {}
+    try:
+        with open(JOURNAL_FILE, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    snapshot = json.loads(line)
+                except ValueError:
+                    # Недописанная строка — процесс упал посреди записи
+                    logger.warning("Skipping broken line in %s", JOURNAL_FILE.name)
+                    continue
+                if snapshot.get("phase") == "finished":
+                    games.pop(snapshot["chat_id"], None)
+                else:
+                    games[snapshot["chat_id"]] = snapshot
+    except FileNotFoundError:
+        pass
+    return games
+
+
+async def recover_games(app) -> None:
+    """Вызывается при старте до приёма обновлений: вернуть незавершённые игры или ставки"""
+    unfinished = await asyncio.to_thread(read_unfinished)
+    if unfinished:
+        logger.info("Found %d unfinished blackjack games in journal", len(unfinished))
+        # Модуль игры нужен только если есть что восстанавливать
+        from blackjack import restore_games
+
+        await restore_games(app, list(unfinished.values()))
+    compact()
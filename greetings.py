@@ -10,19 +10,34 @@ from zoneinfo import ZoneInfo
 from telegram import Update
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes, Application
-from g4f.client import Client as G4FClient
 
 from utils import build_caption, parse_time_hhmm
-from generate_image import FusionBrainAPI
 
 logger = logging.getLogger(__name__)
-g4f_client = G4FClient()
 
-fusion_api = FusionBrainAPI(
-    'https://api-key.fusionbrain.ai/',
-    '9154F36CA2E78090F7772F11A6BEA9C3',
-    'C5C0BA88525F433CF1817485DA5E1511'
-)
+# Клиенты генерации создаются при первом пожелании: один g4f импортируется ~0.3 с
+_g4f_client = None
+_fusion_api = None
+
+
+def get_g4f_client():
+    global _g4f_client
+    if _g4f_client is None:
+        from g4f.client import Client as G4FClient
+        _g4f_client = G4FClient()
+    return _g4f_client
+
+
+def get_fusion_api():
+    global _fusion_api
+    if _fusion_api is None:
+        from generate_image import FusionBrainAPI
+        _fusion_api = FusionBrainAPI(
+            'https://api-key.fusionbrain.ai/',
+            '9154F36CA2E78090F7772F11A6BEA9C3',
+            'C5C0BA88525F433CF1817485DA5E1511'
+        )
+    return _fusion_api
 
 def _gen_text_sync(kind: Literal["morning", "evening"]) -> str:
     if kind == "morning":
@@ -40,7 +55,7 @@ def _gen_text_sync(kind: Literal["morning", "evening"]) -> str:
         )
         model = "gpt-4o-mini"
 
-    resp = g4f_client.chat.completions.create(
+    resp = get_g4f_client().chat.completions.create(
         model=model,
         messages=[
             {"role": "system", "content": "Ты — дружелюбный и веселый автор коротких тёплых пожеланий."},
@@ -65,6 +80,7 @@ def _gen_image_sync(kind: Literal["morning", "evening"]) -> str:
                 "уютная атмосфера, высокое качество, иллюстрация, 4k, night, dreamy"
             )
 
+        fusion_api = get_fusion_api()
         pipeline_id = fusion_api.get_pipeline()
         if not pipeline_id:
             logger.error("Не удалось получить pipeline ID")
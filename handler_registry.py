@@ -0,0 +1,71 @@
+"""Ленивая регистрация обработчиков: модуль фичи импортируется, когда он впервые понадобился.
+
+В main обработчик указывается строкой "модуль:функция" (lazy). Сразу после старта модули
+догружаются в фоновом потоке (start_warm_up), а если обновление пришло раньше —
+модуль импортируется при первом вызове обработчика.
+"""
+import asyncio
+import importlib
+import logging
+import time
+from typing import Callable, Dict, Optional, Set
+
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+# Модули, на которые ссылаются ленивые обработчики, и уже найденные функции
+lazy_modules: Set[str] = set()
+_targets: Set[str] = set()
+_resolved: Dict[str, Callable] = {}
+_warm_up_task: Optional[asyncio.Task] = None
+
+
+def resolve(target: str) -> Callable:
+    """Функция по строке "модуль:функция" (с импортом модуля при первом обращении)"""
+    callback = _resolved.get(target)
+    if callback is None:
+        module_name, _, name = target.partition(":")
+        callback = getattr(importlib.import_module(module_name), name)
+        _resolved[target] = callback
+    return callback
+
+
+def lazy(target: str) -> Callable:
+    """Обработчик-заместитель для "модуль:функция", сам модуль при этом не импортируется"""
+    module_name, sep, name = target.partition(":")
+    if not sep or not module_name or not name:
+        raise ValueError(f"Expected 'module:function', got {target!r}")
+    lazy_modules.add(module_name)
+    _targets.add(target)
+
+    async def handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+        return await resolve(target)(update, context)
+
+    # Имя настоящей функции — его видят метрики, логи и сторож цикла событий
+    handler.__name__ = handler.__qualname__ = name
+    handler.__module__ = module_name
+    return handler
+
+
+def resolve_all() -> None:
+    """Импортировать все модули ленивых обработчиков (опечатка в имени всплывёт здесь)"""
+    for target in sorted(_targets):
+        resolve(target)
+
+
+async def _warm_up() -> None:
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(resolve_all)
+    except Exception:
+        logger.exception("Failed to import lazy handlers")
+        return
+    logger.info("Imported %d handler modules in %.0f ms", len(lazy_modules), (time.perf_counter() - started) * 1000)
+
+
+def start_warm_up() -> None:
+    """Догрузить модули обработчиков в потоке, пока бот уже принимает обновления"""
+    global _warm_up_task
+    if _warm_up_task is None:
+        _warm_up_task = asyncio.get_running_loop().create_task(_warm_up(), name="warm_up_handlers")
@@ -6,6 +6,7 @@ from telegram.ext import ContextTypes
 from telegram.constants import ChatType
 
 from storage import load_cooldowns, save_cooldowns
+from reaper import schedule_delete
 from utils import safe_html, get_target_user
 
 logger = logging.getLogger(__name__)
@@ -95,27 +96,11 @@ async def cmd_kiss(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     
     if is_self_kiss:
         bot_msg = await message.reply_text("Лучше трахните кого-нибудь другого!")
-        
-        async def delete_messages(context):
-            try:
-                await context.bot.delete_message(chat_id, message.message_id)
-            except Exception as e:
-                logger.warning("Failed to delete user message: %s", e)
-            try:
-                await context.bot.delete_message(chat_id, bot_msg.message_id)
-            except Exception as e:
-                logger.warning("Failed to delete bot message: %s", e)
-        
-        context.job_queue.run_once(delete_messages, 3)
+        schedule_delete(chat_id, message.message_id, bot_msg.message_id)
         return
     
     remaining_time = check_kiss_cooldown(kisser.id, chat_id)
     if remaining_time is not None:
-        try:
-            await message.delete()
-        except Exception as e:
-            logger.warning("Failed to delete command message: %s", e)
-        
         warning_msg = await context.bot.send_message(
             chat_id,
             f"⏰ {safe_html(kisser.first_name)}, вы сможете снова трахнуть кого-то через "
@@ -123,13 +108,8 @@ async def cmd_kiss(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             parse_mode="HTML"
         )
         
-        async def delete_warning(context):
-            try:
-                await context.bot.delete_message(chat_id, warning_msg.message_id)
-            except Exception as e:
-                logger.warning("Failed to delete warning message: %s", e)
-        
-        context.job_queue.run_once(delete_warning, 3)
+        # Команду и предупреждение удаляем вместе через 3 секунды
+        schedule_delete(chat_id, message.message_id, warning_msg.message_id)
         return
     
     set_kiss_cooldown(kisser.id, chat_id)
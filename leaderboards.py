@@ -0,0 +1,143 @@
+"""Инкрементальные таблицы лидеров для /top."""
+import bisect
+import heapq
+import logging
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Leaderboard:
+    """Таблица лидеров в виде отсортированного списка ключей.
+
+    Ключ пользователя — кортеж сортировки с user_id в конце (для однозначности),
+    поэтому обновление одного пользователя — это bisect + вставка,
+    а чтение топ-N — срез первых N элементов.
+    """
+
+    def __init__(self) -> None:
+        self._keys: List[Tuple] = []
+        self._by_user: Dict[int, Tuple] = {}
+
+    def update(self, user_id: int, sort_key: Optional[Tuple]) -> None:
+        """Обновить позицию пользователя. sort_key=None убирает его из таблицы"""
+        old = self._by_user.pop(user_id, None)
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, old)]
+        if sort_key is not None:
+            key = (*sort_key, user_id)
+            bisect.insort(self._keys, key)
+            self._by_user[user_id] = key
+
+    def top(self, limit: int) -> List[int]:
+        """ID первых limit пользователей"""
+        return [key[-1] for key in self._keys[:limit]]
+
+    def top_among(self, user_ids: Collection[int], limit: int) -> List[int]:
+        """ID первых limit пользователей из заданного множества (например, участников чата)"""
+        if len(user_ids) < len(self._keys):
+            # Участников меньше, чем людей в таблице: частичный выбор top-k по их ключам
+            keys = [self._by_user[uid] for uid in user_ids if uid in self._by_user]
+            return [key[-1] for key in heapq.nsmallest(limit, keys)]
+        # Иначе идём по таблице сверху вниз до первых limit совпадений
+        result = []
+        for key in self._keys:
+            if key[-1] in user_ids:
+                result.append(key[-1])
+                if len(result) >= limit:
+                    break
+        return result
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._by_user
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+# Таблицы строятся из файлов при первом обращении, дальше обновляются хуками.
+# Если файл перечитан с диска (его переписал другой шард), таблица строится заново
+_balance_board: Optional[Leaderboard] = None
+_balance_version = 0
+_balances: Dict[int, int] = {}
+
+_blackjack_board: Optional[Leaderboard] = None
+_blackjack_version = 0
+_blackjack_stats: Dict[int, Dict[str, Any]] = {}
+
+
+def _balance_key(balance: int) -> Optional[Tuple]:
+    # В топ попадают только положительные балансы
+    return (-balance,) if balance > 0 else None
+
+
+def _blackjack_key(stats: Dict[str, Any]) -> Tuple:
+    # Сначала по победам (убывание), потом по ничьим (убывание), потом по поражениям (возрастание)
+    return (-stats["wins"], -stats["draws"], stats["losses"])
+
+
+def get_balance_board() -> Leaderboard:
+    """Таблица лидеров по балансу"""
+    global _balance_board, _balance_version
+    from economy import economy_version, load_economy
+
+    if _balance_board is None or economy_version() != _balance_version:
+        data = load_economy()
+        _balance_version = economy_version()
+        board = Leaderboard()
+        _balances.clear()
+        for user_id_str, balance in data.get("balances", {}).items():
+            user_id = int(user_id_str)
+            _balances[user_id] = balance
+            board.update(user_id, _balance_key(balance))
+        _balance_board = board
+        logger.info("Balance leaderboard built: %d users", len(board))
+    return _balance_board
+
+
+def get_blackjack_board() -> Leaderboard:
+    """Таблица лидеров блекджека"""
+    global _blackjack_board, _blackjack_version
+    from blackjack import blackjack_stats_version, load_blackjack_stats
+
+    if _blackjack_board is None or blackjack_stats_version() != _blackjack_version:
+        data = load_blackjack_stats()
+        _blackjack_version = blackjack_stats_version()
+        board = Leaderboard()
+        _blackjack_stats.clear()
+        for user_id_str, stats in data.get("stats", {}).items():
+            user_id = int(user_id_str)
+            _blackjack_stats[user_id] = dict(stats)
+            board.update(user_id, _blackjack_key(stats))
+        _blackjack_board = board
+        logger.info("Blackjack leaderboard built: %d users", len(board))
+    return _blackjack_board
+
+
+def get_cached_balance(user_id: int) -> int:
+    return _balances.get(user_id, 0)
+
+
+def get_cached_username(user_id: int) -> Optional[str]:
+    from user_directory import get_username
+    return get_username(user_id)
+
+
+def get_cached_blackjack_stats(user_id: int) -> Optional[Dict[str, Any]]:
+    return _blackjack_stats.get(user_id)
+
+
+def on_balance_changed(user_id: int, balance: int) -> None:
+    """Хук: баланс пользователя изменился"""
+    if _balance_board is None:
+        return  # таблица ещё не построена — прочитает актуальный файл
+    _balances[user_id] = balance
+    _balance_board.update(user_id, _balance_key(balance))
+
+
+def on_blackjack_stats_changed(user_id: int, stats: Dict[str, Any]) -> None:
+    """Хук: статистика блекджека пользователя изменилась"""
+    if _blackjack_board is None:
+        return
+    _blackjack_stats[user_id] = dict(stats)
+    _blackjack_board.update(user_id, _blackjack_key(stats))
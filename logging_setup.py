@@ -0,0 +1,148 @@
+"""Логирование через очередь: обработчики только кладут запись в очередь, пишет отдельный поток.
+
+Записи выводятся JSON-строками (LOG_FORMAT=text — привычным текстом) с полями текущего
+обновления: update_id, chat_id, user_id, обработчик и сколько он уже работает.
+Повторяющиеся DEBUG-строки прореживаются.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from contextvars import ContextVar, Token
+from typing import Any, Dict, Optional, Tuple
+
+# Одинаковые DEBUG-строки (логгер + шаблон): первые DEBUG_SAMPLE_BURST пишутся все, дальше каждая N-я
+DEBUG_SAMPLE_BURST = 5
+DEBUG_SAMPLE_EVERY = 20
+# Сколько разных DEBUG-шаблонов помнить (f-строки дают уникальный текст на каждую запись)
+DEBUG_SAMPLE_KEYS = 10000
+# Шумные библиотеки: httpx пишет строку на каждый запрос к Bot API
+QUIET_LOGGERS = ("httpx", "httpcore", "apscheduler")
+
+CONTEXT_FIELDS = ("update_id", "chat_id", "user_id", "handler")
+
+# (update_id, chat_id, user_id, обработчик, время начала по perf_counter)
+_context: ContextVar[Optional[Tuple[Any, Any, Any, str, float]]] = ContextVar("log_context", default=None)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def bind_update(update: object, handler: str) -> Token:
+    """Привязать к записям лога текущее обновление и обработчик (до reset_update)"""
+    chat = getattr(update, "effective_chat", None)
+    user = getattr(update, "effective_user", None)
+    return _context.set((
+        getattr(update, "update_id", None),
+        chat.id if chat else None,
+        user.id if user else None,
+        handler,
+        time.perf_counter(),
+    ))
+
+
+def reset_update(token: Token) -> None:
+    _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Дописывает в запись поля обновления — в потоке обработчика, пока контекст ещё тот"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _context.get()
+        if context is not None:
+            record.update_id, record.chat_id, record.user_id, record.handler, started = context
+            record.elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Прореживает повторяющиеся DEBUG-строки, чтобы отладочный уровень не душил очередь"""
+
+    def __init__(self, burst: int = DEBUG_SAMPLE_BURST, every: int = DEBUG_SAMPLE_EVERY):
+        super().__init__()
+        self.burst = burst
+        self.every = every
+        self._seen: Dict[Tuple[str, Any], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        key = (record.name, record.msg)
+        if key not in self._seen and len(self._seen) >= DEBUG_SAMPLE_KEYS:
+            self._seen.clear()
+        count = self._seen.get(key, 0) + 1
+        self._seen[key] = count
+        if count <= self.burst:
+            return True
+        if count % self.every:
+            return False
+        record.sampled = self.every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS + ("elapsed_ms", "sampled"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Стандартный prepare форматирует запись прямо здесь, в цикле событий;
+        # достаточно подставить аргументы, остальное сделает поток-слушатель
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(level: str = "INFO", fmt: str = "json") -> None:
+    """Перенастроить корневой логгер на очередь с потоком-слушателем"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stderr)
+    if fmt == "text":
+        output.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s"))
+    else:
+        output.setFormatter(JsonFormatter())
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(DebugSampler())
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Дописать очередь и остановить поток-слушатель"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
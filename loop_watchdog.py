@@ -0,0 +1,162 @@
+"""Сторож цикла событий: лаг планирования и стеки синхронных вызовов, которые его блокируют.
+
+Корутина-пульс отмечается каждые HEARTBEAT_INTERVAL. Отдельный поток следит за пульсом
+и, если тот задержался дольше порога, снимает стек главного потока — это и есть место,
+где цикл занят синхронной работой (чтение JSON, запись файлов и т.п.).
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from dataclasses import dataclass
+from types import FrameType
+from typing import Deque, Dict, List, Optional, Tuple
+
+from metrics import loop_lag
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 0.05
+# С какой задержки пульса считаем, что цикл заблокирован (в секундах)
+BLOCK_THRESHOLD = 0.1
+# Сколько последних инцидентов хранить целиком (со стеком)
+MAX_INCIDENTS = 50
+STACK_DEPTH = 12
+
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Обёртки, которые есть в каждом стеке и местом блокировки не считаются
+_WRAPPER_FILES = ("metrics.py", "callbacks.py")
+
+
+@dataclass
+class Incident:
+    handler: str
+    site: str
+    stack: str
+    duration: float
+    at: float
+
+
+# Последние инциденты и сводка: (обработчик, место) -> [количество, суммарно секунд, максимум]
+incidents: Deque[Incident] = deque(maxlen=MAX_INCIDENTS)
+blockers: Dict[Tuple[str, str], List[float]] = {}
+
+_lock = threading.Lock()
+# Стек, снятый потоком для текущей задержки пульса: (время пульса, обработчик, место, стек)
+_captured: Optional[Tuple[float, str, str, str]] = None
+_beat = 0.0
+_threshold = BLOCK_THRESHOLD
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+_task: Optional[asyncio.Task] = None
+
+
+def _is_project_frame(frame: FrameType) -> bool:
+    filename = frame.f_code.co_filename
+    return (filename.startswith(_PROJECT_DIR) and "site-packages" not in filename
+            and not filename.endswith(_WRAPPER_FILES))
+
+
+def _describe(frame: FrameType, loop: asyncio.AbstractEventLoop) -> Tuple[str, str, str]:
+    """(обработчик, место блокировки, стек) по кадру главного потока"""
+    handler = site = None
+    current = frame
+    while current is not None:
+        code = current.f_code
+        if site is None and _is_project_frame(current):
+            site = f"{os.path.basename(code.co_filename)}:{current.f_lineno} {code.co_name}"
+        if handler is None and code.co_filename.endswith("metrics.py") and code.co_name == "wrapper":
+            handler = current.f_locals.get("name")
+        if handler is None and code.co_filename.endswith("callbacks.py") and code.co_name == "run":
+            # Фоновая часть обработчика кнопки (callbacks.instant_callback)
+            target = current.f_locals.get("handler")
+            handler = getattr(target, "__name__", None)
+        current = current.f_back
+    if handler is None:
+        # Задачи без обёртки метрик (задания job_queue, таймеры игр) — хотя бы имя задачи
+        task = getattr(asyncio.tasks, "_current_tasks", {}).get(loop)
+        handler = task.get_name() if task is not None else "—"
+    stack = "".join(traceback.format_stack(frame, limit=STACK_DEPTH))
+    return handler, site or "—", stack
+
+
+def _watch(loop: asyncio.AbstractEventLoop, loop_thread_id: int) -> None:
+    global _captured
+    captured_beat = None
+    while not _stop.wait(HEARTBEAT_INTERVAL / 2):
+        beat = _beat
+        late = time.monotonic() - beat - HEARTBEAT_INTERVAL
+        if late < _threshold or captured_beat == beat:
+            continue
+        frame = sys._current_frames().get(loop_thread_id)
+        if frame is None:
+            continue
+        captured_beat = beat
+        description = _describe(frame, loop)
+        with _lock:
+            _captured = (beat, *description)
+
+
+def _record(lag: float, beat: float) -> None:
+    global _captured
+    with _lock:
+        captured, _captured = _captured, None
+    if captured and captured[0] == beat:
+        _, handler, site, stack = captured
+    else:
+        # Поток не успел снять стек (блокировка чуть выше порога)
+        handler, site, stack = "—", "—", ""
+    incidents.append(Incident(handler, site, stack, lag, time.time()))
+    entry = blockers.setdefault((handler, site), [0, 0.0, 0.0])
+    entry[0] += 1
+    entry[1] += lag
+    entry[2] = max(entry[2], lag)
+    logger.warning("Event loop blocked for %.0f ms in %s at %s\n%s", lag * 1000, handler, site, stack)
+
+
+async def _heartbeat() -> None:
+    global _beat
+    while True:
+        _beat = time.monotonic()
+        expected = time.perf_counter() + HEARTBEAT_INTERVAL
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        lag = max(0.0, time.perf_counter() - expected)
+        loop_lag.observe(lag)
+        if lag >= _threshold:
+            _record(lag, _beat)
+
+
+def start_watchdog(threshold: float = BLOCK_THRESHOLD) -> None:
+    """Запустить пульс в текущем цикле событий и поток-наблюдатель"""
+    global _thread, _task, _threshold, _beat
+    if _task is not None:
+        return
+    _threshold = threshold
+    _beat = time.monotonic()
+    _stop.clear()
+    loop = asyncio.get_running_loop()
+    _task = loop.create_task(_heartbeat(), name="loop_watchdog")
+    _thread = threading.Thread(target=_watch, args=(loop, threading.get_ident()), name="loop-watchdog", daemon=True)
+    _thread.start()
+
+
+def stop_watchdog() -> None:
+    global _thread, _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    if _thread is not None:
+        _stop.set()
+        _thread.join(timeout=1)
+        _thread = None
+
+
+def top_blockers(limit: int = 10) -> List[Tuple[str, str, int, float, float]]:
+    """Худшие блокировки по суммарному времени: (обработчик, место, раз, всего, максимум)"""
+    rows = [(handler, site, int(count), total, worst) for (handler, site), (count, total, worst) in blockers.items()]
+    rows.sort(key=lambda row: row[3], reverse=True)
+    return rows[:limit]
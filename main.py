@@ -1,5 +1,6 @@
 """Основной файл бота."""
 import logging
+from typing import Optional
 from telegram import Update
 from telegram.constants import ChatType
 from telegram.ext import (
@@ -10,46 +11,52 @@ from telegram.ext import (
     CallbackQueryHandler,
     MessageHandler,
     TypeHandler,
-    ApplicationHandlerStop,
     filters,
 )
 
-from config import TELEGRAM_BOT_TOKEN, HELP_TEXT, MARRY_DEEPLINK_PREFIX
-from storage import load_store, save_store
+from config import (
+    TELEGRAM_BOT_TOKEN, HELP_TEXT, MARRY_DEEPLINK_PREFIX, STORE_FLUSH_INTERVAL, METRICS_PORT,
+    RECORD_UPDATES_DIR, RECORD_SALT, LOG_LEVEL, LOG_FORMAT, UPDATE_MODE, ALLOWED_UPDATES,
+    BOT_API_BASE_URL, SHARD_COUNT, SHARD_INDEX,
+)
+from logging_setup import setup_logging
+from storage import load_store, save_store, flush_batched_stores, flush_batched_stores_job
+from reaper import REAPER_TICK, reap_messages_job
+from antispam import antispam_filter, is_blocked_chat_id
+from callbacks import mark_callback_received
+from loop_watchdog import start_watchdog, stop_watchdog
+from recorder import record_update, start_recording, stop_recording
+from handler_registry import lazy, start_warm_up
+from game_journal import recover_games
+from webhook import allowed_updates_for, run_webhook
+from sharding import owns_chat, run_dispatcher, run_worker
+from metrics import InstrumentedRequest, instrument_application, start_metrics, stop_metrics, cmd_stats
 from settings import ChatSettings, get_chat_settings, stop, set_morning, set_evening, set_timezone, settings_cmd
 from greetings import schedule_for_chat, preview_greeting
 from admin import admin_claim, admins_list, admin_add, admin_remove, ensure_admin
-from custom_commands import cc_cmd_set, cc_cmd_set_photo, cc_cmd_remove, cc_cmd_list, custom_command_router
-from marriages import cmd_marry, cmd_marriages, cmd_divorce, cb_marry, cmd_expand, cmd_close_marriage
-from kisses import cmd_kiss
-from drinking import cmd_drink, cb_drink
-from selfcare import cmd_selfcare, cb_ribs
-from blackjack import cmd_blackjack, cmd_blackjack_add_time, cmd_blackjack_start, cb_blackjack_join, cb_blackjack_hit, cb_blackjack_stand, cb_blackjack_bet_reset, cb_blackjack_bet_accept, cb_blackjack_bet_slave, cb_blackjack_bet_add
-from economy import cmd_balance, cmd_give_coins, cmd_take_coins, cmd_set_balance, cmd_slave, cmd_buyout, cmd_free_slave_owner
-from work import cmd_work, cb_work_click
-from top import cmd_top, cb_top_switch
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-)
-logger = logging.getLogger("tg-g4f-greetings")
-
-BLOCKED_CHAT_ID = -1002403119663   #
+from chat_members import track_chat_activity
+from user_directory import track_user_directory
 
+setup_logging(LOG_LEVEL, LOG_FORMAT)
+logger = logging.getLogger("tg-g4f-greetings")
 
-def is_blocked_chat(update: Update) -> bool:
-    if update.effective_chat and update.effective_chat.id == BLOCKED_CHAT_ID:
-        return True
-    cq = getattr(update, "callback_query", None)
-    if cq and cq.message and cq.message.chat and cq.message.chat.id == BLOCKED_CHAT_ID:
-        return True
-    return False
+async def on_startup(app: Application) -> None:
+    await start_metrics(METRICS_PORT)
+    start_watchdog()
+    # Модули фич догружаются в фоне, пока бот уже принимает обновления
+    start_warm_up()
+    # Незавершённые партии блекджека — до того, как начнут приходить обновления
+    await recover_games(app)
+    if RECORD_UPDATES_DIR:
+        start_recording(RECORD_UPDATES_DIR, RECORD_SALT)
 
 
-async def block_chat_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if is_blocked_chat(update):
-        raise ApplicationHandlerStop()
+async def on_shutdown(app: Application) -> None:
+    await stop_metrics()
+    stop_watchdog()
+    stop_recording()
+    # Дописываем на диск всё, что ещё не успело сброситься пачкой
+    flush_batched_stores()
 
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -139,14 +146,35 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(HELP_TEXT)
 
 
-def bootstrap_application() -> Application:
-    if not TELEGRAM_BOT_TOKEN:
+def bootstrap_application(token: Optional[str] = None, base_url: Optional[str] = None) -> Application:
+    """Собрать приложение. token и base_url подменяются в бенчмарках (заглушка Bot API)"""
+    token = token or TELEGRAM_BOT_TOKEN
+    base_url = base_url or BOT_API_BASE_URL
+    if not token:
         raise RuntimeError("Environment variable TELEGRAM_BOT_TOKEN is not set.")
 
-    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .request(InstrumentedRequest())
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    app = builder.build()
     app.add_error_handler(error_handler)
 
-    app.add_handler(TypeHandler(Update, block_chat_handler), group=-100)
+    # Запись трафика для бенчмарков — раньше всего остального, чтобы попадали и отсеянные обновления
+    if RECORD_UPDATES_DIR:
+        app.add_handler(TypeHandler(Update, record_update), group=-300)
+    # Время получения нажатий — для замеров задержки ответа на кнопки
+    app.add_handler(CallbackQueryHandler(mark_callback_received), group=-200)
+    # Чёрный список и ограничение частоты — раньше всех остальных обработчиков
+    app.add_handler(TypeHandler(Update, antispam_filter), group=-100)
+    app.add_handler(TypeHandler(Update, track_chat_activity), group=-50)
+    # Справочник пользователей обновляется после всех остальных обработчиков
+    app.add_handler(TypeHandler(Update, track_user_directory), group=100)
 
     # база 
     app.add_handler(CommandHandler("start", handle_start))
@@ -165,58 +193,68 @@ def bootstrap_application() -> Application:
     app.add_handler(CommandHandler("admin_remove", admin_remove))
 
     # экономика
-    app.add_handler(CommandHandler("balance", cmd_balance))
-    app.add_handler(CommandHandler("give_coins", cmd_give_coins))
-    app.add_handler(CommandHandler("take_coins", cmd_take_coins))
-    app.add_handler(CommandHandler("set_balance", cmd_set_balance))
-    app.add_handler(CommandHandler("work", cmd_work))
-    app.add_handler(MessageHandler(filters.Regex(r"^/раб(?:@\w+)?(?:\s|$)"), cmd_slave))
-    app.add_handler(MessageHandler(filters.Regex(r"^/выкуп(?:@\w+)?(?:\s|$)"), cmd_buyout))
-    app.add_handler(MessageHandler(filters.Regex(r"^/освободить_раба(?:@\w+)?(?:\s|$)"), cmd_free_slave_owner))
+    app.add_handler(CommandHandler("balance", lazy("economy:cmd_balance")))
+    app.add_handler(CommandHandler("give_coins", lazy("economy:cmd_give_coins")))
+    app.add_handler(CommandHandler("take_coins", lazy("economy:cmd_take_coins")))
+    app.add_handler(CommandHandler("set_balance", lazy("economy:cmd_set_balance")))
+    app.add_handler(CommandHandler("work", lazy("work:cmd_work")))
+    app.add_handler(MessageHandler(filters.Regex(r"^/раб(?:@\w+)?(?:\s|$)"), lazy("economy:cmd_slave")))
+    app.add_handler(MessageHandler(filters.Regex(r"^/выкуп(?:@\w+)?(?:\s|$)"), lazy("economy:cmd_buyout")))
+    app.add_handler(MessageHandler(filters.Regex(r"^/освободить_раба(?:@\w+)?(?:\s|$)"), lazy("economy:cmd_free_slave_owner")))
 
     # кастом
-    app.add_handler(CommandHandler("cc_set", cc_cmd_set))
-    app.add_handler(CommandHandler("cc_set_photo", cc_cmd_set_photo))
-    app.add_handler(CommandHandler("cc_remove", cc_cmd_remove))
-    app.add_handler(CommandHandler("cc_list", cc_cmd_list))
+    app.add_handler(CommandHandler("cc_set", lazy("custom_commands:cc_cmd_set")))
+    app.add_handler(CommandHandler("cc_set_photo", lazy("custom_commands:cc_cmd_set_photo")))
+    app.add_handler(CommandHandler("cc_remove", lazy("custom_commands:cc_cmd_remove")))
+    app.add_handler(CommandHandler("cc_list", lazy("custom_commands:cc_cmd_list")))
 
     # блекджек
-    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/блекджек(?:@\w+)?(?:\s|$)"), cmd_blackjack))
-    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/блекджек\+30сек(?:@\w+)?(?:\s|$)"), cmd_blackjack_add_time))
-    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/блекджек_начать(?:@\w+)?(?:\s|$)"), cmd_blackjack_start))
-    app.add_handler(CallbackQueryHandler(cb_blackjack_join, pattern=r"^bj_join:"))
-    app.add_handler(CallbackQueryHandler(cb_blackjack_hit, pattern=r"^bj_hit:"))
-    app.add_handler(CallbackQueryHandler(cb_blackjack_stand, pattern=r"^bj_stand:"))
-    app.add_handler(CallbackQueryHandler(cb_blackjack_bet_add, pattern=r"^bj_bet_add:"))
-    app.add_handler(CallbackQueryHandler(cb_blackjack_bet_reset, pattern=r"^bj_bet_reset:"))
-    app.add_handler(CallbackQueryHandler(cb_blackjack_bet_accept, pattern=r"^bj_bet_accept:"))
-    app.add_handler(CallbackQueryHandler(cb_blackjack_bet_slave, pattern=r"^bj_bet_slave:"))
+    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/блекджек(?:@\w+)?(?:\s|$)"), lazy("blackjack:cmd_blackjack")))
+    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/блекджек\+30сек(?:@\w+)?(?:\s|$)"), lazy("blackjack:cmd_blackjack_add_time")))
+    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/блекджек_начать(?:@\w+)?(?:\s|$)"), lazy("blackjack:cmd_blackjack_start")))
+    app.add_handler(CallbackQueryHandler(lazy("blackjack:cb_blackjack_join"), pattern=r"^bj_join:"))
+    app.add_handler(CallbackQueryHandler(lazy("blackjack:cb_blackjack_hit"), pattern=r"^bj_hit:"))
+    app.add_handler(CallbackQueryHandler(lazy("blackjack:cb_blackjack_stand"), pattern=r"^bj_stand:"))
+    app.add_handler(CallbackQueryHandler(lazy("blackjack:cb_blackjack_bet_add"), pattern=r"^bj_bet_add:"))
+    app.add_handler(CallbackQueryHandler(lazy("blackjack:cb_blackjack_bet_reset"), pattern=r"^bj_bet_reset:"))
+    app.add_handler(CallbackQueryHandler(lazy("blackjack:cb_blackjack_bet_accept"), pattern=r"^bj_bet_accept:"))
+    app.add_handler(CallbackQueryHandler(lazy("blackjack:cb_blackjack_bet_slave"), pattern=r"^bj_bet_slave:"))
 
     # браки
-    app.add_handler(CommandHandler(["marry"], cmd_marry, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler(["marriages"], cmd_marriages, filters=filters.ChatType.GROUPS))
-    app.add_handler(CommandHandler(["divorce"], cmd_divorce, filters=filters.ChatType.GROUPS))
-    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/брак(?:@\w+)?(?:\s|$)"), cmd_marry))
-    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/браки(?:@\w+)?(?:\s|$)"), cmd_marriages))
-    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/развод(?:@\w+)?(?:\s|$)"), cmd_divorce))
-    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/расширить(?:@\w+)?(?:\s|$)"), cmd_expand))
-    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/закрыть_брак(?:@\w+)?(?:\s|$)"), cmd_close_marriage))
-    app.add_handler(CallbackQueryHandler(cb_marry, pattern=r"^(accept|decline):"))
+    app.add_handler(CommandHandler(["marry"], lazy("marriages:cmd_marry"), filters=filters.ChatType.GROUPS))
+    app.add_handler(CommandHandler(["marriages"], lazy("marriages:cmd_marriages"), filters=filters.ChatType.GROUPS))
+    app.add_handler(CommandHandler(["divorce"], lazy("marriages:cmd_divorce"), filters=filters.ChatType.GROUPS))
+    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/брак(?:@\w+)?(?:\s|$)"), lazy("marriages:cmd_marry")))
+    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/браки(?:@\w+)?(?:\s|$)"), lazy("marriages:cmd_marriages")))
+    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/развод(?:@\w+)?(?:\s|$)"), lazy("marriages:cmd_divorce")))
+    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/расширить(?:@\w+)?(?:\s|$)"), lazy("marriages:cmd_expand")))
+    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/закрыть_брак(?:@\w+)?(?:\s|$)"), lazy("marriages:cmd_close_marriage")))
+    app.add_handler(CallbackQueryHandler(lazy("marriages:cb_marry"), pattern=r"^(accept|decline):"))
+    app.add_handler(CallbackQueryHandler(lazy("marriages:cb_marriages_page"), pattern=r"^marriages_page:"))
 
     # развлечения
-    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/трахнуть(?:@\w+)?(?:\s|$)"), cmd_kiss))
-    app.add_handler(MessageHandler(filters.Regex(r"^/выпить(?:@\w+)?(?:\s|$)"), cmd_drink))
-    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/самоотсос(?:@\w+)?(?:\s|$)"), cmd_selfcare))
-    app.add_handler(CallbackQueryHandler(cb_drink, pattern=r"^drink:"))
-    app.add_handler(CallbackQueryHandler(cb_ribs, pattern=r"^ribs:"))
-    app.add_handler(CallbackQueryHandler(cb_work_click, pattern=r"^work_click:"))
+    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/трахнуть(?:@\w+)?(?:\s|$)"), lazy("kisses:cmd_kiss")))
+    app.add_handler(MessageHandler(filters.Regex(r"^/выпить(?:@\w+)?(?:\s|$)"), lazy("drinking:cmd_drink")))
+    app.add_handler(MessageHandler(filters.ChatType.GROUPS & filters.Regex(r"^/самоотсос(?:@\w+)?(?:\s|$)"), lazy("selfcare:cmd_selfcare")))
+    app.add_handler(CallbackQueryHandler(lazy("drinking:cb_drink"), pattern=r"^drink:"))
+    app.add_handler(CallbackQueryHandler(lazy("selfcare:cb_ribs"), pattern=r"^ribs:"))
+    app.add_handler(CallbackQueryHandler(lazy("work:cb_work_click"), pattern=r"^work_click:"))
 
     # top command handler
-    app.add_handler(CommandHandler("top", cmd_top))
-    app.add_handler(CallbackQueryHandler(cb_top_switch, pattern=r"^top_switch:"))
+    app.add_handler(CommandHandler("top", lazy("top:cmd_top")))
+    app.add_handler(CallbackQueryHandler(lazy("top:cb_top_switch"), pattern=r"^top_switch:"))
 
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, custom_command_router))
-    app.add_handler(MessageHandler(filters.Regex(r"^/"), custom_command_router))
+    app.add_handler(CommandHandler("stats", cmd_stats))
+
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, lazy("custom_commands:custom_command_router")))
+    app.add_handler(MessageHandler(filters.Regex(r"^/"), lazy("custom_commands:custom_command_router")))
+
+    # Замеры времени и ввода-вывода для всех обработчиков выше
+    instrument_application(app)
+
+    if app.job_queue:
+        app.job_queue.run_repeating(flush_batched_stores_job, interval=STORE_FLUSH_INTERVAL, name="flush_batched_stores")
+        app.job_queue.run_repeating(reap_messages_job, interval=REAPER_TICK, name="reap_messages")
 
     store = load_store()
     for chat_id_str, cfg in store.items():
@@ -224,9 +262,12 @@ def bootstrap_application() -> Application:
             chat_id = int(chat_id_str)
         except ValueError:
             continue
-        if chat_id == BLOCKED_CHAT_ID:
+        if is_blocked_chat_id(chat_id):
             logger.info("Skipping scheduling for blocked chat %s", chat_id)
             continue
+        # При шардировании рассылки чата планирует только его воркер
+        if not owns_chat(chat_id):
+            continue
         schedule_for_chat(app, chat_id, ChatSettings.from_dict(cfg))
 
     return app
@@ -235,8 +276,21 @@ def bootstrap_application() -> Application:
 def main() -> None:
     try:
         app = bootstrap_application()
-        logger.info("Starting bot...")
-        app.run_polling(allowed_updates=Update.ALL_TYPES)
+        if SHARD_INDEX >= 0:
+            # Воркер шарда: обновления приходят от диспетчера, а не от Telegram
+            logger.info("Starting shard %d of %d", SHARD_INDEX, SHARD_COUNT)
+            run_worker(app)
+            return
+        # Только те типы обновлений, которые кто-то обрабатывает — остальные Telegram не пришлёт
+        allowed_updates = ALLOWED_UPDATES or allowed_updates_for(app)
+        logger.info("Starting bot (%s), allowed updates: %s", UPDATE_MODE, ", ".join(allowed_updates))
+        if SHARD_COUNT > 1:
+            # Собранное приложение нужно было только для списка обработчиков — обновления обработают воркеры
+            run_dispatcher(app.bot.token, allowed_updates, UPDATE_MODE, BOT_API_BASE_URL or None)
+        elif UPDATE_MODE == "webhook":
+            run_webhook(app, allowed_updates)
+        else:
+            app.run_polling(allowed_updates=allowed_updates)
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
     except Exception as e:
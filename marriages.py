@@ -4,11 +4,21 @@ from typing import Dict, Any, Optional, Tuple, List
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode, ChatType
 from telegram.ext import ContextTypes
-from storage import load_marriage, save_marriage
+from storage import load_marriage, save_marriage, read_marriage, marriage_version
+from user_directory import get_known_user
+from callbacks import instant_callback
 from utils import display_name_from_user, safe_html, mention_html, format_timestamp, profile_link_html
 from config import MARRY_DEEPLINK_PREFIX
 
 MAX_FAMILY_SIZE = 5
+MARRIAGES_PAGE_SIZE = 10  # Браков на одной странице /браки
+
+# Кэш списка браков по чатам: chat_id -> готовые строки браков (уже пронумерованные)
+_marriage_lines_cache: Dict[int, List[str]] = {}
+# Кэш отрисованных страниц: chat_id -> {курсор: (текст, клавиатура)}
+_marriage_pages_cache: Dict[int, Dict[int, Tuple[str, Optional[InlineKeyboardMarkup]]]] = {}
+# Версия marriages.json, по которой построены кэши: браки может поменять и другой шард
+_marriages_cache_version: Optional[int] = None
 
 
 def get_user_marriage(store: Dict[str, Any], chat_id: int, user_id: int) -> Optional[Dict[str, Any]]:
@@ -55,6 +65,7 @@ def remove_user_from_marriage(store: Dict[str, Any], chat_id: int, user_id: int)
         del store["marriages"][marriage_idx]
     
     save_marriage(store)
+    invalidate_marriages_cache(chat_id)
     return True
 
 
@@ -86,6 +97,101 @@ def get_marriage_members_text(marriage: Dict[str, Any]) -> str:
     return "Неизвестный брак"
 
 
+def format_marriage_line(index: int, marriage: Dict[str, Any]) -> str:
+    """Строка брака для списка /браки"""
+    members_text = get_marriage_members_text(marriage)
+    members_count = len(marriage.get("members", []))
+
+    status_emoji = "🔓" if marriage.get("expanded", False) else "🔒"
+    family_info = f"({members_count} чел.)" if members_count > 2 else ""
+
+    return (
+        f"{index}. {members_text} {status_emoji} {family_info}\n"
+        f"   <i>В браке с {format_timestamp(marriage['since'])}</i>"
+    )
+
+
+def invalidate_marriages_cache(chat_id: int) -> None:
+    """Сбросить кэш списка браков чата (вызывать при любом изменении браков в чате)"""
+    _marriage_lines_cache.pop(chat_id, None)
+    _marriage_pages_cache.pop(chat_id, None)
+
+
+def _drop_stale_marriages_cache() -> None:
+    # Свои изменения сбрасывает invalidate_marriages_cache, чужие видно по версии файла
+    global _marriages_cache_version
+    version = marriage_version()
+    if version != _marriages_cache_version:
+        _marriage_lines_cache.clear()
+        _marriage_pages_cache.clear()
+        _marriages_cache_version = version
+
+
+def get_chat_marriage_lines(chat_id: int) -> List[str]:
+    """Пронумерованные строки браков чата. Файл читается только при пустом кэше"""
+    _drop_stale_marriages_cache()
+    lines = _marriage_lines_cache.get(chat_id)
+    if lines is None:
+        data = load_marriage()
+        marriages = [m for m in data.get("marriages", []) if m["chat_id"] == chat_id]
+        lines = [format_marriage_line(i, m) for i, m in enumerate(marriages, 1)]
+        _marriage_lines_cache[chat_id] = lines
+    return lines
+
+
+def get_marriages_page(chat_id: int, cursor: int = 0, limit: int = MARRIAGES_PAGE_SIZE) -> Tuple[List[str], Optional[int], Optional[int], int]:
+    """Страница браков чата по курсору.
+
+    Возвращает (строки страницы, курсор предыдущей, курсор следующей, всего браков).
+    Курсор — смещение первого брака страницы; отсутствующий сосед обозначается None.
+    """
+    lines = get_chat_marriage_lines(chat_id)
+    total = len(lines)
+    if total == 0:
+        return [], None, None, 0
+
+    # Курсор из старой кнопки мог устареть после разводов — прижимаем к последней странице
+    cursor = max(0, min(cursor, (total - 1) // limit * limit))
+    page = lines[cursor:cursor + limit]
+    prev_cursor = cursor - limit if cursor > 0 else None
+    next_cursor = cursor + limit if cursor + limit < total else None
+    return page, prev_cursor, next_cursor, total
+
+
+def render_marriages_page(chat_id: int, cursor: int = 0) -> Optional[Tuple[str, Optional[InlineKeyboardMarkup]]]:
+    """Текст и клавиатура страницы /браки (None, если пар нет). Результат кэшируется"""
+    _drop_stale_marriages_cache()
+    chat_pages = _marriage_pages_cache.setdefault(chat_id, {})
+    cached = chat_pages.get(cursor)
+    if cached is not None:
+        return cached
+
+    page, prev_cursor, next_cursor, total = get_marriages_page(chat_id, cursor, MARRIAGES_PAGE_SIZE)
+    if not page:
+        return None
+
+    text = f"💍 <b>Счастливые пары этого чата:</b>\n\n" + "\n\n".join(page)
+    if prev_cursor is not None or next_cursor is not None:
+        pages_count = (total + MARRIAGES_PAGE_SIZE - 1) // MARRIAGES_PAGE_SIZE
+        page_start = prev_cursor + MARRIAGES_PAGE_SIZE if prev_cursor is not None else 0
+        current_page = page_start // MARRIAGES_PAGE_SIZE + 1
+        text += f"\n\n📄 Страница {current_page}/{pages_count} (всего пар: {total})"
+    text += (
+        "\n\n<i>🔓 - семья открыта для новых участников\n"
+        "🔒 - семья закрыта</i>"
+    )
+
+    buttons = []
+    if prev_cursor is not None:
+        buttons.append(InlineKeyboardButton("◀️ Назад", callback_data=f"marriages_page:{prev_cursor}"))
+    if next_cursor is not None:
+        buttons.append(InlineKeyboardButton("Вперёд ▶️", callback_data=f"marriages_page:{next_cursor}"))
+    keyboard = InlineKeyboardMarkup([buttons]) if buttons else None
+
+    chat_pages[cursor] = (text, keyboard)
+    return text, keyboard
+
+
 def find_target_user_marriage(store: Dict[str, Any], chat_id: int, target_user, target_username: Optional[str]) -> Optional[Dict[str, Any]]:
     """Найти брак целевого пользователя (по ID или username)"""
     if target_user:
@@ -133,6 +239,10 @@ async def cmd_marry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                     mention_text = text[ent.offset: ent.offset + ent.length]
                     target_username = mention_text.lstrip("@")
 
+    if not target_user and target_username:
+        # Если пользователь уже встречался боту, знаем его ID и можем написать в ЛС
+        target_user = get_known_user(target_username)
+
     if not target_user and not target_username:
         await message.reply_text(
             "💕 <b>Кого звать в брак?</b>\n\n"
@@ -338,6 +448,37 @@ async def cmd_marry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
 
 
+async def reject_proposal_click(cq, text: str) -> None:
+    """Предложение больше не принять никому — пишем причину в само сообщение вместо кнопок"""
+    try:
+        await cq.edit_message_text(text, parse_mode=ParseMode.HTML)
+    except Exception:
+        pass
+
+
+def proposal_click_alert(store: Dict[str, Any], prop: Dict[str, Any], user_id: int) -> Optional[str]:
+    """Почему этот пользователь не может ответить на предложение (другим оно остаётся доступно)"""
+    if prop.get("proposer_id") == user_id:
+        return "🚫 Нельзя принять предложение от самого себя!"
+    if prop.get("target_id") and prop["target_id"] != user_id:
+        return "❌ Это предложение не для вас."
+    if is_user_married_in_chat(store, prop["chat_id"], user_id) and prop.get("type") != "join_family":
+        return "💍 Вы уже состоите в браке в этом чате!"
+    return None
+
+
+def precheck_marry_click(update: Update) -> Optional[str]:
+    """Отказы конкретному пользователю — всплывающим окном по кэшу браков, сообщение не трогаем"""
+    query = update.callback_query
+    pid = query.data.split(":", 1)[1] if ":" in query.data else ""
+    store = read_marriage()
+    prop = store["proposals"].get(pid)
+    if not prop or prop.get("status") != "pending":
+        return None  # это видят все — обработчик напишет в сообщение
+    return proposal_click_alert(store, prop, query.from_user.id)
+
+
+@instant_callback(precheck_marry_click)
 async def cb_marry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     cq = update.callback_query
     if not cq or not update.effective_user:
@@ -346,27 +487,18 @@ async def cb_marry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
     data = cq.data or ""
     if not (data.startswith("accept:") or data.startswith("decline:")):
-        await cq.answer()
         return
 
     action, pid = data.split(":", 1)
     store = load_marriage()
     prop = store["proposals"].get(pid)
     if not prop or prop.get("status") != "pending":
-        await cq.answer("❌ Ссылка недействительна или предложение уже обработано.", show_alert=True)
+        await reject_proposal_click(cq, "❌ Ссылка недействительна или предложение уже обработано.")
         return
 
-    if prop.get("proposer_id") == user.id:
-        await cq.answer("🚫 Нельзя принять предложение от самого себя!", show_alert=True)
-        return
-
-    if prop.get("target_id") and prop["target_id"] != user.id:
-        await cq.answer("❌ Это предложение не для вас.", show_alert=True)
-        return
-
-    # Дополнительная проверка на момент принятия
-    if is_user_married_in_chat(store, prop["chat_id"], user.id) and prop.get("type") != "join_family":
-        await cq.answer("💍 Вы уже состоите в браке в этом чате!", show_alert=True)
+    # Дополнительная проверка на момент принятия (precheck смотрел кэш до подтверждения нажатия).
+    # Отказ касается только нажавшего, поэтому сообщение с кнопками не меняем
+    if proposal_click_alert(store, prop, user.id):
         return
 
     if action == "accept":
@@ -411,7 +543,7 @@ async def cb_marry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             # Приглашение в существующую семью
             proposer_marriage = get_user_marriage(store, prop["chat_id"], prop["proposer_id"])
             if not proposer_marriage or not can_join_marriage(proposer_marriage):
-                await cq.answer("❌ Семья больше не принимает новых участников.", show_alert=True)
+                await reject_proposal_click(cq, "❌ Семья больше не принимает новых участников.")
                 return
                 
             # Добавляем пользователя в семью
@@ -450,7 +582,7 @@ async def cb_marry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                     
                     target_marriage = store["marriages"][target_marriage_idx]
                     if not can_join_marriage(target_marriage):
-                        await cq.answer("❌ Семья больше не принимает новых участников.", show_alert=True)
+                        await reject_proposal_click(cq, "❌ Семья больше не принимает новых участников.")
                         return
                     
                     # Добавляем предлагающего в правильный брак
@@ -462,13 +594,13 @@ async def cb_marry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                     
                     family_size = len(store["marriages"][target_marriage_idx]["members"])
                 else:
-                    await cq.answer("❌ Целевая семья больше не существует или изменилась.", show_alert=True)
+                    await reject_proposal_click(cq, "❌ Целевая семья больше не существует или изменилась.")
                     return
             else:
                 # Fallback к старой логике (если предложение создано до обновления)
                 user_marriage = get_user_marriage(store, prop["chat_id"], user.id)
                 if not user_marriage or not can_join_marriage(user_marriage):
-                    await cq.answer("❌ Ваша семья больше не принимает новых участников.", show_alert=True)
+                    await reject_proposal_click(cq, "❌ Ваша семья больше не принимает новых участников.")
                     return
                     
                 # Добавляем предлагающего в семью пользователя
@@ -498,6 +630,7 @@ async def cb_marry(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
         prop["status"] = "accepted"
         save_marriage(store)
+        invalidate_marriages_cache(prop["chat_id"])
 
         await cq.edit_message_text(success_text, parse_mode=ParseMode.HTML)
 
@@ -530,9 +663,8 @@ async def cmd_marriages(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         await message.reply_text("💒 Команда /браки работает только в группах!")
         return
 
-    data = load_marriage()
-    marriages = [m for m in data["marriages"] if m["chat_id"] == chat.id]
-    if not marriages:
+    rendered = render_marriages_page(chat.id)
+    if rendered is None:
         await message.reply_text(
             "💔 <b>В этом чате пока нет пар</b>\n\n"
             "💡 Используйте /брак чтобы предложить кому-то руку и сердце!",
@@ -540,31 +672,47 @@ async def cmd_marriages(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         )
         return
 
-    lines = []
-    for i, marriage in enumerate(marriages, 1):
-        members_text = get_marriage_members_text(marriage)
-        members_count = len(marriage.get("members", []))
-        
-        status_emoji = "🔓" if marriage.get("expanded", False) else "🔒"
-        family_info = f"({members_count} чел.)" if members_count > 2 else ""
-        
-        lines.append(
-            f"{i}. {members_text} {status_emoji} {family_info}\n"
-            f"   <i>В браке с {format_timestamp(marriage['since'])}</i>"
-        )
-
-    footer = (
-        "\n\n<i>🔓 - семья открыта для новых участников\n"
-        "🔒 - семья закрыта</i>"
-    )
-
+    text, keyboard = rendered
     await message.reply_text(
-        f"💍 <b>Счастливые пары этого чата:</b>\n\n" + "\n\n".join(lines) + footer,
+        text,
+        reply_markup=keyboard,
         parse_mode=ParseMode.HTML,
         disable_web_page_preview=True
     )
 
 
+async def cb_marriages_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Перелистывание страниц /браки"""
+    query = update.callback_query
+    if not query or not query.data or not query.message:
+        return
+
+    try:
+        cursor = int(query.data.split(":", 1)[1])
+    except (ValueError, IndexError):
+        await query.answer("❌ Ошибка обработки команды.", show_alert=True)
+        return
+
+    await query.answer()
+
+    rendered = render_marriages_page(query.message.chat.id, max(0, cursor))
+    if rendered is None:
+        text, keyboard = "💔 <b>В этом чате пока нет пар</b>", None
+    else:
+        text, keyboard = rendered
+
+    try:
+        await query.edit_message_text(
+            text,
+            reply_markup=keyboard,
+            parse_mode=ParseMode.HTML,
+            disable_web_page_preview=True
+        )
+    except Exception:
+        # Страница не изменилась или сообщение слишком старое
+        pass
+
+
 async def cmd_divorce(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     message = update.message
     if not message or not update.effective_chat:
@@ -667,6 +815,7 @@ async def cmd_expand(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     if marriage_idx is not None:
         store["marriages"][marriage_idx]["expanded"] = True
         save_marriage(store)
+        invalidate_marriages_cache(chat.id)
         
         members_count = len(marriage.get("members", []))
         await message.reply_text(
@@ -720,6 +869,7 @@ async def cmd_close_marriage(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if marriage_idx is not None:
         store["marriages"][marriage_idx]["expanded"] = False
         save_marriage(store)
+        invalidate_marriages_cache(chat.id)
         
         members_count = len(marriage.get("members", []))
         await message.reply_text(
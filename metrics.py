@@ -0,0 +1,284 @@
+"""Метрики обработчиков: время, лаг цикла событий, чтения/записи JSON и запросы к Telegram API."""
+import asyncio
+import bisect
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from telegram import Update
+from telegram.constants import ParseMode
+from telegram.ext import Application, ContextTypes
+from telegram.request import HTTPXRequest
+
+from logging_setup import bind_update, reset_update
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+
+def _labels(pairs: List[str], le: Optional[object] = None) -> str:
+    if le is not None:
+        pairs = pairs + [f'le="{le}"']
+    return "{" + ",".join(pairs) + "}"
+
+
+class Histogram:
+    """Гистограмма в духе Prometheus с метками"""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label_names = label_names
+        # метки -> [счётчики по корзинам..., сумма, количество]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def series(self) -> Dict[Tuple[str, ...], List[float]]:
+        return self._series
+
+    def quantile(self, q: float, *labels: str) -> float:
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        series = self._series.get(labels)
+        if not series or not series[-1]:
+            return 0.0
+        target = q * series[-1]
+        seen = 0
+        for bound, count in zip(self.buckets, series):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in self._series.items():
+            pairs = [f'{name}="{value}"' for name, value in zip(self.label_names, labels)]
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(pairs, bound)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(pairs, '+Inf')} {int(series[-1])}")
+            suffix = _labels(pairs) if pairs else ""
+            lines.append(f"{self.name}_sum{suffix} {series[-2]}")
+            lines.append(f"{self.name}_count{suffix} {int(series[-1])}")
+        return lines
+
+
+handler_duration = Histogram("bot_handler_duration_seconds", "Handler wall time", DURATION_BUCKETS, ("handler",))
+handler_json_loads = Histogram("bot_handler_json_loads", "JSON file loads per handler call", COUNT_BUCKETS, ("handler",))
+handler_json_saves = Histogram("bot_handler_json_saves", "JSON file saves per handler call", COUNT_BUCKETS, ("handler",))
+handler_api_calls = Histogram("bot_handler_api_calls", "Telegram API calls per handler call", COUNT_BUCKETS, ("handler",))
+api_duration = Histogram("bot_api_request_duration_seconds", "Telegram API request time", DURATION_BUCKETS, ("method",))
+loop_lag = Histogram("bot_event_loop_lag_seconds", "Event loop scheduling lag", DURATION_BUCKETS)
+
+HISTOGRAMS = (handler_duration, handler_json_loads, handler_json_saves, handler_api_calls, api_duration, loop_lag)
+
+# Счётчики файлового ввода-вывода за всё время: (операция, файл) -> количество
+json_io_totals: Dict[Tuple[str, str], int] = {}
+
+
+@dataclass
+class HandlerCounters:
+    json_loads: int = 0
+    json_saves: int = 0
+    api_calls: int = 0
+
+
+# Счётчики обработчика, который сейчас выполняется (задачи наследуют контекст)
+_current: ContextVar[Optional[HandlerCounters]] = ContextVar("handler_counters", default=None)
+
+# Подписчики на каждый замер: (обработчик, секунды, счётчики). Нужны бенчмаркам для точных перцентилей
+handler_observers: List[Callable[[str, float, HandlerCounters], None]] = []
+
+
+def _count_json(op: str, file_name: str) -> None:
+    key = (op, file_name)
+    json_io_totals[key] = json_io_totals.get(key, 0) + 1
+    counters = _current.get()
+    if counters is not None:
+        if op == "load":
+            counters.json_loads += 1
+        else:
+            counters.json_saves += 1
+
+
+def count_json_load(file_name: str) -> None:
+    _count_json("load", file_name)
+
+
+def count_json_save(file_name: str) -> None:
+    _count_json("save", file_name)
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, который считает и замеряет запросы к Bot API"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        counters = _current.get()
+        if counters is not None:
+            counters.api_calls += 1
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        finally:
+            api_duration.observe(time.perf_counter() - started, api_method)
+
+
+@contextmanager
+def handler_scope(name: str, update: object = None) -> Iterator[HandlerCounters]:
+    """Замер под именем name: время блока и ввод-вывод, который в нём вызван.
+
+    Работа, вынесенная из обработчика в фоновую задачу или очередь, открывает свой замер —
+    иначе её чтения и запросы попали бы в счётчики уже завершившегося обработчика.
+    """
+    counters = HandlerCounters()
+    token = _current.set(counters)
+    log_token = bind_update(update, name)
+    started = time.perf_counter()
+    try:
+        yield counters
+    finally:
+        elapsed = time.perf_counter() - started
+        handler_duration.observe(elapsed, name)
+        handler_json_loads.observe(counters.json_loads, name)
+        handler_json_saves.observe(counters.json_saves, name)
+        handler_api_calls.observe(counters.api_calls, name)
+        for observer in handler_observers:
+            observer(name, elapsed, counters)
+        _current.reset(token)
+        reset_update(log_token)
+
+
+def instrument_handler(callback, name: str):
+    """Обёртка обработчика: время выполнения и ввод-вывод, который он вызвал"""
+    @functools.wraps(callback)
+    async def wrapper(update: object, context: ContextTypes.DEFAULT_TYPE):
+        with handler_scope(name, update):
+            return await callback(update, context)
+
+    return wrapper
+
+
+def instrument_application(app: Application) -> None:
+    """Обернуть все зарегистрированные обработчики"""
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            name = getattr(handler.callback, "__name__", type(handler).__name__)
+            handler.callback = instrument_handler(handler.callback, name)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    lines.append("# HELP bot_json_io_total JSON file loads and saves")
+    lines.append("# TYPE bot_json_io_total counter")
+    for (op, file_name), count in sorted(json_io_totals.items()):
+        lines.append(f'bot_json_io_total{{op="{op}",file="{file_name}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+async def _serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1] in ("/metrics", "/"):
+            body = render_metrics().encode()
+            status = "200 OK"
+        else:
+            body = b"not found\n"
+            status = "404 Not Found"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug("Metrics request failed: %s", e)
+    finally:
+        writer.close()
+
+
+_background: List[object] = []
+
+
+async def start_metrics(port: int) -> None:
+    """Запустить HTTP-эндпоинт метрик на 127.0.0.1:port (0 — без эндпоинта). Лаг цикла меряет loop_watchdog"""
+    if port:
+        server = await asyncio.start_server(_serve_metrics, "127.0.0.1", port)
+        _background.append(server)
+        logger.info("Metrics endpoint on http://127.0.0.1:%d/metrics", port)
+
+
+async def stop_metrics() -> None:
+    while _background:
+        _background.pop().close()
+
+
+def _format_handlers_summary(limit: int = 10) -> List[str]:
+    rows = []
+    for (name,), series in handler_duration.series().items():
+        count = int(series[-1])
+        loads = handler_json_loads.series().get((name,), [0, 0])[-2]
+        saves = handler_json_saves.series().get((name,), [0, 0])[-2]
+        api = handler_api_calls.series().get((name,), [0, 0])[-2]
+        rows.append((series[-2] / count, name, count, handler_duration.quantile(0.95, name),
+                     loads / count, saves / count, api / count))
+    rows.sort(reverse=True)
+    lines = []
+    for mean, name, count, p95, loads, saves, api in rows[:limit]:
+        lines.append(
+            f"• <code>{name}</code>: {count}×, ср. {mean * 1000:.0f} мс, p95 ≤ {p95 * 1000:.0f} мс, "
+            f"JSON {loads:.1f}/{saves:.1f}, API {api:.1f}"
+        )
+    return lines
+
+
+async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Админ команда /stats - сводка по медленным обработчикам"""
+    from admin import ensure_admin
+    from callbacks import callback_stats
+    from loop_watchdog import top_blockers
+
+    if not update.message or not await ensure_admin(update):
+        return
+
+    lines = ["📊 <b>Самые медленные обработчики</b> (чтения/записи JSON и запросы API на вызов):"]
+    lines.extend(_format_handlers_summary() or ["нет данных"])
+
+    if callback_stats:
+        lines.append("\n🔘 <b>Кнопки</b> (получение → ответ / → готово, p95):")
+        for name, stats in sorted(callback_stats.items()):
+            summary = stats.summary()
+            lines.append(
+                f"• <code>{name}</code>: {summary['count']}×, ответ {summary['ack_p95'] * 1000:.0f} мс, "
+                f"готово {summary['done_p95'] * 1000:.0f} мс, отброшено {summary['dropped']}"
+            )
+
+    blockers = top_blockers(5)
+    if blockers:
+        lines.append("\n🧱 <b>Блокировки цикла событий</b> (всего / максимум):")
+        for handler, site, count, total, worst in blockers:
+            lines.append(
+                f"• <code>{handler}</code> — <code>{site}</code>: {count}×, "
+                f"{total * 1000:.0f} / {worst * 1000:.0f} мс"
+            )
+
+    lines.append(f"\n⏱ Лаг цикла событий p95 ≤ {loop_lag.quantile(0.95) * 1000:.0f} мс")
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML)
@@ -0,0 +1,48 @@
+"""Отложенное удаление временных сообщений (предупреждения о кулдауне и т.п.)."""
+import heapq
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверять очередь (в секундах)
+REAPER_TICK = 1.0
+# Сколько живут временные сообщения по умолчанию
+EPHEMERAL_TTL = 3.0
+# Ограничение Bot API на deleteMessages
+DELETE_BATCH_SIZE = 100
+
+# Куча (delete_at, chat_id, message_id), delete_at — по time.monotonic()
+_queue: List[Tuple[float, int, int]] = []
+
+
+def schedule_delete(chat_id: int, *message_ids: int, delay: float = EPHEMERAL_TTL) -> None:
+    """Удалить сообщения чата через delay секунд"""
+    delete_at = time.monotonic() + delay
+    for message_id in message_ids:
+        heapq.heappush(_queue, (delete_at, chat_id, message_id))
+
+
+def pop_due(now: float) -> Dict[int, List[int]]:
+    """Забрать из очереди все просроченные сообщения, сгруппированные по чатам"""
+    due: Dict[int, List[int]] = defaultdict(list)
+    while _queue and _queue[0][0] <= now:
+        _, chat_id, message_id = heapq.heappop(_queue)
+        due[chat_id].append(message_id)
+    return due
+
+
+async def reap_messages_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Периодическая задача: удаляет сообщения, срок которых вышел, пачками по чатам"""
+    if not _queue or _queue[0][0] > time.monotonic():
+        return
+    for chat_id, message_ids in pop_due(time.monotonic()).items():
+        for start in range(0, len(message_ids), DELETE_BATCH_SIZE):
+            batch = message_ids[start:start + DELETE_BATCH_SIZE]
+            try:
+                await context.bot.delete_messages(chat_id, batch)
+            except Exception as e:
+                logger.warning("Failed to delete %d messages in chat %s: %s", len(batch), chat_id, e)
@@ -0,0 +1,186 @@
+"""Запись входящих обновлений в обезличенный JSONL для бенчмарков (benchmarks/replay.py).
+
+Включается переменной RECORD_UPDATES_DIR. Обработчик только кладёт Update в очередь,
+сериализация, обезличивание и сжатие выполняются в отдельном потоке.
+"""
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import queue
+import re
+import secrets
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional, Set
+from telegram import Update
+from telegram.ext import ContextTypes
+
+logger = logging.getLogger(__name__)
+
+# Сколько обновлений ждёт записи; если поток не успевает, лишние отбрасываются
+QUEUE_SIZE = 10000
+# Новый файл — после стольких обновлений или секунд
+ROTATE_UPDATES = 50000
+ROTATE_SECONDS = 3600
+# Числа в callback_data и аргументах команд от этого порога (или совпадающие с id из того же обновления) — id
+ID_THRESHOLD = 100000
+
+# Ключи с личными данными, которые не записываются вовсе
+DROP_KEYS = {"contact", "location", "venue", "phone_number", "bio"}
+NAME_KEYS = {"first_name", "last_name", "title"}
+CHAT_TYPES = {"private", "group", "supergroup", "channel"}
+MENTION_RE = re.compile(r"@(\w+)")
+NUMBER_RE = re.compile(r"(?<![\w@-])-?\d+(?!\w)")
+
+_queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=QUEUE_SIZE)
+_thread: Optional[threading.Thread] = None
+_salt = b""
+dropped = 0
+
+
+def _digest(value: str) -> int:
+    return int.from_bytes(hmac.new(_salt, value.encode(), hashlib.sha256).digest()[:8], "big")
+
+
+def anonymize_id(value: int) -> int:
+    """Один и тот же id всегда превращается в один и тот же (при одной соли), знак сохраняется"""
+    mapped = 10 ** 9 + _digest(str(abs(value))) % 10 ** 12
+    return -mapped if value < 0 else mapped
+
+
+def anonymize_username(username: str) -> str:
+    return f"u{_digest(username.lower()):x}"[:12]
+
+
+def _anonymize_number(part: str, seen_ids: Set[int]) -> str:
+    # Похожее на id — тем же отображением, что и id в from/chat; суммы и прочие малые числа остаются
+    value = int(part)
+    if abs(value) >= ID_THRESHOLD or value in seen_ids:
+        return str(anonymize_id(value))
+    return part
+
+
+def _anonymize_callback_data(data: str, seen_ids: Set[int]) -> str:
+    parts = data.split(":")
+    for i, part in enumerate(parts):
+        if part.lstrip("-").isdigit():
+            parts[i] = _anonymize_number(part, seen_ids)
+    return ":".join(parts)
+
+
+def _anonymize_text(payload: dict, seen_ids: Set[int]) -> None:
+    text = payload.get("text")
+    if isinstance(text, str):
+        if text.startswith("/"):
+            # Команды оставляем (по ним и строится нагрузка), упоминания и id в аргументах
+            # (/give_coins 123456789 100) — обезличиваем
+            text = MENTION_RE.sub(lambda m: "@" + anonymize_username(m.group(1)), text)
+            payload["text"] = NUMBER_RE.sub(lambda m: _anonymize_number(m.group(0), seen_ids), text)
+        else:
+            payload["text"] = "x" * len(text)
+            payload.pop("entities", None)
+    if isinstance(payload.get("caption"), str):
+        payload["caption"] = "x" * len(payload["caption"])
+        payload.pop("caption_entities", None)
+
+
+def anonymize(payload: Any) -> Any:
+    """Обезличить Update.to_dict(): id, имена, username, текст обычных сообщений"""
+    return _anonymize(payload, set())
+
+
+def _anonymize(payload: Any, seen_ids: Set[int]) -> Any:
+    if isinstance(payload, list):
+        return [_anonymize(item, seen_ids) for item in payload]
+    if not isinstance(payload, dict):
+        return payload
+    # Вложенные объекты (from, chat, message) обрабатываются раньше callback_data и запоминают id
+    result = {key: _anonymize(value, seen_ids) for key, value in payload.items() if key not in DROP_KEYS}
+    # Пользователь (есть is_bot) или чат (есть type из CHAT_TYPES) — заменяем id и имена
+    if "id" in result and isinstance(result["id"], int) and ("is_bot" in result or result.get("type") in CHAT_TYPES):
+        seen_ids.add(result["id"])
+        result["id"] = anonymize_id(result["id"])
+        for key in NAME_KEYS & result.keys():
+            result[key] = f"{key}-{abs(result['id']) % 100000}"
+    for key in ("user_id", "chat_id"):
+        if isinstance(result.get(key), int):
+            result[key] = anonymize_id(result[key])
+    if isinstance(result.get("username"), str):
+        result["username"] = anonymize_username(result["username"])
+    if isinstance(result.get("chat_instance"), str):
+        result["chat_instance"] = str(_digest(result["chat_instance"]))
+    if isinstance(result.get("data"), str):
+        result["data"] = _anonymize_callback_data(result["data"], seen_ids)
+    _anonymize_text(result, seen_ids)
+    return result
+
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Самая ранняя группа: обновление уходит в очередь записи, без сериализации в цикле событий"""
+    global dropped
+    try:
+        _queue.put_nowait((time.time(), update))
+    except queue.Full:
+        dropped += 1
+
+
+def _open_file(directory: Path):
+    path = directory / f"updates-{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(2)}.jsonl.gz"
+    logger.info("Recording updates to %s", path)
+    return gzip.open(path, "wt", encoding="utf-8")
+
+
+def _writer(directory: Path) -> None:
+    output = None
+    written = 0
+    opened_at = 0.0
+    try:
+        while True:
+            item = _queue.get()
+            if item is None:
+                break
+            if output is None or written >= ROTATE_UPDATES or time.monotonic() - opened_at > ROTATE_SECONDS:
+                if output is not None:
+                    output.close()
+                output, written, opened_at = _open_file(directory), 0, time.monotonic()
+            received_at, update = item
+            try:
+                line = json.dumps({"t": received_at, "update": anonymize(update.to_dict())}, ensure_ascii=False)
+            except Exception as e:
+                logger.warning("Failed to serialize update %s: %s", update.update_id, e)
+                continue
+            output.write(line + "\n")
+            written += 1
+    finally:
+        if output is not None:
+            output.close()
+
+
+def start_recording(directory: str, salt: str = "") -> None:
+    """Запустить поток записи в папку directory"""
+    global _thread, _salt
+    if _thread is not None:
+        return
+    if not salt:
+        logger.warning("RECORD_SALT is not set: anonymized ids will differ between runs")
+        salt = secrets.token_hex(16)
+    _salt = salt.encode()
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    _thread = threading.Thread(target=_writer, args=(path,), name="update-recorder", daemon=True)
+    _thread.start()
+
+
+def stop_recording() -> None:
+    """Дописать очередь и закрыть файл"""
+    global _thread
+    if _thread is None:
+        return
+    _queue.put(None)
+    _thread.join(timeout=10)
+    _thread = None
+    if dropped:
+        logger.warning("Update recorder dropped %d updates (queue was full)", dropped)
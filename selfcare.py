@@ -7,6 +7,7 @@ from telegram.constants import ParseMode, ChatType
 from telegram.ext import ContextTypes
 
 from storage import load_cooldowns, save_cooldowns
+from reaper import schedule_delete
 from marriages import is_user_married_in_chat
 from utils import safe_html
 
@@ -168,12 +169,6 @@ async def cmd_selfcare(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     # Проверяем кулдаун
     remaining_time = check_selfcare_cooldown(user.id, chat_id)
     if remaining_time is not None:
-        # Удаляем сообщение пользователя
-        try:
-            await message.delete()
-        except Exception as e:
-            logger.warning("Failed to delete user message: %s", e)
-        
         # Отправляем предупреждение
         warning_msg = await context.bot.send_message(
             chat_id,
@@ -183,14 +178,8 @@ async def cmd_selfcare(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             parse_mode=ParseMode.HTML
         )
         
-        # Удаляем предупреждение через 3 секунды
-        async def delete_warning(context):
-            try:
-                await context.bot.delete_message(chat_id, warning_msg.message_id)
-            except Exception as e:
-                logger.warning("Failed to delete warning message: %s", e)
-        
-        context.job_queue.run_once(delete_warning, 3)
+        # Команду и предупреждение удаляем вместе через 3 секунды
+        schedule_delete(chat_id, message.message_id, warning_msg.message_id)
         return
     
     # Устанавливаем кулдаун
@@ -0,0 +1,261 @@
+"""Шардирование по чатам: диспетчер принимает обновления и раздаёт их воркерам-процессам.
+
+При SHARD_COUNT > 1 процесс бота становится диспетчером: получает обновления (polling или
+вебхук), по chat_id выбирает шард и пересылает обновление строкой JSON в unix-сокет воркера.
+Воркеры — те же main.py с SHARD_INDEX в окружении: обновления берут из сокета вместо Telegram,
+рассылки планируют только для своих чатов. Все обновления одного чата попадают в один воркер
+и в том же порядке, так что игры и прочее состояние чата в памяти остаются корректными.
+Общие файлы (экономика, статистика, справочники) процессы пишут под file_lock, см. storage.py.
+
+Обновления, отправленные воркеру в момент его падения, теряются — как и при падении
+одиночного бота. Воркер, завершившийся сам, диспетчер перезапускает.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional
+
+from telegram import Update
+from telegram.ext import Application, ApplicationBuilder, ContextTypes, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+MAIN_SCRIPT = Path(__file__).resolve().parent / "main.py"
+# Пауза перед повторным подключением к сокету воркера и перезапуском упавшего воркера (в секундах)
+RECONNECT_DELAY = 0.5
+RESTART_DELAY = 2.0
+# Сколько ждать при остановке: досылки очередей и завершения воркеров по SIGTERM
+DRAIN_TIMEOUT = 5.0
+WORKER_STOP_TIMEOUT = 15.0
+
+# Сколько обновлений отправлено каждому шарду
+forwarded: Counter = Counter()
+
+_links: List["ShardLink"] = []
+_workers: List[subprocess.Popen] = []
+_supervisor: Optional[asyncio.Task] = None
+_socket_dir: Optional[str] = None
+_own_socket_dir = False
+_parent_watch: Optional[asyncio.Task] = None
+
+
+def shard_for(chat_id: int, count: int) -> int:
+    # crc32, а не hash(): номер шарда не должен зависеть от PYTHONHASHSEED процесса
+    return zlib.crc32(str(chat_id).encode()) % count
+
+
+def shard_key(update: Update) -> int:
+    """По чему шардируется обновление: чат, без чата — пользователь (inline-кнопки, опросы)"""
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return 0
+
+
+def owns_chat(chat_id: int) -> bool:
+    """Обслуживает ли этот процесс чат (без шардирования — любой; диспетчер — никакой)"""
+    from config import SHARD_COUNT, SHARD_INDEX
+
+    if SHARD_COUNT <= 1 and SHARD_INDEX < 0:
+        return True
+    return SHARD_INDEX >= 0 and shard_for(chat_id, SHARD_COUNT) == SHARD_INDEX
+
+
+def socket_path(socket_dir: str, index: int) -> str:
+    return os.path.join(socket_dir, f"shard-{index}.sock")
+
+
+class ShardLink:
+    """Канал диспетчера к одному воркеру: очередь строк и задача, которая пишет их в сокет.
+
+    Пока воркер запускается или перезапускается, строки копятся в очереди.
+    """
+
+    def __init__(self, index: int, path: str):
+        self.index = index
+        self.path = path
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name=f"shard_link_{self.index}")
+
+    def send(self, line: bytes) -> None:
+        self.queue.put_nowait(line)
+
+    async def _run(self) -> None:
+        connected_once = False
+        while True:
+            try:
+                _, writer = await asyncio.open_unix_connection(self.path)
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            if connected_once:
+                logger.info("Reconnected to shard %d", self.index)
+            connected_once = True
+            try:
+                while True:
+                    line = await self.queue.get()
+                    writer.write(line)
+                    await writer.drain()
+                    self.queue.task_done()
+            except ConnectionError as e:
+                # Строка, на которой оборвалось соединение, потеряна вместе с упавшим воркером
+                self.queue.task_done()
+                logger.warning("Lost connection to shard %d: %s", self.index, e)
+            finally:
+                writer.close()
+
+    async def close(self) -> None:
+        """Дослать очередь (не дольше DRAIN_TIMEOUT) и остановить задачу"""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Shard %d: %d updates were not delivered", self.index, self.queue.qsize())
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+async def forward_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    index = shard_for(shard_key(update), len(_links))
+    _links[index].send(json.dumps(update.to_dict(), ensure_ascii=False).encode() + b"\n")
+    forwarded[index] += 1
+
+
+def _spawn_worker(index: int) -> subprocess.Popen:
+    from config import SHARD_COUNT
+
+    env = dict(os.environ, SHARD_INDEX=str(index), SHARD_COUNT=str(SHARD_COUNT), SHARD_SOCKET_DIR=_socket_dir)
+    # Своя сессия: Ctrl+C в терминале получает только диспетчер и сам останавливает воркеры по порядку
+    process = subprocess.Popen([sys.executable, str(MAIN_SCRIPT)], env=env, start_new_session=True)
+    logger.info("Started shard %d worker (pid %d)", index, process.pid)
+    return process
+
+
+async def _supervise() -> None:
+    while True:
+        await asyncio.sleep(RESTART_DELAY)
+        for index, process in enumerate(_workers):
+            if process.poll() is not None:
+                logger.error("Shard %d worker exited with code %s, restarting", index, process.returncode)
+                _workers[index] = _spawn_worker(index)
+
+
+async def _start_shards(app: Application) -> None:
+    global _supervisor, _socket_dir, _own_socket_dir
+    from config import SHARD_COUNT, SHARD_SOCKET_DIR, METRICS_PORT
+    from metrics import start_metrics
+
+    await start_metrics(METRICS_PORT)
+    _own_socket_dir = not SHARD_SOCKET_DIR
+    _socket_dir = SHARD_SOCKET_DIR or tempfile.mkdtemp(prefix="bot-shards-")
+    os.makedirs(_socket_dir, exist_ok=True)
+    for index in range(SHARD_COUNT):
+        link = ShardLink(index, socket_path(_socket_dir, index))
+        link.start()
+        _links.append(link)
+        _workers.append(_spawn_worker(index))
+    _supervisor = asyncio.create_task(_supervise(), name="shard_supervisor")
+
+
+async def _stop_shards(app: Application) -> None:
+    from metrics import stop_metrics
+
+    if _supervisor:
+        _supervisor.cancel()
+    # Сначала досылаем принятое, потом просим воркеры доработать и выйти
+    await asyncio.gather(*(link.close() for link in _links))
+    for process in _workers:
+        if process.poll() is None:
+            process.terminate()
+    for index, process in enumerate(_workers):
+        try:
+            await asyncio.to_thread(process.wait, WORKER_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logger.warning("Shard %d worker did not stop in time, killing", index)
+            process.kill()
+    if _own_socket_dir and _socket_dir:
+        shutil.rmtree(_socket_dir, ignore_errors=True)
+    await stop_metrics()
+    logger.info("Shards stopped, forwarded: %s", dict(forwarded))
+
+
+def build_dispatcher(token: str, base_url: Optional[str] = None) -> Application:
+    """Приложение диспетчера: один обработчик, который пересылает все обновления шардам"""
+    builder = ApplicationBuilder().token(token).post_init(_start_shards).post_shutdown(_stop_shards)
+    if base_url:
+        builder = builder.base_url(base_url)
+    app = builder.build()
+    app.add_handler(TypeHandler(Update, forward_update))
+    return app
+
+
+def run_dispatcher(token: str, allowed_updates: List[str], update_mode: str,
+                   base_url: Optional[str] = None) -> None:
+    """Запустить воркеры и раздавать им обновления до SIGINT/SIGTERM"""
+    from webhook import run_webhook
+
+    app = build_dispatcher(token, base_url)
+    if update_mode == "webhook":
+        run_webhook(app, allowed_updates)
+    else:
+        app.run_polling(allowed_updates=allowed_updates)
+
+
+async def _receive(app: Application, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while line := await reader.readline():
+            try:
+                update = Update.de_json(json.loads(line), app.bot)
+            except Exception as e:
+                logger.error("Bad update from dispatcher: %s", e)
+                continue
+            app.update_queue.put_nowait(update)
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _watch_parent(parent_pid: int) -> None:
+    # Диспетчер убит без SIGTERM воркерам — выходим сами, иначе воркер останется сиротой
+    while os.getppid() == parent_pid:
+        await asyncio.sleep(1)
+    logger.warning("Dispatcher is gone, stopping shard worker")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+async def start_worker_server(app: Application) -> asyncio.AbstractServer:
+    """Сокет, в который диспетчер пишет обновления этого шарда"""
+    global _parent_watch
+    from config import SHARD_INDEX, SHARD_SOCKET_DIR
+
+    path = socket_path(SHARD_SOCKET_DIR, SHARD_INDEX)
+    if os.path.exists(path):
+        os.unlink(path)  # остался от упавшего воркера
+    server = await asyncio.start_unix_server(lambda reader, writer: _receive(app, reader, writer), path)
+    _parent_watch = asyncio.create_task(_watch_parent(os.getppid()), name="watch_dispatcher")
+    logger.info("Shard %d worker listening on %s", SHARD_INDEX, path)
+    return server
+
+
+def run_worker(app: Application) -> None:
+    """Воркер шарда: обрабатывать обновления от диспетчера до SIGINT/SIGTERM"""
+    from webhook import serve_application
+
+    asyncio.run(serve_application(app, start_worker_server))
@@ -1,65 +1,261 @@
 import json
 import logging
-from typing import Dict, Any
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
 from pathlib import Path
 from config import STORE_FILE, MARRIAGE_FILE, ADMINS_FILE, COOLDOWNS_FILE
+from metrics import count_json_load, count_json_save
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только между потоками одного процесса
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
+_MISSING = object()
+
+
+class _FileLock:
+    """Блокировка файла данных между процессами (flock на соседнем .lock) и потоками.
+
+    Повторный вход из того же потока разрешён: транзакция может вызвать save.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path.with_name(path.name + ".lock")
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def __enter__(self) -> "_FileLock":
+        self._thread_lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+
+_file_locks: Dict[Path, _FileLock] = {}
+
+
+def file_lock(path: Path) -> _FileLock:
+    """Эксклюзивная блокировка файла данных (with file_lock(path): ...)"""
+    lock = _file_locks.get(path)
+    if lock is None:
+        lock = _file_locks.setdefault(path, _FileLock(path))
+    return lock
+
+
+def _signature(path: Path) -> Optional[Tuple[int, int, int]]:
+    # os.replace даёт новый inode, так что чужую запись видно даже при той же mtime
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def write_text_atomic(path: Path, text: str) -> None:
+    """Записать файл целиком: читатели видят либо старую, либо новую версию, но не половину"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def merge3(base: Any, ours: Any, theirs: Any) -> Any:
+    """Трёхстороннее слияние JSON: наши изменения относительно base поверх чужих.
+
+    Словари сливаются по ключам рекурсивно, в остальном при конфликте побеждает наше значение.
+    """
+    if ours == base:
+        return theirs
+    if theirs == base:
+        return ours
+    if isinstance(ours, dict) and isinstance(theirs, dict):
+        if not isinstance(base, dict):
+            base = {}
+        merged = {}
+        for key in list(theirs) + [key for key in ours if key not in theirs]:
+            value = merge3(base.get(key, _MISSING), ours.get(key, _MISSING), theirs.get(key, _MISSING))
+            if value is not _MISSING:
+                merged[key] = value
+        return merged
+    return ours
+
+
+class LoadedJson(dict):
+    """Результат SharedJsonFile.load(): словарь, который помнит текст файла, из которого прочитан.
+
+    От этого текста save() считает наши изменения — даже если между load() и save()
+    файл успели перечитать другие load()/read() того же процесса.
+    """
+
+    __slots__ = ("base_raw", "base_signature")
+
+
+class SharedJsonFile:
+    """JSON-файл, который могут читать и писать несколько процессов (шарды, см. sharding.py).
+
+    Содержимое кэшируется и перечитывается, только если файл на диске сменился.
+    Запись атомарная и под file_lock; если файл успел переписать другой процесс,
+    save() сливает изменения (merge3), а transaction() держит блокировку
+    на всё чтение-изменение-запись.
+    """
+
+    def __init__(self, path: Path, default_factory: Callable[[], Any],
+                 normalize: Optional[Callable[[Any], Any]] = None, indent: Optional[int] = 2):
+        self.path = path
+        self._default_factory = default_factory
+        self._normalize = normalize
+        self._indent = indent
+        self._raw: Optional[str] = None
+        self._cache: Optional[Any] = None
+        self._signature: Optional[Tuple[int, int, int]] = None
+        # Растёт, когда содержимое перечитано с диска (в т.ч. после записи другим процессом)
+        self.version = 0
+
+    def _parse(self, raw: Optional[str]) -> Any:
+        if raw is None:
+            data = self._default_factory()
+        else:
+            try:
+                count_json_load(self.path.name)
+                data = json.loads(raw) or self._default_factory()
+            except Exception as e:
+                logger.error("Failed to read %s: %s", self.path.name, e)
+                data = self._default_factory()
+        return self._normalize(data) if self._normalize else data
+
+    def _refresh(self) -> None:
+        signature = _signature(self.path)
+        if signature == self._signature:
+            return
+        try:
+            self._raw = self.path.read_text(encoding="utf-8") if signature is not None else None
+        except FileNotFoundError:
+            self._raw, signature = None, None
+        self._cache = None
+        self._signature = signature
+        self.version += 1
+
+    def read(self) -> Any:
+        """Данные из кэша — только для чтения, менять их можно внутри transaction()"""
+        self._refresh()
+        if self._cache is None:
+            self._cache = self._parse(self._raw)
+        return self._cache
+
+    def load(self) -> Any:
+        """Свежая копия данных: её можно менять и потом передать в save()"""
+        self._refresh()
+        data = self._parse(self._raw)
+        if isinstance(data, dict):
+            data = LoadedJson(data)
+            data.base_raw, data.base_signature = self._raw, self._signature
+        return data
+
+    def _write(self, data: Any, keep_cache: bool) -> None:
+        try:
+            count_json_save(self.path.name)
+            text = json.dumps(data, ensure_ascii=False, indent=self._indent)
+            write_text_atomic(self.path, text)
+        except Exception as e:
+            logger.error("Failed to write %s: %s", self.path.name, e)
+            self._cache = None
+            return
+        self._raw = text
+        self._cache = data if keep_cache else None
+        self._signature = _signature(self.path)
+
+    def save(self, data: Any) -> None:
+        """Записать данные, полученные из load(); чужие изменения с тех пор сохраняются"""
+        with file_lock(self.path):
+            if isinstance(data, LoadedJson):
+                base_raw, base_signature = data.base_raw, data.base_signature
+            else:
+                # Происхождение данных неизвестно — база та, что сейчас в кэше
+                base_raw, base_signature = self._raw, self._signature
+            self._refresh()
+            if self._signature != base_signature:
+                logger.debug("%s was changed since load(), merging", self.path.name)
+                merged = merge3(self._parse(base_raw), data, self._parse(self._raw))
+                if isinstance(data, dict) and isinstance(merged, dict):
+                    # Вызывающий может сохранить тот же объект ещё раз — пусть он совпадает с файлом
+                    data.clear()
+                    data.update(merged)
+                else:
+                    data = merged
+            self._write(data, keep_cache=False)
+            if isinstance(data, LoadedJson) and self._raw is not None:
+                data.base_raw, data.base_signature = self._raw, self._signature
+
+    @contextmanager
+    def transaction(self) -> Iterator[Any]:
+        """with file.transaction() as data: ... — изменения data запишутся при выходе без исключения"""
+        with file_lock(self.path):
+            data = self.read()
+            try:
+                yield data
+            except BaseException:
+                # Изменения не записаны — кэш перечитаем с диска
+                self._cache = None
+                raise
+            self._write(data, keep_cache=True)
+
+
+_store_file = SharedJsonFile(STORE_FILE, dict)
+_marriage_file = SharedJsonFile(MARRIAGE_FILE, lambda: {"proposals": {}, "marriages": []})
+_admins_file = SharedJsonFile(ADMINS_FILE, dict)
+_cooldowns_file = SharedJsonFile(COOLDOWNS_FILE, dict)
+
 
 def load_store() -> Dict[str, dict]:
     # загружаем подписки
-    if not STORE_FILE.exists():
-        return {}
-    try:
-        with open(STORE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f) or {}
-    except Exception as e:
-        logger.error("Failed to read store: %s", e)
-        return {}
+    return _store_file.load()
 
 
 def save_store(data: Dict[str, dict]) -> None:
     # Сохраняем подпискм
-    try:
-        with open(STORE_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error("Failed to write store: %s", e)
+    _store_file.save(data)
 
 
 def load_marriage() -> Dict[str, Any]:
     # браки
-    if not MARRIAGE_FILE.exists():
-        return {"proposals": {}, "marriages": []}
-    try:
-        with open(MARRIAGE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f) or {"proposals": {}, "marriages": []}
-    except Exception as e:
-        logger.error("Failed to read marriage store: %s", e)
-        return {"proposals": {}, "marriages": []}
+    return _marriage_file.load()
 
 
 def save_marriage(data: Dict[str, Any]) -> None:
     # браки
-    try:
-        with open(MARRIAGE_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error("Failed to write marriage store: %s", e)
+    _marriage_file.save(data)
+
+
+def read_marriage() -> Dict[str, Any]:
+    """Браки из кэша, только для чтения (файл перечитывается, лишь если сменился)"""
+    return _marriage_file.read()
+
+
+def marriage_version() -> int:
+    """Растёт, когда marriages.json перечитан с диска (например, после записи другим шардом)"""
+    _marriage_file.read()
+    return _marriage_file.version
 
 
 def load_admins() -> Dict[str, Any]:
     # админы
-    import os
-    data = {"owner_id": 0, "admins": [], "custom_commands": {}}
-    if ADMINS_FILE.exists():
-        try:
-            with open(ADMINS_FILE, "r", encoding="utf-8") as f:
-                loaded = json.load(f)
-                data.update(loaded or {})
-        except Exception as e:
-            logger.error("Failed to read admins store: %s", e)
+    data = _admins_file.load()
+    data.setdefault("owner_id", 0)
     if not data.get("owner_id"):
         owner_env = os.environ.get("BOT_OWNER_ID")
         if owner_env and owner_env.isdigit():
@@ -72,48 +268,117 @@ def load_admins() -> Dict[str, Any]:
 
 def save_admins(data: Dict[str, Any]) -> None:
     # сохраняем админов
-    try:
-        with open(ADMINS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error("Failed to write admins store: %s", e)
+    _admins_file.save(data)
 
 
 def load_cooldowns() -> Dict[str, Dict[str, float]]:
-    if not COOLDOWNS_FILE.exists():
-        return {}
-    try:
-        with open(COOLDOWNS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f) or {}
-    except Exception as e:
-        logger.error("Failed to read cooldowns: %s", e)
-        return {}
+    return _cooldowns_file.load()
 
 
 def save_cooldowns(data: Dict[str, Dict[str, float]]) -> None:
-    try:
-        with open(COOLDOWNS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error("Failed to write cooldowns: %s", e)
+    _cooldowns_file.save(data)
 
 
 def check_cooldown(user_id: int, chat_id: int, command: str, cooldown_seconds: int) -> tuple[bool, int]:
     import time
-    
-    cooldowns = load_cooldowns()
+
     key = f"{user_id}_{chat_id}"
-    
-    if key not in cooldowns:
-        cooldowns[key] = {}
-    
     current_time = time.time()
-    last_used = cooldowns[key].get(command, 0)
-    
-    if current_time - last_used >= cooldown_seconds:
-        cooldowns[key][command] = current_time
-        save_cooldowns(cooldowns)
-        return True, 0
-    else:
+    last_used = _cooldowns_file.read().get(key, {}).get(command, 0)
+    if current_time - last_used < cooldown_seconds:
         remaining = int(cooldown_seconds - (current_time - last_used))
         return False, remaining
+
+    with _cooldowns_file.transaction() as cooldowns:
+        cooldowns.setdefault(key, {})[command] = current_time
+    return True, 0
+
+
+class BatchedJsonStore:
+    """JSON-файл, который держится в памяти и пишется на диск пачками.
+
+    Изменения помечаются через mark_dirty(), а запись делает flush() —
+    его периодически вызывает flush_batched_stores_job и один раз при остановке бота.
+    Если файл тем временем переписал другой процесс (шард), flush() сливает его
+    изменения с нашими и увеличивает version — по ней модули перестраивают индексы.
+    """
+
+    def __init__(self, path: Path, default_factory: Callable[[], Any]):
+        self.path = path
+        self._default_factory = default_factory
+        self._data: Optional[Any] = None
+        self._dirty = False
+        # Текст файла, от которого отсчитываются наши изменения, и его подпись
+        self._base_raw: Optional[str] = None
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self.version = 0
+        _batched_stores.append(self)
+
+    @property
+    def data(self) -> Any:
+        if self._data is None:
+            self._data = self._load()
+        return self._data
+
+    def _parse(self, raw: Optional[str]) -> Any:
+        if raw is None:
+            return self._default_factory()
+        try:
+            count_json_load(self.path.name)
+            return json.loads(raw) or self._default_factory()
+        except Exception as e:
+            logger.error("Failed to read %s: %s", self.path.name, e)
+            return self._default_factory()
+
+    def _read_raw(self) -> None:
+        self._signature = _signature(self.path)
+        try:
+            self._base_raw = self.path.read_text(encoding="utf-8") if self._signature else None
+        except FileNotFoundError:
+            self._base_raw, self._signature = None, None
+
+    def _load(self) -> Any:
+        self._read_raw()
+        return self._parse(self._base_raw)
+
+    def mark_dirty(self) -> None:
+        self._dirty = True
+
+    def flush(self) -> bool:
+        """Записать файл, если были изменения. Возвращает True, если запись была"""
+        if self._data is None:
+            return False
+        with file_lock(self.path):
+            if _signature(self.path) != self._signature:
+                base = self._parse(self._base_raw)
+                self._read_raw()
+                theirs = self._parse(self._base_raw)
+                self._data = merge3(base, self._data, theirs) if self._dirty else theirs
+                self.version += 1
+            if not self._dirty:
+                return False
+            try:
+                count_json_save(self.path.name)
+                text = json.dumps(self._data, ensure_ascii=False, separators=(",", ":"))
+                write_text_atomic(self.path, text)
+            except Exception as e:
+                logger.error("Failed to write %s: %s", self.path.name, e)
+                return False
+            self._base_raw = text
+            self._signature = _signature(self.path)
+        self._dirty = False
+        return True
+
+
+_batched_stores: List[BatchedJsonStore] = []
+
+
+def flush_batched_stores() -> int:
+    """Сбросить на диск все изменённые хранилища. Возвращает число записанных файлов"""
+    return sum(1 for store in _batched_stores if store.flush())
+
+
+async def flush_batched_stores_job(context) -> None:
+    flushed = flush_batched_stores()
+    if flushed:
+        logger.debug("Flushed %d batched stores", flushed)
@@ -1,52 +1,72 @@
 """Система топов пользователей."""
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from telegram.constants import ParseMode
+from telegram.constants import ParseMode, ChatType
 
-from economy import load_economy, format_balance
+from economy import format_balance
 from blackjack import get_blackjack_leaderboard
 from utils import safe_html, profile_link_html
+from chat_members import get_chat_members
+import leaderboards
+from callbacks import instant_callback
 
 logger = logging.getLogger(__name__)
 
+TOP_LIMIT = 10  # Сколько мест показывать в топе
 
-def get_balance_leaderboard() -> List[Dict[str, Any]]:
-    """Возвращает топ пользователей по балансу."""
-    data = load_economy()
-    balances = data.get("balances", {})
-    usernames = data.get("usernames", {})
+# Кэш отрисованных топов: (вид топа, чат) -> (снимок топ-10, HTML)
+_rendered_tops: Dict[Tuple[str, Optional[int]], Tuple[tuple, str]] = {}
+
+
+def get_balance_leaderboard(chat_id: Optional[int] = None, limit: int = TOP_LIMIT) -> List[Dict[str, Any]]:
+    """Возвращает топ пользователей по балансу (среди участников чата, если он указан)."""
+    board = leaderboards.get_balance_board()
+    top_ids = board.top(limit) if chat_id is None else board.top_among(get_chat_members(chat_id), limit)
     
     players = []
-    for user_id_str, balance in balances.items():
-        if balance <= 0:  # Пропускаем пользователей с нулевым или отрицательным балансом
-            continue
-            
-        user_id = int(user_id_str)
-        
+    for user_id in top_ids:
         # Ищем имя пользователя
-        user_name = f"Пользователь {user_id}"
-        username = None
-        for uname, uid in usernames.items():
-            if uid == user_id:
-                user_name = f"@{uname}"
-                username = uname
-                break
+        username = leaderboards.get_cached_username(user_id)
+        user_name = f"@{username}" if username else f"Пользователь {user_id}"
         
         players.append({
             "user_id": user_id,
             "name": user_name,
             "username": username,
-            "balance": balance
+            "balance": leaderboards.get_cached_balance(user_id)
         })
     
-    # Сортируем по балансу (убывание)
-    players.sort(key=lambda x: -x["balance"])
-    
     return players
 
 
+def _render_cached(kind: str, chat_id: Optional[int], players: List[Dict[str, Any]], formatter) -> str:
+    """Отрисовать топ, переиспользуя HTML, пока топ-10 не изменился."""
+    snapshot = tuple(tuple(player.values()) for player in players)
+    cached = _rendered_tops.get((kind, chat_id))
+    if cached and cached[0] == snapshot:
+        return cached[1]
+    message = formatter(players)
+    _rendered_tops[(kind, chat_id)] = (snapshot, message)
+    return message
+
+
+def render_balance_top(chat_id: Optional[int] = None) -> str:
+    return _render_cached("balance", chat_id, get_balance_leaderboard(chat_id), format_balance_top)
+
+
+def render_blackjack_top(chat_id: Optional[int] = None) -> str:
+    return _render_cached("blackjack", chat_id, get_blackjack_leaderboard(TOP_LIMIT, chat_id), format_blackjack_top)
+
+
+def get_top_chat_id(chat) -> Optional[int]:
+    """Чат, участников которого ранжируем. В личке показываем общий топ"""
+    if chat and chat.type in (ChatType.GROUP, ChatType.SUPERGROUP):
+        return chat.id
+    return None
+
+
 def format_balance_top(players: List[Dict[str, Any]]) -> str:
     """Форматирует топ по балансу."""
     if not players:
@@ -54,7 +74,7 @@ def format_balance_top(players: List[Dict[str, Any]]) -> str:
     
     message = "📊 <b>ТОП ПО БАЛАНСУ</b>\n\n"
     
-    for i, player in enumerate(players[:10], 1):  # Показываем топ-10
+    for i, player in enumerate(players[:TOP_LIMIT], 1):  # Показываем топ-10
         medal = ""
         if i == 1:
             medal = "🥇"
@@ -79,7 +99,7 @@ def format_blackjack_top(players: List[Dict[str, Any]]) -> str:
     
     message = "🎰 <b>ТОП ПО БЛЕКДЖЕКУ</b>\n\n"
     
-    for i, player in enumerate(players[:10], 1):  # Показываем топ-10
+    for i, player in enumerate(players[:TOP_LIMIT], 1):  # Показываем топ-10
         medal = ""
         if i == 1:
             medal = "🥇"
@@ -112,9 +132,8 @@ async def cmd_top(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not update.message:
         return
     
-    # Получаем топ по балансу
-    balance_players = get_balance_leaderboard()
-    message = format_balance_top(balance_players)
+    # Получаем топ по балансу среди участников чата
+    message = render_balance_top(get_top_chat_id(update.effective_chat))
     
     # Создаем кнопку для переключения на блекджек
     keyboard = InlineKeyboardMarkup([
@@ -130,20 +149,17 @@ async def cmd_top(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+@instant_callback()
 async def cb_top_switch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработчик переключения между топами."""
     query = update.callback_query
-    if not query or not query.data:
-        return
-    
-    await query.answer()
     
     switch_to = query.data.split(":", 1)[1]
+    chat_id = get_top_chat_id(query.message.chat if query.message else None)
     
     if switch_to == "blackjack":
         # Переключаемся на топ по блекджеку
-        blackjack_players = get_blackjack_leaderboard()
-        message = format_blackjack_top(blackjack_players)
+        message = render_blackjack_top(chat_id)
         
         keyboard = InlineKeyboardMarkup([
             [InlineKeyboardButton("💰 По монетам", callback_data="top_switch:balance")]
@@ -151,8 +167,7 @@ async def cb_top_switch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     
     elif switch_to == "balance":
         # Переключаемся на топ по балансу
-        balance_players = get_balance_leaderboard()
-        message = format_balance_top(balance_players)
+        message = render_balance_top(chat_id)
         
         keyboard = InlineKeyboardMarkup([
             [InlineKeyboardButton("🎰 BlackJack", callback_data="top_switch:blackjack")]
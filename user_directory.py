@@ -0,0 +1,159 @@
+"""Справочник пользователей: id ↔ username ↔ имя и чаты, где пользователь был замечен."""
+import logging
+import time
+from typing import Dict, Optional
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from config import USERS_FILE
+from storage import BatchedJsonStore
+
+logger = logging.getLogger(__name__)
+
+# Как часто обновлять отметку «последний раз видели в чате» (в секундах)
+LAST_SEEN_RESOLUTION = 3600
+
+# На диске: {"users": {"user_id": {"username": str|None, "name": str|None, "chats": {"chat_id": ts}}},
+#            "economy_usernames_migrated": true}
+_store = BatchedJsonStore(USERS_FILE, lambda: {"users": {}})
+# username в нижнем регистре -> user_id
+_by_username: Dict[str, int] = {}
+# Версия _store, по которой построен индекс (None — ещё не строили)
+_indexed_version: Optional[int] = None
+
+
+class KnownUser:
+    """Пользователь из справочника (совместим с местами, где ожидается telegram.User)"""
+
+    is_bot = False
+
+    def __init__(self, user_id: int, username: Optional[str], name: Optional[str]):
+        self.id = user_id
+        self.username = username
+        self.first_name = name or (f"@{username}" if username else f"User {user_id}")
+        self.full_name = self.first_name
+
+
+def _users() -> Dict[str, dict]:
+    _ensure_loaded()
+    return _store.data["users"]
+
+
+def _ensure_loaded() -> None:
+    global _indexed_version
+    if _indexed_version == _store.version:
+        return
+    first_load = _indexed_version is None
+    users = _store.data.setdefault("users", {})
+    _indexed_version = _store.version
+    # Индекс строится заново и после того, как flush() подтянул записи других шардов
+    _by_username.clear()
+    for user_id_str, entry in users.items():
+        if entry.get("username"):
+            _by_username[entry["username"].lower()] = int(user_id_str)
+    if not first_load:
+        return
+
+    # Переносим usernames, которые раньше копились в economy.json — один раз: старый список
+    # не обновляется, и повторный перенос вернул бы людям их прежние username
+    if _store.data.get("economy_usernames_migrated"):
+        return
+    from economy import load_economy
+    for username, user_id in load_economy().get("usernames", {}).items():
+        entry = users.get(str(user_id))
+        if username.lower() not in _by_username and not (entry and entry.get("username")):
+            _set_username(user_id, username)
+    _store.data["economy_usernames_migrated"] = True
+    _store.mark_dirty()
+
+
+def _set_username(user_id: int, username: Optional[str]) -> bool:
+    users = _store.data["users"]
+    entry = users.setdefault(str(user_id), {"username": None, "name": None, "chats": {}})
+    if entry.get("username") == username:
+        return False
+    if entry.get("username"):
+        _by_username.pop(entry["username"].lower(), None)
+    if username:
+        # Username мог перейти от другого пользователя
+        previous_owner = _by_username.get(username.lower())
+        if previous_owner is not None and previous_owner != user_id:
+            users.get(str(previous_owner), {})["username"] = None
+        _by_username[username.lower()] = user_id
+    entry["username"] = username
+    _store.mark_dirty()
+    return True
+
+
+def remember_user(user_id: int, username: Optional[str] = None, name: Optional[str] = None,
+                  chat_id: Optional[int] = None) -> None:
+    """Обновить справочник. Файл помечается изменённым, только если что-то поменялось"""
+    users = _users()
+    if username is not None:
+        _set_username(user_id, username.lstrip("@") or None)
+    entry = users.setdefault(str(user_id), {"username": None, "name": None, "chats": {}})
+    if name and entry.get("name") != name:
+        entry["name"] = name
+        _store.mark_dirty()
+    if chat_id is not None:
+        chats = entry.setdefault("chats", {})
+        now = time.time()
+        if now - chats.get(str(chat_id), 0) >= LAST_SEEN_RESOLUTION:
+            chats[str(chat_id)] = int(now)
+            _store.mark_dirty()
+
+
+def remember_telegram_user(user, chat_id: Optional[int] = None) -> None:
+    if user is None or getattr(user, "is_bot", False) or not getattr(user, "id", None):
+        return
+    remember_user(user.id, user.username or "", user.full_name, chat_id)
+
+
+def resolve_username(username: str) -> Optional[int]:
+    """ID по username (с @ или без)"""
+    _ensure_loaded()
+    return _by_username.get(username.lstrip("@").lower())
+
+
+def get_username(user_id: int) -> Optional[str]:
+    entry = _users().get(str(user_id))
+    return entry.get("username") if entry else None
+
+
+def get_display_name(user_id: int) -> Optional[str]:
+    entry = _users().get(str(user_id))
+    return entry.get("name") if entry else None
+
+
+def get_user_chats(user_id: int) -> Dict[int, int]:
+    """Чаты пользователя: chat_id -> когда последний раз видели"""
+    entry = _users().get(str(user_id))
+    if not entry:
+        return {}
+    return {int(chat_id): ts for chat_id, ts in entry.get("chats", {}).items()}
+
+
+def get_known_user(username: str) -> Optional[KnownUser]:
+    """Пользователь по username, если он уже встречался боту"""
+    user_id = resolve_username(username)
+    if user_id is None:
+        return None
+    entry = _users().get(str(user_id), {})
+    return KnownUser(user_id, entry.get("username"), entry.get("name"))
+
+
+async def track_user_directory(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Пополняет справочник из всех входящих обновлений"""
+    chat_id = update.effective_chat.id if update.effective_chat else None
+    remember_telegram_user(update.effective_user, chat_id)
+
+    message = update.message
+    if not message:
+        return
+    if message.reply_to_message:
+        remember_telegram_user(message.reply_to_message.from_user, chat_id)
+    for member in message.new_chat_members or ():
+        remember_telegram_user(member, chat_id)
+    for entity in message.entities or ():
+        if entity.type == "text_mention" and entity.user:
+            remember_telegram_user(entity.user)
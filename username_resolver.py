@@ -0,0 +1,128 @@
+"""Поиск пользователей по @username с кэшем и без повторных запросов к API."""
+import asyncio
+import logging
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+from telegram.constants import ChatType
+
+import user_directory
+
+logger = logging.getLogger(__name__)
+
+# Сколько помнить найденных и ненайденных пользователей (в секундах)
+POSITIVE_TTL = 3600
+NEGATIVE_TTL = 300
+# При превышении размера кэша из него выбрасываются просроченные записи
+MAX_CACHE_SIZE = 5000
+
+
+class ResolvedUser(NamedTuple):
+    user_id: int
+    name: Optional[str]
+
+
+# Ключ — (username в нижнем регистре, chat_id): get_chat_member зависит от чата
+_CacheKey = Tuple[str, Optional[int]]
+
+_positive: Dict[str, Tuple[float, ResolvedUser]] = {}
+_negative: Dict[_CacheKey, Tuple[float, None]] = {}
+_inflight: Dict[_CacheKey, "asyncio.Task[Optional[ResolvedUser]]"] = {}
+
+
+def _prune(cache: dict, now: float) -> None:
+    if len(cache) <= MAX_CACHE_SIZE:
+        return
+    for key in [key for key, (expires, _) in cache.items() if expires <= now]:
+        del cache[key]
+
+
+def _lookup_cached(username: str, key: _CacheKey, now: float) -> Tuple[bool, Optional[ResolvedUser]]:
+    """(найдено в кэше, результат)"""
+    cached = _positive.get(username)
+    if cached and cached[0] > now:
+        return True, cached[1]
+
+    user_id = user_directory.resolve_username(username)
+    if user_id:
+        return True, ResolvedUser(user_id, user_directory.get_display_name(user_id))
+
+    cached = _negative.get(key)
+    if cached and cached[0] > now:
+        return True, None
+    return False, None
+
+
+async def _fetch(bot, username: str, chat_id: Optional[int]) -> Optional[ResolvedUser]:
+    # Способ 1: get_chat (работает если пользователь взаимодействовал с ботом)
+    try:
+        chat = await bot.get_chat(f"@{username}")
+        if chat and chat.id:
+            user_directory.remember_user(chat.id, username=chat.username or username,
+                                         name=chat.full_name or chat.first_name)
+            return ResolvedUser(chat.id, chat.first_name)
+    except Exception:
+        pass
+
+    # Способ 2: get_chat_member в групповом чате
+    if chat_id is not None:
+        try:
+            member = await bot.get_chat_member(chat_id, f"@{username}")
+            if member and member.user:
+                user_directory.remember_telegram_user(member.user, chat_id)
+                return ResolvedUser(member.user.id, member.user.first_name)
+        except Exception:
+            pass
+    return None
+
+
+async def resolve_username(bot, username: str, chat_id: Optional[int] = None) -> Optional[ResolvedUser]:
+    """Найти пользователя по username. chat_id — группа, в которой можно искать через get_chat_member"""
+    username = username.lstrip("@").lower()
+    if not username:
+        return None
+    key = (username, chat_id)
+    now = time.monotonic()
+
+    found, result = _lookup_cached(username, key, now)
+    if found:
+        return result
+
+    # Одинаковые запросы, пришедшие одновременно, ждут один и тот же поиск
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch(bot, username, chat_id))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    result = await asyncio.shield(task)
+
+    now = time.monotonic()
+    if result:
+        _positive[username] = (now + POSITIVE_TTL, result)
+        _prune(_positive, now)
+    else:
+        _negative[key] = (now + NEGATIVE_TTL, None)
+        _prune(_negative, now)
+    return result
+
+
+async def resolve_message_target(message, bot) -> Tuple[Optional[int], Optional[str], Optional[str]]:
+    """Цель команды: ответ на сообщение, текстовое упоминание или @username.
+
+    Возвращает (user_id, имя, username). Если @username найти не удалось — user_id=None, а username заполнен.
+    """
+    if message.reply_to_message and message.reply_to_message.from_user:
+        user = message.reply_to_message.from_user
+        return user.id, user.first_name or user.username or f"Пользователь {user.id}", user.username
+
+    for entity in message.entities or ():
+        if entity.type == "text_mention" and entity.user:
+            user = entity.user
+            return user.id, user.first_name or user.username or f"Пользователь {user.id}", user.username
+        if entity.type == "mention":
+            username = (message.text or "")[entity.offset + 1: entity.offset + entity.length]
+            chat_id = message.chat.id if message.chat.type in (ChatType.GROUP, ChatType.SUPERGROUP) else None
+            resolved = await resolve_username(bot, username, chat_id)
+            if resolved:
+                return resolved.user_id, resolved.name or f"@{username}", username
+            return None, f"@{username}", username
+    return None, None, None
@@ -2,6 +2,8 @@ import re
 from datetime import datetime
 from typing import Optional
 
+from user_directory import get_known_user
+
 
 def safe_html(text: str) -> str:
     return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
@@ -79,6 +81,9 @@ def get_target_user(message, args):
                 if username.startswith('@'):
                     username = username[1:]  
                 
+                known = get_known_user(username)
+                if known:
+                    return known
     
                 class UserStub:
                     def __init__(self, username):
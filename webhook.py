@@ -0,0 +1,219 @@
+"""Приём обновлений через вебхук: встроенный HTTP-сервер на asyncio вместо long polling.
+
+Telegram присылает POST с JSON обновления и заголовком X-Telegram-Bot-Api-Secret-Token.
+Сервер сверяет секрет, кладёт Update в app.update_queue и сразу отвечает 200 — дальше
+обновление обрабатывается так же, как при polling. Режим включается UPDATE_MODE=webhook.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+import signal
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.constants import UpdateType
+from telegram.ext import (
+    Application,
+    CallbackQueryHandler,
+    ChatJoinRequestHandler,
+    ChatMemberHandler,
+    ChosenInlineResultHandler,
+    CommandHandler,
+    InlineQueryHandler,
+    MessageHandler,
+    PollAnswerHandler,
+    PollHandler,
+    PreCheckoutQueryHandler,
+    ShippingQueryHandler,
+    TypeHandler,
+)
+
+from config import (
+    WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS,
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+# Обновление больше мегабайта от Telegram не приходит — это кто-то другой
+MAX_BODY = 1 << 20
+# Telegram держит соединения открытыми; простаивающее закрываем через столько секунд
+KEEPALIVE_TIMEOUT = 60
+
+# Команды и сообщения подписываются только на новые сообщения: правки, посты каналов и т.п.
+# обработчики бота не ждут, а MessageHandler иначе сработал бы и на них
+HANDLER_UPDATES = {
+    CommandHandler: [UpdateType.MESSAGE],
+    MessageHandler: [UpdateType.MESSAGE],
+    CallbackQueryHandler: [UpdateType.CALLBACK_QUERY],
+    InlineQueryHandler: [UpdateType.INLINE_QUERY],
+    ChosenInlineResultHandler: [UpdateType.CHOSEN_INLINE_RESULT],
+    PollHandler: [UpdateType.POLL],
+    PollAnswerHandler: [UpdateType.POLL_ANSWER],
+    ChatJoinRequestHandler: [UpdateType.CHAT_JOIN_REQUEST],
+    PreCheckoutQueryHandler: [UpdateType.PRE_CHECKOUT_QUERY],
+    ShippingQueryHandler: [UpdateType.SHIPPING_QUERY],
+}
+CHAT_MEMBER_UPDATES = {
+    ChatMemberHandler.MY_CHAT_MEMBER: [UpdateType.MY_CHAT_MEMBER],
+    ChatMemberHandler.CHAT_MEMBER: [UpdateType.CHAT_MEMBER],
+    ChatMemberHandler.ANY_CHAT_MEMBER: [UpdateType.MY_CHAT_MEMBER, UpdateType.CHAT_MEMBER],
+}
+
+# Ответы сервера: accepted, forbidden, bad_request, not_found, not_allowed, too_large
+webhook_requests: Counter = Counter()
+
+
+def allowed_updates_for(app: Application) -> List[str]:
+    """Типы обновлений, которые хоть кто-то из обработчиков обрабатывает.
+
+    TypeHandler (антиспам, справочники, запись трафика) только наблюдают за тем, что пришло,
+    и подписку не расширяют. Незнакомый тип обработчика — подписка на всё.
+    """
+    kinds = set()
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, TypeHandler):
+                continue
+            if isinstance(handler, ChatMemberHandler):
+                kinds.update(CHAT_MEMBER_UPDATES[handler.chat_member_types])
+                continue
+            for handler_type, update_types in HANDLER_UPDATES.items():
+                if isinstance(handler, handler_type):
+                    kinds.update(update_types)
+                    break
+            else:
+                logger.warning("Unknown handler %s, subscribing to all update types", type(handler).__name__)
+                return list(Update.ALL_TYPES)
+    return sorted(str(kind) for kind in kinds)
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str]]]:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=KEEPALIVE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    parts = request_line.decode("latin-1").split()
+    if len(parts) < 2:
+        return None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return parts[0], parts[1], headers
+
+
+def _check(app: Application, method: str, target: str, headers: Dict[str, str],
+           body: bytes, path: str, secret: bytes) -> str:
+    if target.split("?", 1)[0] != path:
+        webhook_requests["not_found"] += 1
+        return "404 Not Found"
+    if method != "POST":
+        webhook_requests["not_allowed"] += 1
+        return "405 Method Not Allowed"
+    if not hmac.compare_digest(headers.get(SECRET_HEADER, "").encode(), secret):
+        webhook_requests["forbidden"] += 1
+        return "403 Forbidden"
+    try:
+        update = Update.de_json(json.loads(body), app.bot)
+    except Exception as e:
+        logger.debug("Bad webhook payload: %s", e)
+        webhook_requests["bad_request"] += 1
+        return "400 Bad Request"
+    # Обработка — в общей очереди приложения; Telegram ждёт только подтверждения
+    app.update_queue.put_nowait(update)
+    webhook_requests["accepted"] += 1
+    return "200 OK"
+
+
+async def _serve(app: Application, path: str, secret: bytes,
+                 reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            request = await _read_request(reader)
+            if request is None:
+                break
+            method, target, headers = request
+            length = int(headers.get("content-length") or 0)
+            if length > MAX_BODY:
+                webhook_requests["too_large"] += 1
+                writer.write(b"HTTP/1.1 413 Payload Too Large\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                break
+            body = await reader.readexactly(length)
+            status = _check(app, method, target, headers, body, path, secret)
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Length: 0\r\n\r\n".encode())
+            await writer.drain()
+            if headers.get("connection", "").lower() == "close":
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    except Exception:
+        logger.exception("Webhook connection failed")
+    finally:
+        writer.close()
+
+
+async def start_webhook(app: Application, allowed_updates: List[str], *, listen: str = WEBHOOK_LISTEN,
+                        port: int = WEBHOOK_PORT, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET,
+                        url: str = WEBHOOK_URL) -> asyncio.AbstractServer:
+    """Поднять сервер и, если задан url, зарегистрировать вебхук в Telegram (приложение уже initialize)"""
+    if not secret:
+        if not url:
+            raise RuntimeError("WEBHOOK_SECRET is required when WEBHOOK_URL is not set.")
+        # Вебхук регистрируем сами, так что секрет можно придумать при запуске
+        secret = secrets.token_urlsafe(32)
+    server = await asyncio.start_server(
+        lambda reader, writer: _serve(app, path, secret.encode(), reader, writer), listen, port
+    )
+    bound = server.sockets[0].getsockname()
+    logger.info("Webhook server on http://%s:%d%s", bound[0], bound[1], path)
+    if url:
+        await app.bot.set_webhook(
+            url, secret_token=secret, allowed_updates=allowed_updates, max_connections=WEBHOOK_MAX_CONNECTIONS,
+        )
+        logger.info("Webhook registered at %s for %s", url, ", ".join(allowed_updates))
+    return server
+
+
+async def serve_application(app: Application,
+                            start_server: Callable[[Application], Awaitable[asyncio.AbstractServer]]) -> None:
+    """Жизненный цикл приложения без Updater до SIGINT/SIGTERM: обновления в app.update_queue
+    кладёт сервер из start_server (вебхук, воркер шарда)"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    # Тот же порядок, что в app.run_polling: initialize, post_init, start ... stop, shutdown
+    await app.initialize()
+    server = None
+    try:
+        if app.post_init:
+            await app.post_init(app)
+        server = await start_server(app)
+        await app.start()
+        await stop.wait()
+    finally:
+        if server is not None:
+            server.close()
+        if app.running:
+            await app.stop()
+            if app.post_stop:
+                await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+
+def run_webhook(app: Application, allowed_updates: List[str]) -> None:
+    """Замена app.run_polling: принимать обновления вебхуком до SIGINT/SIGTERM"""
+    asyncio.run(serve_application(app, lambda app: start_webhook(app, allowed_updates)))
@@ -7,8 +7,10 @@ from telegram.constants import ParseMode, ChatType
 from telegram.ext import ContextTypes
 
 from storage import load_cooldowns, save_cooldowns
+from reaper import schedule_delete
 from economy import add_user_balance, get_slave_owner
 from utils import safe_html
+from callbacks import instant_callback, answer_callback, SERIALIZE_REPEATS
 
 logger = logging.getLogger(__name__)
 
@@ -149,9 +151,9 @@ def schedule_reward(user_id: int, chat_id: int, reward: int, context: ContextTyp
                         parse_mode=ParseMode.HTML
                     )
                 except Exception as e:
-                    logger.warning(f"Failed to notify slave owner {owner_id}: {e}")
+                    logger.warning("Failed to notify slave owner %s: %s", owner_id, e)
                 
-                logger.info(f"Work reward paid: {slave_reward} coins to slave {user_id}, {slave_tax} coins to owner {owner_id} in chat {chat_id}")
+                logger.info("Work reward paid: %s coins to slave %s, %s coins to owner %s in chat %s", slave_reward, user_id, slave_tax, owner_id, chat_id)
             else:
                 # Обычный свободный работник
                 add_user_balance(user_id, reward)
@@ -163,10 +165,10 @@ def schedule_reward(user_id: int, chat_id: int, reward: int, context: ContextTyp
                     f"⏰ <b>За работу час назад</b>",
                     parse_mode=ParseMode.HTML
                 )
-                logger.info(f"Work reward paid: {reward} coins to user {user_id} in chat {chat_id}")
+                logger.info("Work reward paid: %s coins to user %s in chat %s", reward, user_id, chat_id)
                 
         except Exception as e:
-            logger.error(f"Failed to pay work reward: {e}")
+            logger.error("Failed to pay work reward: %s", e)
     
     context.job_queue.run_once(pay_reward, REWARD_DELAY)
 
@@ -204,12 +206,6 @@ async def cmd_work(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Проверяем кулдаун
     remaining_time = check_work_cooldown(user.id, chat_id)
     if remaining_time is not None:
-        # Удаляем сообщение пользователя
-        try:
-            await message.delete()
-        except Exception as e:
-            logger.warning("Failed to delete user message: %s", e)
-        
         # Отправляем предупреждение
         warning_msg = await context.bot.send_message(
             chat_id,
@@ -219,14 +215,8 @@ async def cmd_work(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             parse_mode=ParseMode.HTML
         )
         
-        # Удаляем предупреждение через 3 секунды
-        async def delete_warning(context):
-            try:
-                await context.bot.delete_message(chat_id, warning_msg.message_id)
-            except Exception as e:
-                logger.warning("Failed to delete warning message: %s", e)
-        
-        context.job_queue.run_once(delete_warning, 3)
+        # Команду и предупреждение удаляем вместе через 3 секунды
+        schedule_delete(chat_id, message.message_id, warning_msg.message_id)
         return
     
     # Устанавливаем кулдаун и начинаем рабочую сессию
@@ -272,26 +262,31 @@ async def cmd_work(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         user.first_name, user.id, chat_id
     )
 
+def _parse_work_click(data: str) -> Optional[int]:
+    try:
+        _, user_id_str = data.split(":")
+        return int(user_id_str)
+    except ValueError:
+        return None
+
+
+def precheck_work_click(update: Update) -> Optional[str]:
+    """Проверки без чтения файлов: формат кнопки и её владелец"""
+    query = update.callback_query
+    user_id = _parse_work_click(query.data)
+    if user_id is None:
+        return "❌ Ошибка обработки команды."
+    if query.from_user.id != user_id:
+        return "🚫 Это не ваша работа!"
+    return None
+
+
+# Каждое нажатие считается, поэтому повторы обрабатываются по очереди, а не отбрасываются
+@instant_callback(precheck_work_click, repeats=SERIALIZE_REPEATS)
 async def cb_work_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка нажатий кнопки работы"""
     query = update.callback_query
-    if not query or not query.data:
-        return
-    
-    await query.answer()
-    
-    # Парсим данные callback
-    try:
-        _, user_id_str = query.data.split(":")
-        user_id = int(user_id_str)
-    except (ValueError, IndexError):
-        await query.edit_message_text("❌ Ошибка обработки команды.")
-        return
-    
-    # Проверяем, что кнопку нажал тот же пользователь
-    if query.from_user.id != user_id:
-        await query.answer("🚫 Это не ваша работа!", show_alert=True)
-        return
+    user_id = _parse_work_click(query.data)
     
     chat_id = query.message.chat.id
     user = query.from_user
@@ -300,7 +295,7 @@ async def cb_work_click(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     session = add_work_click(user_id, chat_id)
     
     if not session.get("active", False):
-        await query.answer("⏰ Рабочая смена уже завершена!", show_alert=True)
+        await answer_callback(query, "⏰ Рабочая смена уже завершена!", show_alert=True)
         return
     
     clicks = session.get("clicks", 0)